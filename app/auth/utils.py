@@ -0,0 +1,88 @@
+# app/auth/utils.py
+import os
+from collections import namedtuple
+
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal, DB_ASYNC, async_session
+from app.models import User
+from app.services.query_cache import TTLCache
+
+# ========= CONFIG =========
+USER_CACHE_TTL_S = float(os.getenv("USER_CACHE_TTL_S", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# ==========================
+
+# What request handlers need of a user; plain values, usable after the session is closed
+CachedUser = namedtuple("CachedUser", ["user_id", "email"])
+
+# ("id", user_id) / ("email", email) → CachedUser. Users are never renamed or
+# deleted, so entries only expire; unknown users are not cached.
+_users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_S)
+
+
+def _user_key(user_id=None, email=None):
+    if email is not None:
+        return ("email", email)
+    try:
+        return ("id", int(user_id))
+    except (TypeError, ValueError):
+        return None  # missing or malformed cookie
+
+
+def _query(user_id=None, email=None):
+    column, value = (User.email, email) if email is not None else (User.user_id, int(user_id))
+    return select(User.user_id, User.email).where(column == value)
+
+
+def _remember(row) -> CachedUser:
+    user = CachedUser(row.user_id, row.email)
+    _users.put(("id", user.user_id), user)
+    _users.put(("email", user.email), user)
+    return user
+
+
+def get_user(user_id=None, email=None, db=None):
+    """
+    The user with this id (e.g. the user_id cookie) or email, or None.
+    Cached for USER_CACHE_TTL_S; on a miss db is queried (a short-lived
+    session of its own if db is None).
+    """
+    key = _user_key(user_id, email)
+    if key is None:
+        return None
+    user = _users.get(key)
+    if user is not None:
+        return user
+
+    return _load(user_id, email, db)
+
+
+def _load(user_id=None, email=None, db=None):
+    if db is not None:
+        row = db.execute(_query(user_id, email)).first()
+    else:
+        with SessionLocal() as session:
+            row = session.execute(_query(user_id, email)).first()
+    return _remember(row) if row else None
+
+
+async def get_user_async(user_id=None, email=None):
+    """get_user for async endpoints: a miss never blocks the event loop (aiosqlite if DB_ASYNC, else a worker thread)"""
+    key = _user_key(user_id, email)
+    if key is None:
+        return None
+    user = _users.get(key)
+    if user is not None:
+        return user
+
+    if not DB_ASYNC:
+        return await run_in_threadpool(_load, user_id, email)
+    async with async_session() as db:
+        row = (await db.execute(_query(user_id, email))).first()
+    return _remember(row) if row else None
+
+
+def get_user_cache_stats() -> dict:
+    return _users.stats()
@@ -0,0 +1,39 @@
+"""
+Inspect or garbage-collect the content-addressed embedding store.
+
+    python -m app.cli.embedding_store
+    python -m app.cli.embedding_store --gc
+
+--gc drops stored embeddings whose chunk text no live document has anymore
+(deleted documents, replaced revisions), plus the stores of models or
+backends no process has open. It can run while the server is up: the
+workers switch to the compacted store on their next lookup, and embeddings
+they add during the run are kept.
+"""
+import argparse
+import json
+import time
+
+from app.services import embedding_store, vectorstore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gc", action="store_true", help="remove entries no live chunk references")
+    args = parser.parse_args()
+
+    if embedding_store.get_store() is None:
+        parser.error(f"embedding store unavailable: {embedding_store.get_embedding_store_stats()['reason']}")
+
+    if args.gc:
+        start = time.perf_counter()
+        stats = embedding_store.collect_garbage(vectorstore.live_chunk_texts())
+        print(
+            f"Removed {stats['removed']} unreferenced embeddings, kept {stats['kept']} "
+            f"({stats['other_models_removed']} other model store(s) removed) in {time.perf_counter() - start:.1f}s"
+        )
+    print(json.dumps(embedding_store.get_embedding_store_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
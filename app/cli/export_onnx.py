@@ -0,0 +1,32 @@
+"""
+Export the embedding model to ONNX ahead of time (fp32 and dynamic int8).
+
+    python -m app.cli.export_onnx
+    python -m app.cli.export_onnx --fp32-only
+
+Then serve with EMBEDDING_BACKEND=onnx or EMBEDDING_BACKEND=onnx-int8. Without
+this step the first embedding call exports the model (this needs torch and
+sentence-transformers once); exported files are cached under EMBED_ONNX_DIR.
+"""
+import argparse
+import os
+import time
+
+from app.services import embedding, embedding_onnx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=embedding.MODEL_NAME)
+    parser.add_argument("--fp32-only", action="store_true", help="skip the int8 model")
+    args = parser.parse_args()
+
+    for quantize in (False,) if args.fp32_only else (False, True):
+        start = time.perf_counter()
+        path = embedding_onnx.export(args.model, quantize)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{path}: {size_mb:.1f} MB ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
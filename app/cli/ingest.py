@@ -0,0 +1,80 @@
+"""
+Load a corpus into the document store in bulk, or rebuild existing indexes.
+
+    python -m app.cli.ingest --dir corpus/                      # corpus/<email>/**/<files>
+    python -m app.cli.ingest --dir reports/ --email someone@example.com --glob "*.txt"
+    python -m app.cli.ingest --manifest files.jsonl             # {"email": ..., "path": ...} per line
+    python -m app.cli.ingest --reindex                          # every store under data/vectordb/
+    python -m app.cli.ingest --reindex --emails someone@example.com
+
+New files get their Document rows in one transaction and are copied next to
+the uploads. Files are chunked on a process pool and embedded in large
+batches on worker processes. Chunks already in the embedding store are not
+embedded again. Each store is then written once, as new segments committed
+with a single manifest swap.
+
+--reindex re-chunks every document of the chosen stores from its upload,
+with its own chunk settings and the current defaults. It re-embeds them with
+the current model and replaces the stores' segments. Use it after a chunker
+or model change.
+
+Runs are resumable: run the same command again after an interruption.
+Don't upload to the same users while a run is in progress (stop the server
+or keep it read-only).
+"""
+import argparse
+
+from app.database import init_db
+from app.services import bulk_ingest, vectorstore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="directory tree of files (one subfolder per user email, unless --email)")
+    source.add_argument("--manifest", help="JSONL file listing files to load")
+    source.add_argument("--reindex", action="store_true", help="rebuild existing stores from the uploaded files")
+    parser.add_argument("--email", help="with --dir: load every file under the directory for this user")
+    parser.add_argument("--emails", nargs="*", help="with --reindex: only the stores of these users")
+    parser.add_argument("--glob", default="*", help="with --dir: file name pattern")
+    parser.add_argument("--chunk-strategy", help="chunking of new files (default: deployment default)")
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument("--chunk-overlap", type=int)
+    parser.add_argument("--chunk-workers", type=int, help="chunking processes (default: all cores)")
+    parser.add_argument("--embed-workers", type=int, help="embedding processes (default: half the cores)")
+    parser.add_argument("--segment-rows", type=int, default=vectorstore.MIGRATE_SEGMENT_ROWS,
+                        help="rows per segment written")
+    args = parser.parse_args()
+
+    init_db()
+    reindex_stores = None
+    if args.reindex:
+        if (args.chunk_strategy, args.chunk_size, args.chunk_overlap) != (None, None, None):
+            parser.error("--reindex keeps each document's own chunk settings; --chunk-* only apply to new files")
+        reindex_stores, docs = bulk_ingest.plan_reindex(args.emails)
+    else:
+        docs = (
+            bulk_ingest.plan_from_dir(args.dir, args.email, args.glob) if args.dir
+            else bulk_ingest.plan_from_manifest(args.manifest)
+        )
+        for doc in docs:
+            doc.setdefault("chunk_strategy", args.chunk_strategy)
+            doc.setdefault("chunk_size", args.chunk_size)
+            doc.setdefault("chunk_overlap", args.chunk_overlap)
+    if not docs and not reindex_stores:
+        parser.error("nothing to load")
+
+    run = bulk_ingest.BulkIngest(
+        docs, reindex_stores, chunk_workers=args.chunk_workers, embed_workers=args.embed_workers,
+        segment_rows=args.segment_rows,
+    )
+    print(f"{len(run.state['docs'])} documents, work folder {run.folder}")
+    stats = run.run()
+    print(
+        f"Indexed {stats['documents']} documents ({stats['rows']} chunks) into {stats['stores']} store(s), "
+        f"{stats['segments']} segment(s), in {stats['seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
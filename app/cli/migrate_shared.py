@@ -0,0 +1,58 @@
+"""
+Copy per-user vector stores (data/vectordb/<email>/) into the shared layout.
+
+    python -m app.cli.migrate_shared
+    python -m app.cli.migrate_shared --emails a@example.com b@example.com --remove-source
+
+Then serve with VECTORSTORE_LAYOUT=shared. Vectors, chunk texts and BM25
+postings are copied, nothing is re-embedded. The shared manifest is committed
+once at the end, so an interrupted run changes nothing and can be re-run;
+documents already in the shared store are skipped. Run it while the server
+still uses the per_user layout (or is stopped). The tool exits after the
+shared store's background merge has finished.
+"""
+import argparse
+import os
+import time
+
+from app.services import vectorstore
+
+
+def user_stores() -> list:
+    """Emails that have a per-user store folder."""
+    if not os.path.isdir(vectorstore.DATA_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(vectorstore.DATA_DIR)
+        if "@" in name and os.path.isdir(os.path.join(vectorstore.DATA_DIR, name))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", nargs="*", help="users to migrate (default: every per-user store)")
+    parser.add_argument("--segment-rows", type=int, default=vectorstore.MIGRATE_SEGMENT_ROWS,
+                        help="rows per shared segment written")
+    parser.add_argument("--remove-source", action="store_true",
+                        help="delete the per-user folders once the shared manifest is committed")
+    args = parser.parse_args()
+
+    emails = args.emails or user_stores()
+    if not emails:
+        parser.error(f"no per-user stores under {vectorstore.DATA_DIR}")
+
+    start = time.perf_counter()
+    stats = vectorstore.migrate_to_shared(emails, args.segment_rows)
+    print(
+        f"Migrated {stats['documents']} documents ({stats['rows']} chunks) of {stats['users']} users "
+        f"into {stats['segments']} shared segment(s) in {time.perf_counter() - start:.1f}s"
+    )
+
+    if args.remove_source:
+        for email in emails:
+            vectorstore.remove_user_store(email)
+        print(f"Removed {len(emails)} per-user store(s)")
+
+
+if __name__ == "__main__":
+    main()
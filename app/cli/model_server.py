@@ -0,0 +1,31 @@
+"""
+Run one model server that API workers on this host share.
+
+    python -m app.cli.model_server --socket /tmp/rag-models.sock
+    MODEL_SERVER_SOCKET=/tmp/rag-models.sock uvicorn main:app --workers 4
+
+The server loads the embedding model and the local LLM once. Workers started
+with MODEL_SERVER_SOCKET load neither. They send embedding, token-count and
+generation requests over the Unix socket. Embedding results come back through
+a shared-memory buffer per connection, so arrays are not copied through the
+socket. Workers then scale across cores without duplicating model memory.
+
+Workers on one host share data/ (a local file system): each store's manifest
+commits are serialized with a lock file under data/vectordb-locks/, and each
+worker's cached index is checked against the manifest on every search.
+"""
+import argparse
+
+from app.services import model_client, model_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=model_client.SOCKET_PATH or "/tmp/rag-models.sock",
+                        help="Unix socket path (default: $MODEL_SERVER_SOCKET)")
+    args = parser.parse_args()
+    model_server.serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,43 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # Database filename
 DB_FILENAME = "app.db"
 DATABASE_URL = f"sqlite:///{DB_FILENAME}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DB_FILENAME}"
+
+# ========= CONFIG =========
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"                      # readers don't wait for writers
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # wait for the write lock instead of failing
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))             # page cache per connection
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))              # memory-mapped reads, 0 = off
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))                   # pooled connections (plus as many overflow)
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"                          # async sessions (aiosqlite) in async endpoints
+# ==========================
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection tuning. In WAL mode synchronous=NORMAL only fsyncs at checkpoints."""
+    cursor = dbapi_connection.cursor()
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 
 # SQLAlchemy engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_SIZE,
+)
+event.listen(engine, "connect", _set_sqlite_pragmas)
 
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -25,20 +55,64 @@ def get_db():
         db.close()
 
 
+_async_session_factory = None
+
+
+def async_session():
+    """
+    New AsyncSession on the aiosqlite engine (created on first use; needs
+    `pip install aiosqlite`). Use as `async with async_session() as db:`.
+    """
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_SIZE
+        )
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        _async_session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_session_factory()
+
+
+async def get_async_db():
+    """FastAPI dependency to get an async DB session"""
+    async with async_session() as db:
+        yield db
+
+
 def init_db():
-    """Initialize DB tables if DB file does not exist"""
-    if not os.path.exists(DB_FILENAME):
-        from app.models import User, Document  # import models
-        Base.metadata.create_all(bind=engine)
+    """Initialize DB tables (missing tables, columns and indexes are added to an existing DB)"""
+    from app.models import User, Document, IngestJob  # import models
+    exists = os.path.exists(DB_FILENAME)
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _add_missing_indexes()
+    if not exists:
         print(f"Database created: {DB_FILENAME}")
     else:
         print(f"Database already exists: {DB_FILENAME}")
 
 
-def delete_db():
-    """Delete the database file"""
-    if os.path.exists(DB_FILENAME):
-        os.remove(DB_FILENAME)
-        print(f"Database deleted: {DB_FILENAME}")
-    else:
-        print("No database file found to delete")
+def _add_missing_columns():
+    """create_all doesn't alter existing tables: add columns introduced since the DB was created"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"Added column {table.name}.{column.name}")
+
+
+def _add_missing_indexes():
+    """Same for indexes declared since the DB was created"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                print(f"Added index {index.name}")
@@ -1,34 +1,60 @@
-from fastapi import APIRouter, Request, Depends
+from fastapi import APIRouter, Request, Depends, Cookie, HTTPException
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import User, Document
+from app.auth.utils import get_user
+from app.docs.utils import list_documents, DOCS_PAGE_SIZE
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
 @router.get("/")
-def home(request: Request, email: str = None, db: Session = Depends(get_db)):
+def home(request: Request, email: str = None, page: int = 1, page_size: int = DOCS_PAGE_SIZE,
+         db: Session = Depends(get_db)):
     """
-    Render home page showing all documents for the logged-in user.
+    Render home page showing the documents (one page of them) of the logged-in user.
     email: email of the logged-in user (can be replaced with session/JWT later)
     """
     if not email:
         return {"error": "Email required to view documents"}
 
-    user = db.query(User).filter(User.email == email).first()
+    user = get_user(email=email, db=db)
     if not user:
         return {"error": "User not found"}
 
-    documents = db.query(Document).filter(Document.user_id == user.user_id).all()
+    listing = list_documents(db, user.user_id, page, page_size)
 
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
             "email": email,
-            "documents": documents,
+            "documents": listing["documents"],
+            "listing": listing,
             "title": f"{email}'s Documents"
         }
     )
+
+
+@router.get("/list")
+def document_list(user_id: str = Cookie(None), page: int = 1, page_size: int = DOCS_PAGE_SIZE,
+                  db: Session = Depends(get_db)):
+    """One page of the logged-in user's documents, newest first, as JSON"""
+    user = get_user(user_id, db=db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+
+    listing = list_documents(db, user.user_id, page, page_size)
+    listing["documents"] = [
+        {
+            "doc_id": doc.doc_id,
+            "doc_name": doc.doc_name,
+            "doc_uploaded_date": doc.doc_uploaded_date,
+            "size": doc.size,
+            "total_words": doc.total_words,
+            "total_sentences": doc.total_sentences,
+        }
+        for doc in listing["documents"]
+    ]
+    return listing
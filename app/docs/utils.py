@@ -0,0 +1,32 @@
+# app/docs/utils.py
+import math
+import os
+
+from sqlalchemy import func
+
+from app.models import Document
+
+# ========= CONFIG =========
+DOCS_PAGE_SIZE = int(os.getenv("DOCS_PAGE_SIZE", "50"))  # documents per page of a listing
+MAX_DOCS_PAGE_SIZE = 500
+# ==========================
+
+
+def list_documents(db, user_id: int, page: int = 1, page_size: int = DOCS_PAGE_SIZE) -> dict:
+    """
+    One page of the user's documents, newest first, with the totals needed
+    for page links. Both queries are answered from the doc_data.user_id index.
+    """
+    page_size = min(max(page_size, 1), MAX_DOCS_PAGE_SIZE)
+    total = db.query(func.count(Document.doc_id)).filter(Document.user_id == user_id).scalar()
+    pages = max(math.ceil(total / page_size), 1)
+    page = min(max(page, 1), pages)
+    documents = (
+        db.query(Document)
+        .filter(Document.user_id == user_id)
+        .order_by(Document.doc_id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+        .all()
+    )
+    return {"documents": documents, "page": page, "pages": pages, "page_size": page_size, "total": total}
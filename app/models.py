@@ -19,11 +19,31 @@ class Document(Base):
     __tablename__ = "doc_data"
 
     doc_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    # Every listing and lookup filters on the owner (the index also keeps doc_id order)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False, index=True)
     doc_uploaded_date = Column(DateTime, default=datetime.utcnow)
     doc_name = Column(String, nullable=False)
     size = Column(Integer)
     total_words = Column(Integer)
     total_sentences = Column(Integer)
+    # How the document is chunked for indexing (see app.services.chunker)
+    chunk_strategy = Column(String)
+    chunk_size = Column(Integer)
+    chunk_overlap = Column(Integer)
 
     owner = relationship("User", back_populates="documents")
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    doc_id = Column(Integer, ForeignKey("doc_data.doc_id"), nullable=False)
+    # queued → chunking → embedding → indexing → done | failed
+    status = Column(String, nullable=False, default="queued")
+    error = Column(String)
+    # "host:pid:start time" of the process that claimed the job (see app.services.ingest)
+    owner = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
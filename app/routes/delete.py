@@ -4,12 +4,9 @@ from sqlalchemy.orm import Session
 import os
 
 from app.database import get_db
-from app.models import User, Document
-
-import os
-import faiss
-import pickle
-from app.services.embedding import get_embeddings, get_single_embedding, EMBEDDING_DIM
+from app.models import Document
+from app.auth.utils import get_user
+from app.services.vectorstore import delete_from_vectorstore
 
 
 router = APIRouter()
@@ -22,7 +19,7 @@ def delete_file(doc_id: int, db: Session = Depends(get_db)):
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    user = db.query(User).filter(User.user_id == doc.user_id).first()
+    user = get_user(doc.user_id, db=db)
     user_email = user.email
 
     try :
@@ -31,37 +28,8 @@ def delete_file(doc_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         print(f"SQL entry delete error: {e}")
 
-    # # 2. Delete from vector DB
-    user_folder = os.path.join("data/vectordb", user_email)  
-    index_file = os.path.join(user_folder, "vectordb.index")
-    chunks_file = os.path.join(user_folder, "chunks.pkl")
-
-
-    if os.path.exists(index_file) and os.path.exists(chunks_file):
-        # Load existing index + chunks
-        with open(chunks_file, "rb") as f:
-            all_chunks = pickle.load(f)
-
-        if doc_id in all_chunks:
-            del all_chunks[doc_id]  # remove the chunks for this doc
-
-            # Rebuild FAISS index from remaining chunks
-            flat_chunks = []
-            for chunks in all_chunks.values():
-                flat_chunks.extend(chunks)
-
-            if flat_chunks:
-                embeddings = get_embeddings(flat_chunks)
-                index = faiss.IndexFlatL2(EMBEDDING_DIM)
-                index.add(embeddings)
-                faiss.write_index(index, index_file)
-            else:
-                # No chunks left, delete index file
-                os.remove(index_file)
-
-            # Save updated chunks
-            with open(chunks_file, "wb") as f:
-                pickle.dump(all_chunks, f)
+    # # 2. Delete from vector DB (only this document's vectors are removed)
+    delete_from_vectorstore(user_email, doc_id)
 
 
     # 3. Delete local file
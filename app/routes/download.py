@@ -5,7 +5,8 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 import os
 from app.database import get_db
-from app.models import User, Document
+from app.models import Document
+from app.auth.utils import get_user
 
 router = APIRouter()
 
@@ -18,7 +19,7 @@ def download_file(doc_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Document not found")
 
     # Build file path (where we saved uploads earlier)
-    user = db.query(User).filter(User.user_id == doc.user_id).first()
+    user = get_user(doc.user_id, db=db)
     user_folder = os.path.join("data/uploads", user.email)
     file_path = os.path.join(user_folder, f"{doc.doc_id}_{doc.doc_name}")
 
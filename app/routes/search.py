@@ -0,0 +1,70 @@
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Cookie, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.auth.utils import get_user_async
+from app.services.lexical import FUSION_MODES
+from app.services import executors
+from app.services.llm import generate_answer
+from app.services.vectorstore import search_batch
+
+MAX_BATCH_QUERIES = 10_000  # queries accepted per /api/search/batch request
+
+
+router = APIRouter()
+
+
+class BatchSearchRequest(BaseModel):
+    queries: list[str]
+    top_k: int = 5
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    fusion: str = "dense"
+    # The LLM answer is skipped unless asked for; retrieval-only evaluation doesn't need it
+    answer: bool = False
+    temperature: float = 0.7
+    max_tokens: int = 5
+
+
+@router.post("/batch")
+async def batch_search(body: BatchSearchRequest, user_id: str = Cookie(None)):
+    """
+    Run many queries for the logged-in user in one request. The response is
+    NDJSON, one line per query in request order, streamed as blocks of
+    queries finish: {"index", "query", "results": [{"doc_id", "chunk", "distance"}], "answer"?}
+    """
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    user = await get_user_async(user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    if body.fusion not in FUSION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown fusion mode: {body.fusion}")
+    if len(body.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+
+    executors.admit("search", *(["generation"] if body.answer else []))
+
+    async def lines():
+        # The batch occupies one search worker from start to end
+        found = executors.iterate(
+            "search", search_batch, user.email, body.queries, body.top_k, body.nprobe, body.ef_search, body.fusion
+        )
+        index = 0
+        async for query, results in found:
+            line = {"index": index, "query": query, "results": results}
+            if body.answer:
+                try:
+                    line["answer"] = await executors.run(
+                        "generation", generate_answer, results, query, body.temperature, body.max_tokens
+                    )
+                except executors.PoolSaturated as e:
+                    line["answer"], line["error"] = None, str(e)
+            yield json.dumps(line) + "\n"
+            index += 1
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -1,64 +1,100 @@
-from fastapi import APIRouter, UploadFile, Form, Depends
+from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import os
 from datetime import datetime
-from app.database import get_db
-from app.models import User, Document
-from app.services.vectorstore import update_vectorstore
+from app.database import get_db, SessionLocal
+from app.models import Document, IngestJob
+from app.auth.utils import get_user_async
+from app.services.ingest import UPLOAD_DIR, create_job, enqueue_job
+from app.services.chunker import resolve_config
+from app.services import metrics
+from app.utils.file_handler import save_upload
 
 
 router = APIRouter()
 
-UPLOAD_DIR = "data/uploads"
-
 
 @router.post("/")
 async def upload_file(
     file: UploadFile,
     email: str = Form(...),
-    db: Session = Depends(get_db)
+    chunk_strategy: str = Form(None),
+    chunk_size: int = Form(None),
+    chunk_overlap: int = Form(None),
 ):
-    # Find user
-    user = db.query(User).filter(User.email == email).first()
+    # Find user (cached, no session is held while the file streams in)
+    user = await get_user_async(email=email)
     if not user:
         return {"error": "User not found"}
 
+    # Chunking settings for this document (empty fields use the defaults)
+    try:
+        chunk_strategy, chunk_size, chunk_overlap = resolve_config(chunk_strategy, chunk_size, chunk_overlap)
+    except ValueError as e:
+        return {"error": str(e)}
+
     # Create user folder if not exists
     user_folder = os.path.join(UPLOAD_DIR, email)
     os.makedirs(user_folder, exist_ok=True)
 
-    # Save file temporarily
+    # Save file temporarily, counting metadata while it streams to disk
     file_path = os.path.join(user_folder, file.filename)
-    content = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(content)
-
-    # Calculate metadata
-    size_kb = len(content) // 1024
-    text_content = content.decode("utf-8", errors="ignore")
-    total_words = len(text_content.split())
-    total_sentences = text_content.count(".")
+    with metrics.timed("save_upload"):
+        stats = await save_upload(file, file_path)
 
-    # Add document entry to DB
+    # Add document entry to DB. The writes run on a worker thread: waiting
+    # for SQLite's write lock must not stall the event loop (and every search on it)
     new_doc = Document(
         user_id=user.user_id,
         doc_uploaded_date=datetime.now(),
         doc_name=file.filename,
-        size=size_kb,
-        total_words=total_words,
-        total_sentences=total_sentences
+        size=stats.size // 1024,
+        total_words=stats.words,
+        total_sentences=stats.sentences,
+        chunk_strategy=chunk_strategy,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
     )
-    db.add(new_doc)
-    db.commit()
-    db.refresh(new_doc)
+    doc_id, job_id = await run_in_threadpool(_add_document, new_doc, file_path)
 
-    # Rename file with doc_id
-    new_file_path = os.path.join(user_folder, f"{new_doc.doc_id}_{file.filename}")
-    os.rename(file_path, new_file_path)
-
-    # --- FAISS indexing ---
-    update_vectorstore(email, new_doc.doc_id, text_content)
+    # --- FAISS indexing runs in the background ingest pool ---
+    enqueue_job(job_id, user.user_id)
 
     return RedirectResponse(url="/home", status_code=302)
 
+
+def _add_document(new_doc: Document, file_path: str):
+    """Insert the Document row, rename the file with its doc_id and create its ingest job"""
+    db = SessionLocal()
+    try:
+        db.add(new_doc)
+        db.commit()
+        db.refresh(new_doc)
+
+        # Rename file with doc_id
+        new_file_path = os.path.join(os.path.dirname(file_path), f"{new_doc.doc_id}_{new_doc.doc_name}")
+        os.rename(file_path, new_file_path)
+
+        job = create_job(db, new_doc.user_id, new_doc.doc_id)
+        return new_doc.doc_id, job.job_id
+    finally:
+        db.close()
+
+
+@router.get("/status/{job_id}")
+def upload_status(job_id: int, db: Session = Depends(get_db)):
+    """Progress of a background ingest job"""
+    job = db.query(IngestJob).filter(IngestJob.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job.job_id,
+        "doc_id": job.doc_id,
+        "status": job.status,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
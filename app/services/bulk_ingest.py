@@ -0,0 +1,432 @@
+# app/services/bulk_ingest.py
+import os
+import io
+import json
+import glob
+import hashlib
+import multiprocessing
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from datetime import datetime
+
+import numpy as np
+
+from app.database import SessionLocal
+from app.models import User, Document
+from app.services import vectorstore
+from app.services.chunker import chunk_file, resolve_config
+from app.services.embedding_store import chunk_key, get_store
+from app.services.ingest import upload_path
+from app.utils.file_handler import TextStats, BLOCK_SIZE
+
+# ========= CONFIG =========
+WORK_DIR = "data/bulk_ingest"  # resumable state of runs, one folder per set of inputs
+EMBED_BATCH_TEXTS = int(os.getenv("BULK_EMBED_BATCH", "1024"))  # texts per embedding task
+# ==========================
+
+STATE_FILENAME = "state.json"
+
+
+# -------- PLAN --------
+def plan_from_dir(root: str, email: str = None, pattern: str = "*") -> list:
+    """
+    Files to load from a directory tree: every file under root for email, or,
+    without email, every file under root/<email>/ for each subfolder named
+    after a user.
+    """
+    def files(folder):
+        paths = glob.glob(os.path.join(folder, "**", pattern), recursive=True)
+        return sorted(path for path in paths if os.path.isfile(path))
+
+    if email:
+        return [{"email": email, "path": path} for path in files(root)]
+    return [
+        {"email": name, "path": path}
+        for name in sorted(os.listdir(root)) if "@" in name and os.path.isdir(os.path.join(root, name))
+        for path in files(os.path.join(root, name))
+    ]
+
+
+def plan_from_manifest(manifest_file: str) -> list:
+    """Files listed in a JSONL manifest: {"email", "path"} plus optional chunk_strategy / chunk_size / chunk_overlap."""
+    with open(manifest_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def plan_reindex(emails: list = None):
+    """
+    (stores, docs) to rebuild: every store under vectorstore.DATA_DIR, or the
+    stores of these users, with all their documents re-chunked from the uploads.
+    A shared store is always rebuilt with the documents of all its owners.
+    """
+    if emails:
+        stores = sorted({vectorstore._store_of(email) for email in emails})
+    else:
+        stores = sorted(
+            name for name in os.listdir(vectorstore.DATA_DIR)
+            if os.path.isdir(os.path.join(vectorstore.DATA_DIR, name))
+        ) if os.path.isdir(vectorstore.DATA_DIR) else []
+    emails = sorted({email for store in stores for email in vectorstore.store_emails(store)} | set(emails or []))
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Document, User.email)
+            .join(User, User.user_id == Document.user_id)
+            .filter(User.email.in_(emails))
+            .order_by(Document.doc_id)
+            .all()
+        )
+        return stores, [
+            {
+                "email": email, "doc_id": doc.doc_id, "name": doc.doc_name,
+                "path": upload_path(email, doc.doc_id, doc.doc_name),
+                "chunk_strategy": doc.chunk_strategy, "chunk_size": doc.chunk_size, "chunk_overlap": doc.chunk_overlap,
+            }
+            for doc, email in rows
+        ]
+    finally:
+        db.close()
+
+
+class BulkIngest:
+    """
+    One resumable bulk load. Progress lives in a work folder named after the
+    inputs: re-running the same command after an interruption picks up where
+    it stopped. Steps: Document rows (one transaction) → chunking (process
+    pool, one spool file per document) → embedding (process pool, large
+    batches, embedding store consulted first; one .npy per document) →
+    one bulk_load commit per store. With reindex_stores, those stores are
+    rebuilt from docs alone (their current segments are replaced).
+    """
+
+    def __init__(self, docs: list, reindex_stores: list = None, chunk_workers: int = None, embed_workers: int = None,
+                 segment_rows: int = vectorstore.MIGRATE_SEGMENT_ROWS, work_dir: str = WORK_DIR):
+        for doc in docs:
+            doc["chunk_strategy"], doc["chunk_size"], doc["chunk_overlap"] = resolve_config(
+                doc.get("chunk_strategy"), doc.get("chunk_size"), doc.get("chunk_overlap")
+            )
+            doc.setdefault("name", os.path.basename(doc["path"]))
+            doc.setdefault("doc_id", None)
+        key = json.dumps([reindex_stores, [[d["email"], d["path"], d["doc_id"]] for d in docs]])
+        self.folder = os.path.join(work_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+        self.reindex = reindex_stores is not None
+        self.chunk_workers = chunk_workers or os.cpu_count() or 1
+        self.embed_workers = embed_workers or max(1, (os.cpu_count() or 1) // 2)
+        self.segment_rows = segment_rows
+
+        self.state = self._read_state() or {
+            "started": datetime.now().isoformat(), "reindex_stores": reindex_stores, "docs": docs,
+            "inserting": None, "stats_saved": False, "built": [],
+        }
+        self._save_state()
+
+    # --- state ---
+    def _path(self, *parts) -> str:
+        return os.path.join(self.folder, *parts)
+
+    def _read_state(self):
+        if not os.path.exists(self._path(STATE_FILENAME)):
+            return None
+        with open(self._path(STATE_FILENAME)) as f:
+            return json.load(f)
+
+    def _save_state(self):
+        os.makedirs(self.folder, exist_ok=True)
+        _write_atomic(self._path(STATE_FILENAME), json.dumps(self.state).encode("utf-8"))
+
+    def chunks_file(self, doc_id: int) -> str:
+        return self._path("chunks", f"{doc_id}.jsonl")
+
+    def vectors_file(self, doc_id: int) -> str:
+        return self._path("vectors", f"{doc_id}.npy")
+
+    # --- steps ---
+    def run(self) -> dict:
+        start = time.perf_counter()
+        self.create_documents()
+        self.chunk()
+        self.embed()
+        stats = self.build()
+        shutil.rmtree(self.folder, ignore_errors=True)
+        stats["seconds"] = round(time.perf_counter() - start, 1)
+        return stats
+
+    def create_documents(self):
+        """Insert the Document rows of all new files in one transaction and record their doc_ids."""
+        docs = [doc for doc in self.state["docs"] if doc["doc_id"] is None]
+        if not docs:
+            return
+        uploaded = datetime.fromisoformat(self.state["started"])
+        db = SessionLocal()
+        try:
+            users = {
+                user.email: user.user_id
+                for user in db.query(User).filter(User.email.in_({doc["email"] for doc in docs})).all()
+            }
+            unknown = sorted({doc["email"] for doc in docs} - set(users))
+            if unknown:
+                raise ValueError(f"Unknown users (sign them up first): {', '.join(unknown)}")
+
+            rows = []
+            if self.state["inserting"]:
+                # Interrupted around the commit: the doc_ids were recorded before it
+                found = {
+                    row.doc_id: row
+                    for row in db.query(Document).filter(Document.doc_id.in_(self.state["inserting"])).all()
+                }
+                rows = [found.get(doc_id) for doc_id in self.state["inserting"]]
+                # An uncommitted id may have been given to a later upload since
+                ours = [
+                    row is not None and row.user_id == users[doc["email"]] and row.doc_name == doc["name"]
+                    for row, doc in zip(rows, docs)
+                ]
+                if any(ours) and not all(ours):
+                    raise RuntimeError(f"Found {sum(ours)} documents of the interrupted run, expected {len(docs)}")
+                if not all(ours):
+                    rows = []
+            if not rows:
+                rows = [
+                    Document(
+                        user_id=users[doc["email"]], doc_uploaded_date=uploaded, doc_name=doc["name"],
+                        size=os.path.getsize(doc["path"]) // 1024,
+                        chunk_strategy=doc["chunk_strategy"], chunk_size=doc["chunk_size"],
+                        chunk_overlap=doc["chunk_overlap"],
+                    )
+                    for doc in docs
+                ]
+                db.add_all(rows)
+                db.flush()  # assigns the doc_ids
+                self.state["inserting"] = [row.doc_id for row in rows]
+                self._save_state()
+                db.commit()
+            doc_ids = [row.doc_id for row in rows]
+        finally:
+            db.close()
+
+        for doc, doc_id in zip(docs, doc_ids):
+            doc["doc_id"] = doc_id
+        self.state["inserting"] = None
+        self._save_state()
+        print(f"Created {len(docs)} documents")
+
+    def chunk(self):
+        """
+        Copy new files into the upload folder and chunk every pending document on
+        a process pool, then save the document stats from the spool files.
+        """
+        os.makedirs(self._path("chunks"), exist_ok=True)
+        pending = []
+        for doc in self.state["docs"]:
+            if os.path.exists(self.chunks_file(doc["doc_id"])):
+                continue
+            if self.reindex and not os.path.exists(doc["path"]):
+                # The upload is gone: keep the chunks the index already has
+                chunks = vectorstore.document_chunks(doc["email"], doc["doc_id"]) or []
+                print(f"{doc['path']} is missing, reusing its {len(chunks)} indexed chunks")
+                _write_chunks(self.chunks_file(doc["doc_id"]), None, chunks)
+            else:
+                pending.append(doc)
+        if pending:
+            self._chunk_pending(pending)
+        if not self.reindex and not self.state["stats_saved"]:
+            # Read back from every spool file, including those of an earlier interrupted run
+            rows = [
+                {"doc_id": doc["doc_id"], **_read_stats(self.chunks_file(doc["doc_id"]))} for doc in self.state["docs"]
+            ]
+            db = SessionLocal()
+            try:
+                db.bulk_update_mappings(Document, rows)
+                db.commit()
+            finally:
+                db.close()
+            self.state["stats_saved"] = True
+            self._save_state()
+
+    def _chunk_pending(self, pending: list):
+        done = 0
+        with ProcessPoolExecutor(self.chunk_workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_chunk_worker) as pool:
+            futures = {}
+            for doc in pending:
+                # New files are copied next to the uploads, so downloads and later reindexes find them
+                upload = None if self.reindex else upload_path(doc["email"], doc["doc_id"], doc["name"])
+                future = pool.submit(
+                    _chunk_document, doc["path"], upload, self.chunks_file(doc["doc_id"]),
+                    doc["chunk_strategy"], doc["chunk_size"], doc["chunk_overlap"],
+                )
+                futures[future] = doc
+            for future in as_completed(futures):
+                future.result()
+                done += 1
+                if done % 100 == 0 or done == len(pending):
+                    print(f"Chunked {done}/{len(pending)} documents")
+
+    def embed(self):
+        """
+        Embed every pending document. Texts the embedding store already has are
+        read from it; the rest are sent to worker processes in batches of about
+        EMBED_BATCH_TEXTS texts (whole documents per batch).
+        """
+        os.makedirs(self._path("vectors"), exist_ok=True)
+        pending = [doc["doc_id"] for doc in self.state["docs"] if not os.path.exists(self.vectors_file(doc["doc_id"]))]
+        if not pending:
+            return
+        store = get_store()
+
+        def batches():
+            batch, size = [], 0
+            for doc_id in pending:
+                chunks = _read_chunks(self.chunks_file(doc_id))
+                keys = [chunk_key(text) for text in chunks]
+                if store is not None:
+                    vectors, found = store.lookup(keys)
+                else:
+                    vectors = np.zeros((len(chunks), vectorstore.EMBEDDING_DIM), dtype="float32")
+                    found = np.zeros(len(chunks), dtype=bool)
+                batch.append((doc_id, chunks, keys, vectors, np.flatnonzero(~found)))
+                size += int((~found).sum())
+                if size >= EMBED_BATCH_TEXTS:
+                    yield batch
+                    batch, size = [], 0
+            if batch:
+                yield batch
+
+        def finish(batch, new_vectors):
+            offset = 0
+            for doc_id, chunks, keys, vectors, missing in batch:
+                vectors[missing] = new_vectors[offset:offset + len(missing)]
+                offset += len(missing)
+                if store is not None and len(missing):
+                    store.add([keys[i] for i in missing], vectors[missing])
+                buffer = io.BytesIO()
+                np.save(buffer, vectors)
+                _write_atomic(self.vectors_file(doc_id), buffer.getvalue())
+
+        done = 0
+        context = multiprocessing.get_context("spawn")
+        threads = max(1, (os.cpu_count() or 1) // self.embed_workers)
+        with ProcessPoolExecutor(self.embed_workers, mp_context=context,
+                                 initializer=_init_embed_worker, initargs=(threads,)) as pool:
+            in_flight = {}
+            for batch in batches():
+                texts = [batch_doc[1][i] for batch_doc in batch for i in batch_doc[4]]
+                in_flight[pool.submit(_embed_texts, texts)] = batch
+                # Keep a couple of batches per worker queued, not the whole corpus in memory
+                while len(in_flight) >= 2 * self.embed_workers:
+                    done += self._collect(in_flight, finish)
+                    print(f"Embedded {done}/{len(pending)} documents")
+            while in_flight:
+                done += self._collect(in_flight, finish)
+                print(f"Embedded {done}/{len(pending)} documents")
+
+    @staticmethod
+    def _collect(in_flight: dict, finish) -> int:
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        count = 0
+        for future in finished:
+            batch = in_flight.pop(future)
+            finish(batch, future.result())
+            count += len(batch)
+        return count
+
+    def build(self) -> dict:
+        """Write each store's documents into new segments, committed once per store."""
+        # A reindexed store whose documents are all gone is rebuilt empty
+        by_store = {store: [] for store in self.state["reindex_stores"] or []}
+        for doc in self.state["docs"]:
+            by_store.setdefault(vectorstore._store_of(doc["email"]), []).append(doc)
+
+        totals = {"stores": 0, "documents": 0, "rows": 0, "segments": 0}
+        for store, docs in sorted(by_store.items()):
+            if store in self.state["built"]:
+                continue
+            docs = sorted(docs, key=lambda doc: doc["doc_id"])
+            stats = vectorstore.bulk_load(
+                store,
+                (
+                    (doc["doc_id"], doc["email"], _read_chunks(self.chunks_file(doc["doc_id"])),
+                     np.load(self.vectors_file(doc["doc_id"])))
+                    for doc in docs
+                ),
+                replace=self.reindex, segment_rows=self.segment_rows,
+            )
+            print(f"Built {store}: {stats['documents']} documents, {stats['rows']} chunks, {stats['segments']} segment(s)")
+            self.state["built"].append(store)
+            self._save_state()
+            totals["stores"] += 1
+            for key in ("documents", "rows", "segments"):
+                totals[key] += stats[key]
+        return totals
+
+
+# -------- WORKERS (run in child processes) --------
+def _init_chunk_worker():
+    # Chunking only counts tokens: no copy of the embedding model per core
+    from app.services import embedding
+    embedding.use_tokenizer_only()
+
+
+def _chunk_document(source: str, upload: str, out_file: str, strategy: str, size: int, overlap: int) -> dict:
+    """Copy source to its upload path (new documents) and write its chunks; returns the document stats."""
+    if upload:
+        os.makedirs(os.path.dirname(upload), exist_ok=True)
+        shutil.copyfile(source, upload)
+    stats = TextStats()
+    with open(source, "rb") as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            stats.feed(block)
+    stats.feed(b"", final=True)
+    totals = {"size": stats.size // 1024, "total_words": stats.words, "total_sentences": stats.sentences}
+    _write_chunks(out_file, totals, chunk_file(upload or source, strategy, size, overlap))
+    return totals
+
+
+def _init_embed_worker(threads: int):
+    # Split the cores between the worker processes instead of each using all of them
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    from app.services import embedding_onnx
+    embedding_onnx.ONNX_THREADS = threads
+
+
+def _embed_texts(texts: list) -> np.ndarray:
+    from app.services.embedding import get_embeddings
+    return get_embeddings(texts)
+
+
+# -------- SPOOL FILES --------
+def _write_atomic(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _write_chunks(path: str, stats, chunks):
+    """One JSON line of document stats, then one JSON string per chunk."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(stats) + "\n")
+        for chunk in chunks:
+            f.write(json.dumps(chunk) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_stats(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.loads(next(f))
+
+
+def _read_chunks(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        next(f)
+        return [json.loads(line) for line in f]
+
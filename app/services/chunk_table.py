@@ -0,0 +1,240 @@
+# app/services/chunk_table.py
+import os
+import shutil
+import numpy as np
+
+TABLE_FILENAME = "chunks.npy"
+ARENA_FILENAME = "chunks.bin"
+DOCS_FILENAME = "docs.npy"   # doc_id, first row and row count of every document
+
+DOCS_DTYPE = np.dtype([("doc_id", "<i8"), ("start", "<i8"), ("count", "<i8")])
+
+# Rows copied per step when a table is written, so writes need the same
+# memory whatever the corpus size
+COPY_ROWS = 16_384
+
+
+def chunk_dtype(dim: int) -> np.dtype:
+    """
+    One row per chunk, sorted by vector id (= (doc_id << 32) | chunk_idx).
+    The raw float32 embedding is kept next to the row so indexes can be
+    retrained or rebuilt without calling the embedder again.
+    """
+    return np.dtype([
+        ("id", "<i8"),
+        ("doc_id", "<i8"),
+        ("offset", "<i8"),     # byte offset of the utf-8 text in chunks.bin
+        ("chunk_idx", "<i4"),
+        ("length", "<i4"),     # byte length of the utf-8 text
+        ("vector", "<f4", (dim,)),
+    ])
+
+
+def _open_arena(path: str):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def _fsync_file(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class SegmentWriter:
+    """
+    Writes a new chunk table into an empty folder, document by document in
+    increasing doc_id order. Rows and texts are appended to disk as they
+    arrive; finish() turns the rows into chunks.npy and writes the per-document
+    directory (docs.npy). Memory use is one batch plus one entry per document.
+    """
+
+    def __init__(self, folder: str, dim: int):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.dim = dim
+        self.count = 0
+        self._rows_file = os.path.join(folder, "rows.tmp")
+        self._rows = open(self._rows_file, "wb")
+        self._arena = open(os.path.join(folder, ARENA_FILENAME), "wb")
+        self._arena_size = 0
+        self._doc_id = None
+        self._chunk_idx = 0
+        self._docs = []  # [doc_id, first row] per document
+
+    def _start_document(self, doc_id: int):
+        if doc_id != self._doc_id:
+            if self._doc_id is not None and doc_id < self._doc_id:
+                raise ValueError(f"Documents must be added in increasing doc_id order ({doc_id} after {self._doc_id})")
+            self._doc_id = doc_id
+            self._chunk_idx = 0
+            self._docs.append([doc_id, self.count])
+
+    def add_chunks(self, doc_id: int, chunks: list[str], vectors: np.ndarray):
+        """Append chunks (and their embeddings) of doc_id; a document may arrive over several calls."""
+        self._start_document(doc_id)
+        encoded = [ch.encode("utf-8") for ch in chunks]
+        lengths = np.array([len(data) for data in encoded], dtype="int64")
+
+        rows = np.zeros(len(encoded), dtype=chunk_dtype(self.dim))
+        rows["chunk_idx"] = np.arange(self._chunk_idx, self._chunk_idx + len(encoded))
+        rows["doc_id"] = doc_id
+        rows["id"] = (np.int64(doc_id) << 32) | rows["chunk_idx"].astype("int64")
+        rows["length"] = lengths
+        rows["offset"] = self._arena_size + np.cumsum(lengths) - lengths
+        rows["vector"] = vectors
+
+        for data in encoded:
+            self._arena.write(data)
+        rows.tofile(self._rows)
+        self._arena_size += int(lengths.sum())
+        self._chunk_idx += len(encoded)
+        self.count += len(encoded)
+
+    def add_rows(self, table: "ChunkTable", start: int, count: int):
+        """Copy rows start:start+count of another table (one whole document) and their texts."""
+        self._start_document(int(table.rows[start]["doc_id"]))
+        for begin in range(start, start + count, COPY_ROWS):
+            rows = np.array(table.rows[begin:min(begin + COPY_ROWS, start + count)])
+            lengths = rows["length"].astype("int64")
+            offsets = rows["offset"].astype("int64")
+            if np.array_equal(offsets, offsets[0] + np.cumsum(lengths) - lengths):
+                # Texts are stored back to back (always true for tables written here)
+                self._arena.write(table.arena[offsets[0]:offsets[0] + lengths.sum()].tobytes())
+            else:
+                for offset, length in zip(offsets, lengths):
+                    self._arena.write(table.arena[offset:offset + length].tobytes())
+            rows["offset"] = self._arena_size + np.cumsum(lengths) - lengths
+            rows.tofile(self._rows)
+            self._arena_size += int(lengths.sum())
+            self.count += len(rows)
+        self._chunk_idx += count
+
+    def finish(self) -> "ChunkTable":
+        """Write chunks.npy, flush everything to disk and return the finished table."""
+        self._rows.close()
+        _fsync_file(self._arena)
+        self._arena.close()
+
+        table_file = os.path.join(self.folder, TABLE_FILENAME)
+        out = np.lib.format.open_memmap(table_file, mode="w+", dtype=chunk_dtype(self.dim), shape=(self.count,))
+        if self.count:
+            rows = np.memmap(self._rows_file, dtype=chunk_dtype(self.dim), mode="r", shape=(self.count,))
+            for start in range(0, self.count, COPY_ROWS):
+                out[start:start + COPY_ROWS] = rows[start:start + COPY_ROWS]
+            del rows
+        out.flush()
+        del out
+        with open(table_file, "rb+") as f:
+            _fsync_file(f)
+        os.remove(self._rows_file)
+
+        docs = np.zeros(len(self._docs), dtype=DOCS_DTYPE)
+        if self._docs:
+            docs["doc_id"], docs["start"] = np.array(self._docs, dtype="int64").T
+            docs["count"] = np.diff(np.r_[docs["start"], self.count])
+        with open(os.path.join(self.folder, DOCS_FILENAME), "wb") as f:
+            np.save(f, docs)
+            _fsync_file(f)
+        return ChunkTable(self.folder, self.dim)
+
+    def discard(self):
+        self._rows.close()
+        self._arena.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class ChunkTable:
+    """
+    Array-backed vector id → chunk table for one folder (a segment).
+    chunks.npy holds the fixed-width rows and chunks.bin the chunk texts;
+    both are memory-mapped and docs.npy lists where each document's rows
+    are, so loading costs O(documents), not O(chunks). (Tables written
+    before docs.npy are read with one pass over the doc_id column.)
+    Tables are immutable once written by a SegmentWriter.
+    """
+
+    def __init__(self, folder: str, dim: int):
+        self.folder = folder
+        self.dim = dim
+        self.table_file = os.path.join(folder, TABLE_FILENAME)
+        self.arena_file = os.path.join(folder, ARENA_FILENAME)
+
+        if os.path.exists(self.table_file):
+            self.rows = np.load(self.table_file, mmap_mode="r")
+        else:
+            self.rows = np.zeros(0, dtype=chunk_dtype(dim))
+        self.arena = _open_arena(self.arena_file)
+
+        # doc_id → (first row, row count); rows of a document are contiguous
+        docs_file = os.path.join(folder, DOCS_FILENAME)
+        if os.path.exists(docs_file):
+            docs = np.load(docs_file)
+            self.doc_rows = {
+                int(doc_id): (int(start), int(count))
+                for doc_id, start, count in zip(docs["doc_id"], docs["start"], docs["count"])
+            }
+            return
+        doc_ids = np.asarray(self.rows["doc_id"])
+        starts = np.flatnonzero(np.r_[True, doc_ids[1:] != doc_ids[:-1]]) if len(doc_ids) else []
+        ends = list(starts[1:]) + [len(doc_ids)]
+        self.doc_rows = {
+            int(doc_ids[start]): (int(start), int(end - start))
+            for start, end in zip(starts, ends)
+        }
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, TABLE_FILENAME))
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def has_vectors(self) -> bool:
+        """Tables written before vectors were stored alongside the chunks lack this column."""
+        return "vector" in self.rows.dtype.names
+
+    def has_document(self, doc_id: int) -> bool:
+        return doc_id in self.doc_rows
+
+    def nbytes(self) -> int:
+        """Resident size is only the per-document directory; rows and texts are mmapped."""
+        return 100 * len(self.doc_rows)
+
+    def ids(self) -> np.ndarray:
+        return np.asarray(self.rows["id"])
+
+    def vectors(self) -> np.ndarray:
+        """All stored embeddings in row (= id) order, as a memory-mapped view."""
+        return self.rows["vector"]
+
+    def _row_of(self, vector_id: int) -> int:
+        """Row position of a vector id, or -1 if it's not in the table."""
+        doc_id, chunk_idx = vector_id >> 32, vector_id & 0xFFFFFFFF
+        start, count = self.doc_rows.get(doc_id, (0, 0))
+        if chunk_idx >= count or int(self.rows[start + chunk_idx]["id"]) != vector_id:
+            return -1
+        return start + chunk_idx
+
+    def vectors_for(self, vector_ids: np.ndarray):
+        """(found_ids, vectors) for the ids present in the table, in the given order."""
+        vector_ids = np.asarray(vector_ids, dtype="int64")
+        rows = np.array([self._row_of(int(i)) for i in vector_ids], dtype="int64")
+        found = rows >= 0
+        return vector_ids[found], np.asarray(self.rows["vector"][rows[found]], dtype="float32")
+
+    def text(self, row: int) -> str:
+        offset, length = int(self.rows[row]["offset"]), int(self.rows[row]["length"])
+        return bytes(self.arena[offset:offset + length]).decode("utf-8")
+
+    def texts(self):
+        """Chunk texts in row order."""
+        return (self.text(row) for row in range(len(self.rows)))
+
+    def lookup(self, vector_id: int):
+        """Resolve a vector id to (doc_id, chunk) in O(1), or None if it's not in the table."""
+        row = self._row_of(int(vector_id))
+        if row < 0:
+            return None
+        return int(vector_id) >> 32, self.text(row)
@@ -0,0 +1,166 @@
+# app/services/chunker.py
+import os
+import re
+from collections import deque
+
+from app.services.embedding import count_tokens, MAX_SEQ_TOKENS
+from app.utils.file_handler import iter_file_text
+
+# ========= CONFIG =========
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "recursive")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "200"))      # tokens per chunk ("words": words)
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "20"))  # tokens repeated from the previous chunk
+# ==========================
+
+COUNT_BATCH = 512                 # units tokenized per tokenizer call
+MAX_UNIT_CHARS = 1024 * 1024      # a stretch without separators longer than this is cut anyway
+
+# Separator levels, coarsest first: split pattern and the joiner used to merge units back
+_LEVELS = {
+    "paragraph": (re.compile(r"\n\s*\n"), "\n\n"),
+    "line": (re.compile(r"\n"), "\n"),
+    "sentence": (re.compile(r"(?<=[.!?])\s+"), " "),
+    "word": (re.compile(r"\s+"), " "),
+}
+
+# strategy → the separator levels it splits at; a unit over the token budget
+# is split again at the next level. "words" is the original fixed word window.
+STRATEGIES = {
+    "words": ("word",),
+    "tokens": ("word",),
+    "sentences": ("sentence", "word"),
+    "paragraphs": ("paragraph", "sentence", "word"),
+    "recursive": ("paragraph", "line", "sentence", "word"),
+}
+
+# The embedder adds [CLS] and [SEP] and truncates anything longer
+MAX_CHUNK_TOKENS = MAX_SEQ_TOKENS - 2
+
+
+def resolve_config(strategy: str = None, size: int = None, overlap: int = None):
+    """
+    Fill in deployment defaults and validate a (strategy, size, overlap) choice.
+    Raises ValueError for an unknown strategy or an impossible size/overlap.
+    """
+    strategy = strategy or CHUNK_STRATEGY
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+
+    if strategy == "words":
+        size, overlap = size or 30, 5 if overlap is None else overlap
+    else:
+        size = min(size or CHUNK_SIZE, MAX_CHUNK_TOKENS)
+        overlap = min(CHUNK_OVERLAP, size // 4) if overlap is None else overlap
+    if size < 1 or not 0 <= overlap < size:
+        raise ValueError(f"Chunk overlap must be between 0 and the chunk size ({size}), got {overlap}")
+    return strategy, size, overlap
+
+
+def _split_stream(blocks, pattern):
+    """Split a stream of text blocks at pattern, carrying the unfinished last piece into the next block."""
+    carry = ""
+    for block in blocks:
+        parts = pattern.split(carry + block)
+        carry = parts.pop()
+        if len(carry) > MAX_UNIT_CHARS:
+            parts.append(carry)
+            carry = ""
+        for part in parts:
+            part = part.strip()
+            if part:
+                yield part
+    carry = carry.strip()
+    if carry:
+        yield carry
+
+
+def batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def word_windows(words, size: int = 30, overlap: int = 5):
+    """Fixed windows of size words, overlap words apart from the next; holds one window of words."""
+    step = size - overlap
+    window = []
+    for word in words:
+        window.append(word)
+        if len(window) == size:
+            yield " ".join(window)
+            del window[:step]
+    while window:
+        yield " ".join(window)
+        del window[:step]
+
+
+def _pack(units, levels: tuple, size: int, overlap: int):
+    """
+    Merge consecutive units (split at levels[0]) into chunks of at most size
+    tokens; the trailing units of a chunk, up to overlap tokens, start the next one.
+    Units over the budget are split at the next level instead.
+    """
+    joiner = _LEVELS[levels[0]][1]
+    window, total = deque(), 0
+    fresh = False  # window holds units that haven't been emitted yet
+
+    for batch in batched(units, COUNT_BATCH):
+        for unit, n in zip(batch, count_tokens(batch)):
+            n = int(n)
+            if n > size:
+                if fresh:
+                    yield joiner.join(text for text, _ in window)
+                window, total, fresh = deque(), 0, False
+                yield from _split_oversized(unit, n, levels[1:], size, overlap)
+                continue
+
+            if total + n > size:
+                if fresh:
+                    yield joiner.join(text for text, _ in window)
+                    fresh = False
+                while window and (total > overlap or total + n > size):
+                    total -= window.popleft()[1]
+            window.append((unit, n))
+            total += n
+            fresh = True
+
+    if fresh:
+        yield joiner.join(text for text, _ in window)
+
+
+def _split_oversized(unit: str, num_tokens: int, levels: tuple, size: int, overlap: int):
+    if levels:
+        yield from _pack(_split_stream([unit], _LEVELS[levels[0]][0]), levels, size, overlap)
+        return
+    # A single "word" over the budget (URLs, base64, ...): cut it into equal pieces
+    pieces = -(-num_tokens // size)
+    step = -(-len(unit) // pieces)
+    for start in range(0, len(unit), step):
+        yield unit[start:start + step]
+
+
+def chunk_blocks(blocks, strategy: str = None, size: int = None, overlap: int = None):
+    """
+    Yield the chunks of a document arriving as an iterable of text blocks.
+    Memory is bounded by one chunk window plus COUNT_BATCH pending units.
+    """
+    strategy, size, overlap = resolve_config(strategy, size, overlap)
+    levels = STRATEGIES[strategy]
+    units = _split_stream(blocks, _LEVELS[levels[0]][0])
+    if strategy == "words":
+        return word_windows(units, size, overlap)
+    return _pack(units, levels, size, overlap)
+
+
+def chunk_text(text: str, strategy: str = None, size: int = None, overlap: int = None):
+    return chunk_blocks([text], strategy, size, overlap)
+
+
+def chunk_file(path: str, strategy: str = None, size: int = None, overlap: int = None):
+    """Chunks of a utf-8 file on disk, read block by block."""
+    return chunk_blocks(iter_file_text(path), strategy, size, overlap)
@@ -2,14 +2,205 @@
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = ""  # force CPU
 
-from sentence_transformers import SentenceTransformer
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
 import numpy as np
 
+from app.services import metrics
+from app.services.metrics import Histogram
+from app.services import model_loader, model_client
+
 MODEL_NAME = "all-MiniLM-L6-v2"
 EMBEDDING_DIM = 384
+MAX_SEQ_TOKENS = 256  # all-MiniLM-L6-v2 truncates longer inputs (incl. [CLS] and [SEP])
+
+# ========= BACKEND CONFIG =========
+# "torch" = sentence-transformers on PyTorch; "onnx" / "onnx-int8" = the same
+# model exported to ONNX Runtime (fp32 / dynamic int8 weights), same tokenizer
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# ===================================
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# ========= BATCHING CONFIG =========
+BATCHING_ENABLED = os.getenv("EMBED_BATCHING", "1") == "1"
+BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))  # how long to wait for more requests
+MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH", "64"))           # texts per encode call
+# ===================================
+
+# Lanes in priority order: search queries go ahead of ingestion chunks
+LANES = ("interactive", "bulk")
+# Stage timed per lane, from the caller's side (includes waiting for a batch)
+LANE_STAGES = {"interactive": "embed_query", "bulk": "embed_bulk"}
+
+texts_embedded = {
+    lane: metrics.counter("rag_embedded_texts_total", "Texts embedded (sent to the model) per lane", lane=lane)
+    for lane in LANES
+}
+
+def load_embedder(backend: str = None):
+    """A new embedder for backend (default EMBEDDING_BACKEND); ONNX models are exported on first use"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {BACKENDS})")
+    if backend != "torch":
+        from app.services import embedding_onnx
+        return embedding_onnx.load(MODEL_NAME, quantize=backend == "onnx-int8")
+
+    # Imported here: sentence_transformers pulls in torch, which alone takes seconds
+    from sentence_transformers import SentenceTransformer
+    # Always load on CPU
+    return SentenceTransformer(MODEL_NAME, device="cpu")
+
+
+# Loaded on first use (or by model_loader.warmup), not at import
+_embedder = model_loader.register("embedding", load_embedder)
+
+
+def load_tokenizer():
+    """The embedder's tokenizer alone, without the model weights"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(f"sentence-transformers/{MODEL_NAME}")
+
+
+# Not registered (warmup doesn't load it): only used after use_tokenizer_only()
+_tokenizer = model_loader.LazyModel("tokenizer", load_tokenizer)
+_tokenizer_only = False
+
+
+def use_tokenizer_only():
+    """Count tokens in this process without loading the model (for processes that never embed)"""
+    global _tokenizer_only
+    _tokenizer_only = True
+
+
+def _encode(texts: list) -> np.ndarray:
+    with metrics.timed("model_encode"):
+        emb = _embedder.get().encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    return np.asarray(emb, dtype="float32").reshape(len(texts), EMBEDDING_DIM)
+
+
+class _Request:
+    def __init__(self, texts: list):
+        self.texts = texts
+        self.future = Future()
+        self.vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype="float32")
+        self.taken = 0    # texts handed to a batch so far
+        self.filled = 0   # texts whose vectors are back
+        self.enqueued_at = time.perf_counter()
+
 
-# Always load on CPU
-_embedder = SentenceTransformer(MODEL_NAME, device="cpu")
+class EmbeddingBatcher:
+    """
+    Collects embedding requests from concurrent callers for up to window_ms
+    (or until max_batch texts are waiting), runs one encode call for all of
+    them and hands each caller its own rows back. Large requests are split
+    across several batches; the interactive lane is always drained first.
+    """
+
+    def __init__(self, encode, window_ms: float, max_batch: int):
+        self._encode = encode
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._lanes = {lane: deque() for lane in LANES}
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self.batch_sizes = Histogram((1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self.queue_wait_ms = {
+            lane: Histogram((1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)) for lane in LANES
+        }
+
+    def submit(self, texts: list, lane: str = "bulk") -> Future:
+        request = _Request(texts)
+        if not texts:
+            request.future.set_result(request.vectors)
+            return request.future
+
+        with self._cond:
+            self._lanes[lane].append(request)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return request.future
+
+    def queue_depths(self) -> dict:
+        with self._cond:
+            return {lane: sum(len(r.texts) - r.taken for r in queue) for lane, queue in self._lanes.items()}
+
+    def _pending(self) -> int:
+        return sum(len(r.texts) - r.taken for queue in self._lanes.values() for r in queue)
+
+    def _take_batch(self) -> list:
+        """Pop up to max_batch texts as (request, start, end) slices, interactive lane first."""
+        batch, room = [], self.max_batch
+        now = time.perf_counter()
+        for lane in LANES:
+            queue = self._lanes[lane]
+            while queue and room:
+                request = queue[0]
+                if request.taken == 0:
+                    self.queue_wait_ms[lane].observe((now - request.enqueued_at) * 1000)
+                n = min(room, len(request.texts) - request.taken)
+                batch.append((request, request.taken, request.taken + n))
+                request.taken += n
+                room -= n
+                if request.taken == len(request.texts):
+                    queue.popleft()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending():
+                    self._cond.wait()
+                oldest = min(queue[0].enqueued_at for queue in self._lanes.values() if queue)
+                deadline = oldest + self.window
+                while self._pending() < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+
+            texts = [text for request, start, end in batch for text in request.texts[start:end]]
+            self.batch_sizes.observe(len(texts))
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                for request, _, _ in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request, start, end in batch:
+                request.vectors[start:end] = vectors[offset:offset + end - start]
+                offset += end - start
+                request.filled += end - start
+                if request.filled == len(request.texts) and not request.future.done():
+                    request.future.set_result(request.vectors)
+
+
+_batcher = EmbeddingBatcher(_encode, BATCH_WINDOW_MS, MAX_BATCH_SIZE)
+metrics.register("rag_embedding_batch_size", "Texts per model call of the embedding scheduler", _batcher.batch_sizes)
+for lane in LANES:
+    metrics.register("rag_embedding_queue_wait_ms", "Wait for a batch per lane", _batcher.queue_wait_ms[lane], lane=lane)
+
+
+def _embed(texts: list, lane: str) -> np.ndarray:
+    texts_embedded[lane].inc(len(texts))
+    with metrics.timed(LANE_STAGES[lane]):
+        if model_client.enabled():
+            return model_client.embed(texts, lane, EMBEDDING_DIM)
+        if not BATCHING_ENABLED:
+            return _encode(texts) if texts else np.zeros((0, EMBEDDING_DIM), dtype="float32")
+        return _batcher.submit(texts, lane).result()
 
 
 def get_embeddings(texts: list) -> np.ndarray:
@@ -22,8 +213,7 @@ def get_embeddings(texts: list) -> np.ndarray:
     if len(texts) == 0:
         return np.zeros((0, EMBEDDING_DIM), dtype="float32")
 
-    emb = _embedder.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-    return np.asarray(emb, dtype="float32")
+    return _embed(list(texts), "bulk")
 
 
 def get_single_embedding(text: str) -> np.ndarray:
@@ -31,5 +221,40 @@ def get_single_embedding(text: str) -> np.ndarray:
     Get embedding for a single text (query).
     Returns numpy float32 of shape (1, EMBEDDING_DIM).
     """
-    emb = _embedder.encode([text], convert_to_numpy=True, show_progress_bar=False)
-    return np.asarray(emb, dtype="float32").reshape(1, -1)
+    return _embed([text], "interactive").reshape(1, -1)
+
+
+def count_tokens(texts: list) -> np.ndarray:
+    """
+    Tokens per text under the embedder's tokenizer (no special tokens), in one
+    batched call. BERT-style tokenizers split on whitespace first, so the count
+    of a space-joined text is the sum of its parts' counts.
+    """
+    if not texts:
+        return np.zeros(0, dtype="int64")
+    if model_client.enabled():
+        return model_client.count_tokens(list(texts))
+    if _tokenizer_only and not _embedder.loaded:
+        tokenizer = _tokenizer.get()
+    else:
+        tokenizer = getattr(_embedder.get(), "tokenizer", None)
+    if tokenizer is None:
+        # Word and punctuation pieces: a lower bound of the word-piece count
+        return np.array([len(re.findall(r"\w+|[^\w\s]", text)) for text in texts], dtype="int64")
+    encoded = tokenizer(
+        list(texts), add_special_tokens=False, return_attention_mask=False, return_token_type_ids=False
+    )
+    return np.array([len(ids) for ids in encoded["input_ids"]], dtype="int64")
+
+
+def get_embedding_stats() -> dict:
+    """Batch-size and queue-wait histograms of the embedding scheduler"""
+    return {
+        "backend": EMBEDDING_BACKEND,
+        "batching_enabled": BATCHING_ENABLED,
+        "window_ms": BATCH_WINDOW_MS,
+        "max_batch_size": MAX_BATCH_SIZE,
+        "queue_depth": _batcher.queue_depths(),
+        "batch_size": _batcher.batch_sizes.snapshot(),
+        "queue_wait_ms": {lane: h.snapshot() for lane, h in _batcher.queue_wait_ms.items()},
+    }
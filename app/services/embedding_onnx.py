@@ -0,0 +1,143 @@
+# app/services/embedding_onnx.py
+import os
+import json
+
+import numpy as np
+
+# ========= CONFIG =========
+ONNX_DIR = os.getenv("EMBED_ONNX_DIR", "data/models/onnx")  # exported models, one folder per model
+ONNX_THREADS = int(os.getenv("EMBED_ONNX_THREADS", "0"))    # intra-op threads, 0 = onnxruntime default
+# ==========================
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedder.json"  # pooling / normalization / max length of the exported model
+
+
+def model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, model_name.strip("/").replace("/", "__"))
+
+
+def export(model_name: str, quantize: bool = False) -> str:
+    """
+    Export a sentence-transformers model to ONNX (plus a dynamic-int8 copy if
+    quantize) and return the model file to load. Exported files are cached in
+    model_dir(model_name) and reused; each file is written under a temporary
+    name and renamed, so an interrupted export is simply redone.
+    """
+    folder = model_dir(model_name)
+    fp32_path = os.path.join(folder, FP32_FILE)
+    path = os.path.join(folder, INT8_FILE if quantize else FP32_FILE)
+    if os.path.exists(path):
+        return path
+    if not os.path.exists(fp32_path):
+        _export_fp32(model_name, folder)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        tmp_path = os.path.join(folder, ".tmp-" + INT8_FILE)
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _export_fp32(model_name: str, folder: str):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    modules = {type(module).__name__: module for module in st_model}
+    if hasattr(modules["Pooling"], "get_pooling_mode_str"):
+        pooling = modules["Pooling"].get_pooling_mode_str()
+    else:  # sentence-transformers 6+
+        pooling = modules["Pooling"].get_config_dict()["pooling_mode"]
+    if pooling not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling}")
+
+    os.makedirs(folder, exist_ok=True)
+    # The tokenizer is saved next to the model: every backend tokenizes the same way
+    st_model.tokenizer.save_pretrained(folder)
+    with open(os.path.join(folder, CONFIG_FILE), "w") as f:
+        json.dump({
+            "pooling": pooling,
+            "normalize": "Normalize" in modules,
+            "max_seq_length": st_model.max_seq_length,
+        }, f)
+
+    transformer = st_model[0].auto_model.eval()
+    sample = st_model.tokenizer(["an export sample"], return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(names, inputs))).last_hidden_state
+
+    axes = {0: "batch", 1: "tokens"}
+    tmp_path = os.path.join(folder, ".tmp-" + FP32_FILE)
+    kwargs = dict(
+        input_names=names, output_names=["token_embeddings"],
+        dynamic_axes={name: axes for name in names + ["token_embeddings"]},
+        opset_version=14,
+    )
+    with torch.no_grad():
+        try:
+            torch.onnx.export(TokenEmbeddings(), tuple(sample[n] for n in names), tmp_path, dynamo=False, **kwargs)
+        except TypeError:  # torch < 2.5 has no dynamo switch
+            torch.onnx.export(TokenEmbeddings(), tuple(sample[n] for n in names), tmp_path, **kwargs)
+    os.replace(tmp_path, os.path.join(folder, FP32_FILE))
+
+
+class OnnxEmbedder:
+    """
+    Runs an exported model on ONNX Runtime behind the subset of the
+    SentenceTransformer interface embedding.py uses (encode, tokenizer),
+    with the same tokenizer, truncation, pooling and normalization.
+    """
+
+    def __init__(self, path: str):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        folder = os.path.dirname(path)
+        self.tokenizer = AutoTokenizer.from_pretrained(folder)
+        with open(os.path.join(folder, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+
+        options = ort.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, texts: list, batch_size: int = 32, **kwargs) -> np.ndarray:
+        # Longest first, like sentence-transformers: batches of similar length pad less
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        out = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            picks = order[start:start + batch_size]
+            batch = self.tokenizer(
+                [texts[i] for i in picks], padding=True, truncation=True,
+                max_length=self.config["max_seq_length"], return_tensors="np",
+            )
+            tokens = self.session.run(None, {name: batch[name].astype("int64") for name in self.input_names})[0]
+            for i, vector in zip(picks, self._pool(tokens, batch["attention_mask"])):
+                out[i] = vector
+        return np.stack(out).astype("float32") if out else np.zeros((0, 0), dtype="float32")
+
+    def _pool(self, tokens: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.config["pooling"] == "cls":
+            pooled = tokens[:, 0]
+        else:
+            mask = mask[:, :, None].astype(tokens.dtype)
+            pooled = (tokens * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+
+def load(model_name: str, quantize: bool = False) -> OnnxEmbedder:
+    """Export (first time only) and load the ONNX fp32 or dynamic-int8 model"""
+    return OnnxEmbedder(export(model_name, quantize))
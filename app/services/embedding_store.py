@@ -0,0 +1,353 @@
+# app/services/embedding_store.py
+import os
+import fcntl
+import hashlib
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.services import embedding
+from app.services.embedding import get_embeddings, EMBEDDING_DIM
+
+# ========= CONFIG =========
+STORE_ENABLED = os.getenv("EMBED_STORE", "1") == "1"
+STORE_DIR = os.getenv("EMBED_STORE_DIR", "data/embedding_store")
+# ==========================
+
+KEYS_FILENAME = "keys.bin"        # 16-byte content hashes, one per row
+VECTORS_FILENAME = "vectors.f32"  # float32 rows, same order as the keys
+CURRENT_FILENAME = "CURRENT"      # name of the generation folder holding the live files
+LOCK_FILENAME = "store.lock"      # held exclusively around appends and compaction
+OPEN_LOCK_FILENAME = "open.lock"  # held shared by every process that has the store open
+KEY_BYTES = 16
+
+
+def model_id() -> str:
+    """Vectors differ per model and backend, so both are part of the content key."""
+    return f"{embedding.MODEL_NAME}:{embedding.EMBEDDING_BACKEND}"
+
+
+def chunk_key(text: str, model: str = None) -> bytes:
+    digest = hashlib.blake2b(digest_size=KEY_BYTES)
+    digest.update((model or model_id()).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.digest()
+
+
+class EmbeddingStore:
+    """
+    Persistent content-addressed embeddings of one model: hash(model, chunk
+    text) → vector. vectors.f32 is append-only and memory-mapped for reads;
+    keys.bin holds the hash of each row and is loaded into a dict (the hash
+    index) when the store opens. Vectors are appended before their keys, so a
+    key on disk always has its vector, and after a crash the rows without a
+    key are dropped. Garbage collection writes a compacted generation folder
+    and swaps CURRENT to it.
+    Any number of processes (API workers, the bulk ingest and GC CLIs) share
+    the store: appends and compaction take an flock on store.lock, and the
+    rows and generations other processes wrote are picked up before every
+    lookup and append.
+    """
+
+    def __init__(self, folder: str, dim: int):
+        self.folder = folder
+        self.dim = dim
+        self._open_lock = self._hold_open_lock()
+        self._lock_file = open(os.path.join(folder, LOCK_FILENAME), "a")
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._count = 0
+        self._mapped = None
+        self._current_stat = None
+        self.hits = 0
+        self.misses = 0
+        self.removed = 0
+        with self._locked():
+            self._open_generation()
+            for name in os.listdir(self.folder):
+                if name.startswith("gen-") and name != self.generation:
+                    # Left by an interrupted GC
+                    shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+
+    def _hold_open_lock(self):
+        """
+        A shared flock on open.lock for the life of the store, so collect_garbage
+        of another model never deletes it while in use. Retried if the folder
+        was deleted between opening the file and getting the lock.
+        """
+        path = os.path.join(self.folder, OPEN_LOCK_FILENAME)
+        while True:
+            os.makedirs(self.folder, exist_ok=True)
+            lock_file = open(path, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path)):
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    @contextmanager
+    def _locked(self):
+        """The store's write lock, across processes; taken with self._lock held (or in __init__)."""
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _read_current(self):
+        """(stat key, generation name) of the CURRENT file."""
+        current = os.path.join(self.folder, CURRENT_FILENAME)
+        try:
+            st = os.stat(current)
+            with open(current) as f:
+                return (st.st_ino, st.st_mtime_ns), f.read().strip()
+        except FileNotFoundError:
+            return None, "gen-0"
+
+    def _open_generation(self):
+        """Point at the generation named in CURRENT and load it; called under the write lock."""
+        self._current_stat, generation = self._read_current()
+        os.makedirs(os.path.join(self.folder, generation), exist_ok=True)
+        self.generation = generation
+        self._number = int(generation[4:])
+        self.keys_file = os.path.join(self.folder, generation, KEYS_FILENAME)
+        self.vectors_file = os.path.join(self.folder, generation, VECTORS_FILENAME)
+        self._rows = {}
+        self._count = 0
+        self._mapped = None
+        self._load_new_rows(repair=True)
+
+    def _load_new_rows(self, repair: bool = False):
+        """
+        Add the keys appended since this process last looked to the hash index.
+        With repair (under the write lock) a torn tail left by a crash between
+        the two appends is cut off first.
+        """
+        row_bytes = self.dim * 4
+        keys_size = os.path.getsize(self.keys_file) if os.path.exists(self.keys_file) else 0
+        vectors_size = os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+        count = min(keys_size // KEY_BYTES, vectors_size // row_bytes)
+        if repair:
+            for path, size, length in (
+                (self.keys_file, keys_size, count * KEY_BYTES), (self.vectors_file, vectors_size, count * row_bytes)
+            ):
+                if size != length:
+                    os.truncate(path, length)
+        if count <= self._count:
+            return
+        with open(self.keys_file, "rb") as f:
+            f.seek(self._count * KEY_BYTES)
+            keys = np.frombuffer(f.read((count - self._count) * KEY_BYTES), dtype=f"V{KEY_BYTES}")
+        for row, key in enumerate(keys, start=self._count):
+            self._rows.setdefault(key.tobytes(), row)
+        self._count = count
+
+    def _refresh(self, locked: bool = False):
+        """
+        Catch up with other processes: their appends, or the generation their
+        GC switched to. locked: the caller holds the write lock (and is about to append).
+        """
+        if self._read_current()[0] == self._current_stat:
+            try:
+                self._load_new_rows(repair=locked)
+                return
+            except FileNotFoundError:
+                pass  # compacted and removed meanwhile
+        if locked:
+            self._open_generation()
+        else:
+            with self._locked():
+                self._open_generation()
+
+    def __len__(self):
+        return self._count
+
+    def _vectors(self) -> np.ndarray:
+        """Memory-mapped rows, re-mapped after appends."""
+        if self._mapped is None or len(self._mapped) < self._count:
+            self._mapped = (
+                np.memmap(self.vectors_file, dtype="float32", mode="r", shape=(self._count, self.dim))
+                if self._count else np.zeros((0, self.dim), dtype="float32")
+            )
+        return self._mapped
+
+    def lookup(self, keys: list):
+        """(vectors, found) for keys: found[i] is False where the store has no vector."""
+        with self._lock:
+            self._refresh()
+            rows = np.array([self._rows.get(key, -1) for key in keys], dtype="int64")
+            found = rows >= 0
+            vectors = np.zeros((len(keys), self.dim), dtype="float32")
+            if found.any():
+                vectors[found] = self._vectors()[rows[found]]
+            self.hits += int(found.sum())
+            self.misses += int(len(keys) - found.sum())
+        return vectors, found
+
+    def add(self, keys: list, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, self.dim)
+        with self._lock, self._locked():
+            self._refresh(locked=True)
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            with open(self.vectors_file, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+            with open(self.keys_file, "ab") as f:
+                f.write(b"".join(new))
+            for key in new:
+                self._rows[key] = self._count
+                self._count += 1
+
+    def collect_garbage(self, referenced: set, keep_from: int = None, generation: str = None) -> int:
+        """
+        Rewrite the store with only the referenced keys (plus rows added at or
+        after row keep_from, i.e. while the references were being collected).
+        generation is the one keep_from was read in; if another GC has run
+        since, nothing is removed. Returns the number of entries removed.
+        """
+        with self._lock, self._locked():
+            self._refresh(locked=True)
+            if generation is not None and generation != self.generation:
+                return 0
+            keep_from = self._count if keep_from is None else keep_from
+            keep = sorted(row for key, row in self._rows.items() if key in referenced or row >= keep_from)
+            removed = self._count - len(keep)
+            if not removed:
+                return 0
+
+            previous = self.generation
+            generation = f"gen-{self._number + 1}"
+            folder = os.path.join(self.folder, generation)
+            os.makedirs(folder, exist_ok=True)
+            keys = np.fromfile(self.keys_file, dtype=f"V{KEY_BYTES}", count=self._count)
+            vectors = self._vectors()
+            with open(os.path.join(folder, VECTORS_FILENAME), "wb") as f:
+                for start in range(0, len(keep), 65_536):
+                    f.write(np.ascontiguousarray(vectors[keep[start:start + 65_536]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(os.path.join(folder, KEYS_FILENAME), "wb") as f:
+                f.write(keys[keep].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Atomic switch: a crash before the rename keeps the old generation
+            current = os.path.join(self.folder, CURRENT_FILENAME)
+            with open(current + ".tmp", "w") as f:
+                f.write(generation)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(current + ".tmp", current)
+            self._open_generation()
+            # Other processes switch on their next lookup; a memory map they
+            # still hold stays readable after the files are removed
+            shutil.rmtree(os.path.join(self.folder, previous), ignore_errors=True)
+            self.removed += removed
+            return removed
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def stats(self) -> dict:
+        self.refresh()
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "size_mb": round(self._count * (self.dim * 4 + KEY_BYTES) / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "removed": self.removed,
+        }
+
+
+_store = None
+_store_guard = threading.Lock()
+
+
+def store_folder(model: str = None) -> str:
+    return os.path.join(STORE_DIR, (model or model_id()).strip("/").replace("/", "__").replace(":", "--"))
+
+
+def get_store():
+    """This process's store for the current model; None if disabled."""
+    global _store
+    if not STORE_ENABLED:
+        return None
+    if _store is None:
+        with _store_guard:
+            if _store is None:
+                _store = EmbeddingStore(store_folder(), EMBEDDING_DIM)
+    return _store
+
+
+def embed_chunks(texts: list) -> np.ndarray:
+    """
+    Embeddings of chunk texts, shape (len(texts), EMBEDDING_DIM). Chunks seen
+    before (by this model) come from the store; only new texts go to the
+    model, each distinct text once, and are added to the store.
+    """
+    store = get_store()
+    if store is None or not texts:
+        return get_embeddings(texts)
+
+    keys = [chunk_key(text) for text in texts]
+    vectors, found = store.lookup(keys)
+    if not found.all():
+        missing = {}
+        for i in np.flatnonzero(~found):
+            missing.setdefault(keys[i], []).append(i)
+        new_vectors = get_embeddings([texts[rows[0]] for rows in missing.values()])
+        for rows, vector in zip(missing.values(), new_vectors):
+            vectors[rows] = vector
+        store.add(list(missing), new_vectors)
+    return vectors
+
+
+def collect_garbage(live_texts) -> dict:
+    """
+    Drop stored embeddings whose text no live chunk has anymore (live_texts:
+    every chunk text still indexed, e.g. vectorstore.live_chunk_texts()), and
+    the folders of other models or backends.
+    """
+    store = get_store()
+    if store is None:
+        raise RuntimeError("Embedding store is disabled")
+
+    store.refresh()  # count the rows other processes added too
+    keep_from, generation = len(store), store.generation
+    model = model_id()
+    referenced = {chunk_key(text, model) for text in live_texts}
+    removed = store.collect_garbage(referenced, keep_from, generation)
+
+    other_models = 0
+    for name in os.listdir(STORE_DIR):
+        folder = os.path.join(STORE_DIR, name)
+        if folder == store_folder() or not os.path.isdir(folder):
+            continue
+        with open(os.path.join(folder, OPEN_LOCK_FILENAME), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # another process still embeds with that model
+            shutil.rmtree(folder, ignore_errors=True)
+            other_models += 1
+    return {"removed": removed, "kept": len(store), "other_models_removed": other_models}
+
+
+def get_embedding_store_stats() -> dict:
+    store = get_store()
+    if store is None:
+        return {"enabled": False, "reason": "disabled"}
+    return {"enabled": True, "model": model_id(), **store.stats()}
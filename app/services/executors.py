@@ -0,0 +1,175 @@
+# app/services/executors.py
+import os
+import asyncio
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.services import metrics
+from app.services.metrics import Histogram
+
+# ========= CONFIG =========
+# pool → (worker threads, requests allowed to wait for a worker)
+POOLS = {
+    "embedding": (int(os.getenv("EMBED_POOL_WORKERS", "4")), int(os.getenv("EMBED_POOL_QUEUE", "64"))),
+    "search": (int(os.getenv("SEARCH_POOL_WORKERS", "4")), int(os.getenv("SEARCH_POOL_QUEUE", "64"))),
+    "generation": (int(os.getenv("GENERATION_POOL_WORKERS", "1")), int(os.getenv("GENERATION_POOL_QUEUE", "8"))),
+}
+# ==========================
+
+ITERATE_BUFFER = 64  # items a pool thread may produce ahead of a slow consumer in iterate()
+
+
+class PoolSaturated(Exception):
+    """A pool's queue is full; the request should be retried later (HTTP 503)."""
+
+    def __init__(self, pool: str):
+        super().__init__(f"The {pool} pool is busy, try again shortly")
+        self.pool = pool
+
+
+class BoundedPool:
+    """
+    A thread pool that admits at most workers + max_queue tasks at a time and
+    rejects the rest with PoolSaturated instead of queueing without limit.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self.in_flight = 0   # admitted tasks, running or queued
+        self.running = 0
+        self.rejected = 0
+        self.completed = 0
+        self.queue_wait_ms = Histogram((1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+        metrics.register("rag_executor_queue_wait_ms", "Wait for a worker per pool", self.queue_wait_ms, pool=name)
+
+    def saturated(self) -> bool:
+        return self.in_flight >= self.workers + self.max_queue
+
+    def admit(self):
+        """Raise PoolSaturated now if a task submitted now would be rejected."""
+        if self.saturated():
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated(self.name)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.saturated():
+                self.rejected += 1
+                raise PoolSaturated(self.name)
+            self.in_flight += 1
+        # The task runs in the submitter's context, so its stages count towards the request's timings
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._run, time.perf_counter(), partial(fn, *args, **kwargs))
+
+    def _run(self, submitted_at: float, task):
+        waited = time.perf_counter() - submitted_at
+        self.queue_wait_ms.observe(waited * 1000)
+        metrics.add_request_timing(f"{self.name}_queue", waited)
+        with self._lock:
+            self.running += 1
+        try:
+            return task()
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.in_flight -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self.in_flight - self.running,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            }
+
+
+_pools = {name: BoundedPool(name, workers, max_queue) for name, (workers, max_queue) in POOLS.items()}
+
+
+def admit(*pools: str):
+    """Fail fast with PoolSaturated before starting work that will need these pools."""
+    for pool in pools:
+        _pools[pool].admit()
+
+
+async def run(pool: str, fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) run on a pool's threads; raises PoolSaturated if its queue is full."""
+    return await asyncio.wrap_future(_pools[pool].submit(fn, *args, **kwargs))
+
+
+async def iterate(pool: str, make_iter, *args, **kwargs):
+    """
+    Async iterator over a blocking iterator that runs on one of a pool's
+    threads, e.g. a streamed LLM answer. The thread stays at most
+    ITERATE_BUFFER items ahead of the consumer and, when the consumer stops
+    iterating (client disconnected), stops early and closes the iterator.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    slots = threading.Semaphore(ITERATE_BUFFER)
+    stop = threading.Event()
+    end = object()
+
+    def drain():
+        source = iter(make_iter(*args, **kwargs))
+        try:
+            for item in source:
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(items.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, (end, e))
+            return
+        finally:
+            # A generator left open would keep its work (and this thread) going
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+        loop.call_soon_threadsafe(items.put_nowait, (end, None))
+
+    _pools[pool].submit(drain)
+    try:
+        while True:
+            item, error = await items.get()
+            slots.release()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def get_executor_stats() -> dict:
+    return {name: pool.stats() for name, pool in _pools.items()}
+
+
+@metrics.collector
+def _pool_metrics():
+    found = []
+    for name, pool in _pools.items():
+        stats = pool.stats()
+        found.append(("rag_executor_running", "gauge", "Tasks running per pool", {"pool": name}, stats["running"]))
+        found.append(("rag_executor_queued", "gauge", "Tasks waiting per pool", {"pool": name}, stats["queued"]))
+        found.append((
+            "rag_executor_rejected_total", "counter", "Tasks rejected (pool saturated) per pool",
+            {"pool": name}, stats["rejected"],
+        ))
+    return found
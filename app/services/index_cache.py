@@ -0,0 +1,73 @@
+# app/services/index_cache.py
+import threading
+from collections import OrderedDict
+
+
+class IndexCache:
+    """
+    Thread-safe LRU cache of loaded per-user indexes with a memory budget.
+    Each entry is stored together with its estimated size in bytes; the least
+    recently used entries are evicted once the total exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes: int):
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                # Larger than the whole budget: serve it uncached
+                return
+            self._entries[key] = (value, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                self._remove(old_key)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def entries(self) -> list:
+        """(key, value, nbytes) of every cached entry, least recently used first"""
+        with self._lock:
+            return [(key, value, nbytes) for key, (value, nbytes) in self._entries.items()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
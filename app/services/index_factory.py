@@ -0,0 +1,252 @@
+# app/services/index_factory.py
+import os
+import faiss
+import numpy as np
+from app.services.embedding import EMBEDDING_DIM
+
+# ========= INDEX CONFIG =========
+INDEX_TYPE = os.getenv("VECTORSTORE_INDEX", "auto")   # "auto", "flat", "ivf_flat", "ivf_pq" or "hnsw"
+IVF_MIN_VECTORS = 20_000     # auto: switch from Flat to IVF-Flat at this many vectors
+PQ_MIN_VECTORS = 500_000     # auto: switch from IVF-Flat to IVF-PQ at this many vectors
+PQ_M = 48                    # PQ sub-quantizers (EMBEDDING_DIM must be divisible by it)
+HNSW_M = 32                  # HNSW graph degree
+DEFAULT_NPROBE = 16          # IVF lists visited per query unless the request overrides it
+DEFAULT_EF_SEARCH = 64       # HNSW candidate list size unless the request overrides it
+# How vectors are held in the index: "float32", "float16", "int8" (scalar quantized)
+# or "binary" (sign bits, Hamming distance, always a flat scan)
+VECTOR_STORAGE = os.getenv("VECTORSTORE_STORAGE", "float32")
+# Lossy indexes fetch top_k * RERANK_FACTOR candidates and re-rank them by exact
+# float32 distance from the stored vectors; 0 disables re-ranking
+RERANK_FACTOR = int(os.getenv("VECTORSTORE_RERANK_FACTOR", "4"))
+SHARD_COUNT = int(os.getenv("VECTORSTORE_SHARDS", "1"))   # indexes a large segment is split into
+SHARD_MIN_ROWS = 50_000       # rows per shard at least; smaller segments keep fewer shards
+ADD_BLOCK_VECTORS = 65_536    # vectors copied into an index per add call
+IVF_TRAIN_PER_LIST = 256      # IVF training uses at most this many sampled vectors per list
+# ================================
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+STORAGE_TYPES = ("float32", "float16", "int8", "binary")
+
+# Scalar quantizer suffix per storage mode. Embeddings are unit-norm, so int8
+# uses a fixed [-1, 1] range and never needs retraining as the corpus grows.
+_SQ_SUFFIX = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
+
+
+def ivf_nlist(num_vectors: int) -> int:
+    return max(16, int(np.sqrt(num_vectors)))
+
+
+def _min_train_size(kind: str, num_vectors: int) -> int:
+    """FAISS wants ~39 training points per centroid (and 256 codes per PQ sub-quantizer)."""
+    min_size = 39 * ivf_nlist(num_vectors)
+    if kind == "ivf_pq":
+        min_size = max(min_size, 39 * 256)
+    return min_size
+
+
+def choose_index_type(num_vectors: int) -> str:
+    """
+    Pick the index type for a corpus of this size.
+    IVF types fall back to Flat until there are enough vectors to train them.
+    """
+    kind = INDEX_TYPE
+    if VECTOR_STORAGE == "binary":
+        return "flat"
+    if kind == "auto":
+        if num_vectors >= PQ_MIN_VECTORS:
+            kind = "ivf_pq"
+        elif num_vectors >= IVF_MIN_VECTORS:
+            kind = "ivf_flat"
+        else:
+            kind = "flat"
+
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {kind}")
+    if kind in ("ivf_flat", "ivf_pq") and num_vectors < _min_train_size(kind, num_vectors):
+        kind = "flat"
+    return kind
+
+
+def storage_for(kind: str) -> str:
+    """PQ codes are already compressed; every other index type uses VECTOR_STORAGE."""
+    if VECTOR_STORAGE not in STORAGE_TYPES:
+        raise ValueError(f"Unknown vector storage: {VECTOR_STORAGE}")
+    return "float32" if kind == "ivf_pq" else VECTOR_STORAGE
+
+
+def _binarize(vectors: np.ndarray) -> np.ndarray:
+    return np.packbits(vectors > 0, axis=1)
+
+
+def build_index(kind: str, vectors: np.ndarray, ids: np.ndarray, storage: str = None):
+    """
+    Build (and train, if needed) an index of the given type over vectors/ids.
+    Every index type accepts explicit 64-bit ids: IVF natively, the others via IDMap2.
+    storage defaults to VECTOR_STORAGE.
+    """
+    n = len(vectors)
+    storage = storage or storage_for(kind)
+    if storage == "binary":
+        index = faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(EMBEDDING_DIM))
+        _add_vectors(index, vectors, ids)
+        return index
+
+    sq = _SQ_SUFFIX[storage]
+    if kind == "flat":
+        index = faiss.index_factory(EMBEDDING_DIM, f"IDMap2,{sq}")
+    elif kind == "hnsw":
+        hnsw = f"HNSW{HNSW_M}" if storage == "float32" else f"HNSW{HNSW_M},{sq}"
+        index = faiss.index_factory(EMBEDDING_DIM, f"IDMap2,{hnsw}")
+        faiss.downcast_index(index.index).hnsw.efSearch = DEFAULT_EF_SEARCH
+    elif kind == "ivf_flat":
+        index = faiss.index_factory(EMBEDDING_DIM, f"IVF{ivf_nlist(n)},{sq}")
+    elif kind == "ivf_pq":
+        index = faiss.index_factory(EMBEDDING_DIM, f"IVF{ivf_nlist(n)},PQ{PQ_M}")
+    else:
+        raise ValueError(f"Unknown index type: {kind}")
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        index.train(_training_sample(vectors, max(_min_train_size(kind, n), IVF_TRAIN_PER_LIST * ivf_nlist(n))))
+        index.nprobe = DEFAULT_NPROBE
+    elif storage == "int8":
+        unit_range = np.vstack([-np.ones(EMBEDDING_DIM), np.ones(EMBEDDING_DIM)]).astype("float32")
+        index.train(unit_range)
+    _add_vectors(index, vectors, ids)
+    return index
+
+
+def shard_count(num_vectors: int) -> int:
+    """How many shards a segment of this size is split into."""
+    return max(1, min(SHARD_COUNT, num_vectors // SHARD_MIN_ROWS))
+
+
+def build_shards(vectors: np.ndarray, ids: np.ndarray, num_shards: int = None) -> list:
+    """
+    Split vectors/ids into num_shards (default: shard_count) contiguous row ranges
+    and build an index over each, of the type its size calls for.
+    """
+    num_shards = num_shards or shard_count(len(vectors))
+    bounds = np.linspace(0, len(vectors), num_shards + 1).astype(int)
+    return [
+        build_index(choose_index_type(end - start), vectors[start:end], ids[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def _training_sample(vectors: np.ndarray, max_size: int) -> np.ndarray:
+    """An evenly random subset of (possibly mmapped) vectors, so training never loads them all."""
+    if len(vectors) <= max_size:
+        return np.ascontiguousarray(vectors, dtype="float32")
+    rows = np.sort(np.random.default_rng(0).choice(len(vectors), max_size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype="float32")
+
+
+def _add_vectors(index, vectors: np.ndarray, ids: np.ndarray):
+    """Add in ADD_BLOCK_VECTORS steps; vectors may be a memory-mapped view."""
+    for start in range(0, len(vectors), ADD_BLOCK_VECTORS):
+        block = np.ascontiguousarray(vectors[start:start + ADD_BLOCK_VECTORS], dtype="float32")
+        if isinstance(index, faiss.IndexBinary):
+            block = _binarize(block)
+        index.add_with_ids(block, np.ascontiguousarray(ids[start:start + ADD_BLOCK_VECTORS]))
+
+
+def index_type(index) -> str:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def index_storage(index) -> str:
+    if isinstance(index, faiss.IndexBinary):
+        return "binary"
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "float32"
+
+
+def index_nbytes(index) -> int:
+    """Approximate memory of an index: codes per vector plus id bookkeeping."""
+    code_size = {
+        "float32": index.d * 4,
+        "float16": index.d * 2,
+        "int8": index.d,
+        "binary": index.d // 8,  # IndexBinary.d is in bits
+    }[index_storage(index)]
+    per_vector = {
+        "flat": code_size,
+        "ivf_flat": code_size + 8,
+        "ivf_pq": PQ_M + 8,
+        "hnsw": code_size + HNSW_M * 2 * 4,
+    }[index_type(index)]
+    return index.ntotal * (per_vector + 16)
+
+
+def search_params(index, nprobe: int = None, ef_search: int = None, sel=None):
+    """
+    Per-request search knobs; None keeps the values stored in the index.
+    sel (an IDSelector) restricts the search to the ids it accepts.
+    """
+    kind = index_type(index)
+    if kind in ("ivf_flat", "ivf_pq") and (nprobe or sel is not None):
+        return faiss.SearchParametersIVF(nprobe=nprobe or faiss.extract_index_ivf(index).nprobe, sel=sel)
+    if kind == "hnsw" and (ef_search or sel is not None):
+        ef_search = ef_search or faiss.downcast_index(index.index).hnsw.efSearch
+        return faiss.SearchParametersHNSW(efSearch=ef_search, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def search_index(index, query_vecs: np.ndarray, top_k: int, params=None, exact_vectors=None):
+    """
+    Search index for each row of query_vecs; returns (distances, ids) like index.search.
+    For lossy indexes (float16 / int8 / binary storage, IVF-PQ) top_k * RERANK_FACTOR
+    candidates are fetched and re-ranked by exact float32 L2 distance.
+    exact_vectors(ids) must return (found_ids, float32 vectors) for the candidate ids.
+    """
+    lossy = index_storage(index) != "float32" or index_type(index) == "ivf_pq"
+    rerank = lossy and RERANK_FACTOR > 0 and exact_vectors is not None
+    fetch = top_k * RERANK_FACTOR if rerank else top_k
+
+    if isinstance(index, faiss.IndexBinary):
+        distances, ids = index.search(_binarize(query_vecs), fetch, params=params)
+        distances = distances.astype("float32")
+    else:
+        distances, ids = index.search(query_vecs, fetch, params=params)
+    if not rerank:
+        return distances, ids
+
+    out_distances = np.full((len(query_vecs), top_k), np.inf, dtype="float32")
+    out_ids = np.full((len(query_vecs), top_k), -1, dtype="int64")
+    for qi, query_vec in enumerate(query_vecs):
+        found_ids, vectors = exact_vectors(ids[qi][ids[qi] >= 0])
+        exact = ((vectors - query_vec) ** 2).sum(axis=1)
+        order = np.argsort(exact)[:top_k]
+        out_distances[qi, :len(order)] = exact[order]
+        out_ids[qi, :len(order)] = found_ids[order]
+    return out_distances, out_ids
+
+
+def read_index(index_file: str):
+    with open(index_file, "rb") as f:
+        binary = f.read(2) == b"IB"  # binary index fourccs start with "IB"
+    return faiss.read_index_binary(index_file) if binary else faiss.read_index(index_file)
+
+
+def save_index(index_file: str, index):
+    tmp_path = index_file + ".tmp"
+    if isinstance(index, faiss.IndexBinary):
+        faiss.write_index_binary(index, tmp_path)
+    else:
+        faiss.write_index(index, tmp_path)
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_file)
@@ -0,0 +1,193 @@
+# app/services/ingest.py
+import os
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal
+from app.models import User, Document, IngestJob
+from app.services.vectorstore import update_vectorstore, delete_from_vectorstore
+from app.services.chunker import chunk_file
+
+UPLOAD_DIR = "data/uploads"
+
+# ========= CONFIG =========
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))             # total background ingest threads
+INGEST_JOBS_PER_USER = int(os.getenv("INGEST_JOBS_PER_USER", "1"))  # concurrent jobs per user
+# A job claimed by a process on another host (DB on a shared volume) is taken
+# over once it hasn't changed state for this long
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "3600"))
+# ==========================
+
+JOB_STATES = ("queued", "chunking", "embedding", "indexing", "done", "failed")
+FINISHED_STATES = ("done", "failed")
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+# Jobs beyond a user's concurrency limit wait here instead of occupying a worker
+_lock = threading.Lock()
+_running = {}  # user_id → number of jobs submitted to the executor
+_pending = {}  # user_id → deque of job_ids
+
+
+def _process_start(pid: int):
+    """Start time of a process (clock ticks since boot), None if unknown; tells a reused pid apart"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name (field 2) may contain spaces: count fields after its closing ")"
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def worker_id() -> str:
+    """Owner tag of the jobs this process claims (computed per call: workers may be forked)"""
+    pid = os.getpid()
+    return f"{socket.gethostname()}:{pid}:{_process_start(pid)}"
+
+
+def owner_alive(owner: str, updated_at: datetime) -> bool:
+    """Whether the process that claimed a job may still be running it"""
+    parts = (owner or "").rsplit(":", 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return False  # claimed before owners were recorded
+    host, pid, start = parts
+    if host != socket.gethostname():
+        return updated_at is not None and datetime.utcnow() - updated_at < timedelta(seconds=INGEST_STALE_SECONDS)
+    if int(pid) == os.getpid():
+        return False  # a previous process with our pid (called at startup, before any claim of ours)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return start == "None" or _process_start(int(pid)) == start
+
+
+def upload_path(email: str, doc_id: int, doc_name: str) -> str:
+    return os.path.join(UPLOAD_DIR, email, f"{doc_id}_{doc_name}")
+
+
+def create_job(db, user_id: int, doc_id: int) -> IngestJob:
+    job = IngestJob(user_id=user_id, doc_id=doc_id, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def enqueue_job(job_id: int, user_id: int):
+    """Hand a queued job to the worker pool, respecting the per-user limit."""
+    with _lock:
+        if _running.get(user_id, 0) < INGEST_JOBS_PER_USER:
+            _running[user_id] = _running.get(user_id, 0) + 1
+            _executor.submit(_run_job, job_id, user_id)
+        else:
+            _pending.setdefault(user_id, deque()).append(job_id)
+
+
+def resume_pending_jobs():
+    """
+    Enqueue the jobs no live process is working on: queued ones, and in-flight
+    ones whose owner has died. Every worker calls this at startup; each job is
+    still run once, by the process that claims it (see _claim).
+    """
+    db = SessionLocal()
+    try:
+        jobs = (
+            db.query(IngestJob)
+            .filter(IngestJob.status.notin_(FINISHED_STATES))
+            .order_by(IngestJob.job_id)
+            .all()
+        )
+        pending = []
+        for job in jobs:
+            if job.status != "queued":
+                if owner_alive(job.owner, job.updated_at):
+                    continue
+                # Requeue only if nobody else did it (or finished it) meanwhile
+                same_owner = IngestJob.owner == job.owner if job.owner else IngestJob.owner.is_(None)
+                requeued = (
+                    db.query(IngestJob)
+                    .filter(IngestJob.job_id == job.job_id, IngestJob.status == job.status, same_owner)
+                    .update({"status": "queued", "owner": None}, synchronize_session=False)
+                )
+                db.commit()
+                if not requeued:
+                    continue
+            pending.append((job.job_id, job.user_id))
+    finally:
+        db.close()
+
+    for job_id, user_id in pending:
+        enqueue_job(job_id, user_id)
+    if pending:
+        print(f"Resumed {len(pending)} ingest job(s)")
+
+
+def _job_finished(user_id: int):
+    with _lock:
+        queue = _pending.get(user_id)
+        if queue:
+            _executor.submit(_run_job, queue.popleft(), user_id)
+        else:
+            _pending.pop(user_id, None)
+            _running[user_id] -= 1
+            if _running[user_id] == 0:
+                del _running[user_id]
+
+
+def _claim(db, job_id: int) -> bool:
+    """Atomically take a queued job for this process; False if another process has it (or it is gone)"""
+    claimed = (
+        db.query(IngestJob)
+        .filter(IngestJob.job_id == job_id, IngestJob.status == "queued")
+        .update({"status": "chunking", "owner": worker_id(), "updated_at": datetime.utcnow()},
+                synchronize_session=False)
+    )
+    db.commit()
+    return claimed == 1
+
+
+def _run_job(job_id: int, user_id: int):
+    db = SessionLocal()
+    try:
+        if not _claim(db, job_id):
+            return
+        job = db.query(IngestJob).filter(IngestJob.job_id == job_id).first()
+
+        def set_status(status: str, error: str = None):
+            job.status = status
+            job.error = error
+            db.commit()
+
+        try:
+            doc = db.query(Document).filter(Document.doc_id == job.doc_id).first()
+            if doc is None:
+                set_status("failed", "Document was deleted before it was indexed")
+                return
+            email = db.query(User.email).filter(User.user_id == job.user_id).scalar()
+            doc_id = doc.doc_id
+            file_path = upload_path(email, doc_id, doc.doc_name)
+            config = (doc.chunk_strategy, doc.chunk_size, doc.chunk_overlap)
+            # End the read transaction: no connection or snapshot is held while chunking and embedding
+            db.commit()
+
+            chunks = chunk_file(file_path, *config)
+            update_vectorstore(email, doc_id, chunks, on_stage=set_status)
+
+            # The document may have been deleted while it was being indexed
+            if db.query(Document.doc_id).filter(Document.doc_id == doc_id).first() is None:
+                delete_from_vectorstore(email, doc_id)
+
+            set_status("done")
+        except Exception as e:
+            print(f"Ingest job {job_id} failed: {e}")
+            db.rollback()
+            set_status("failed", str(e))
+    finally:
+        db.close()
+        _job_finished(user_id)
@@ -0,0 +1,221 @@
+# app/services/lexical.py
+import os
+import re
+import numpy as np
+
+# ========= BM25 CONFIG =========
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# ===============================
+
+# ========= FUSION CONFIG =========
+FUSION_MODES = ("dense", "rrf", "weighted")
+RRF_K = 60                                                            # reciprocal-rank fusion damping
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "0.5"))  # "weighted": dense share of the score
+HYBRID_CANDIDATES = 4    # each retriever contributes top_k * this many candidates to the fusion
+# =================================
+
+VOCAB_FILENAME = "lexical_vocab.txt"
+TERMS_FILENAME = "lexical_terms.npy"
+POSTINGS_FILENAME = "lexical_postings.npy"
+LENGTHS_FILENAME = "lexical_lengths.npy"
+
+BUILD_ROWS = 4096  # chunks tokenized per step while postings are built
+
+# Words, keeping identifiers like ERR-42, PN-7731, v1.2.3 or a/b/c together
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+_PARTS = re.compile(r"[-_./:]")
+
+# Per term: first posting and document frequency. Per posting: the row,
+# delta-encoded against the previous posting of the same term, and the term frequency.
+TERM_DTYPE = np.dtype([("start", "<i8"), ("df", "<u4")])
+POSTING_DTYPE = np.dtype([("delta", "<u4"), ("tf", "<u2")])
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased word tokens. Compound identifiers are indexed whole and by
+    their parts, so "ERR-42" is found by "err-42" as well as by "42".
+    """
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PARTS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def build_lexical(folder: str, texts, num_rows: int):
+    """
+    Write the BM25 postings of one segment. texts yields the text of row 0, 1, ...
+    Postings are built BUILD_ROWS rows at a time as (term, row) pairs and
+    counted with NumPy; the Python work is the tokenizing.
+    """
+    vocab = {}
+    lengths = np.zeros(num_rows, dtype="<u4")
+    keys, counts = [], []
+    term_ids, rows = [], []
+
+    def flush():
+        pairs = (np.array(term_ids, dtype="int64") << 32) | np.array(rows, dtype="int64")
+        unique, tf = np.unique(pairs, return_counts=True)
+        keys.append(unique)
+        counts.append(tf)
+        term_ids.clear()
+        rows.clear()
+
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[row] = len(tokens)
+        term_ids.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+        rows.extend([row] * len(tokens))
+        if (row + 1) % BUILD_ROWS == 0:
+            flush()
+    flush()
+
+    pairs = np.concatenate(keys)
+    tf = np.concatenate(counts)
+    order = np.argsort(pairs, kind="stable")
+    pairs, tf = pairs[order], tf[order]
+    term_of, row_of = pairs >> 32, pairs & 0xFFFFFFFF
+
+    terms = np.zeros(len(vocab), dtype=TERM_DTYPE)
+    terms["df"] = np.bincount(term_of, minlength=len(vocab))
+    terms["start"] = np.cumsum(terms["df"], dtype="int64") - terms["df"]
+
+    postings = np.zeros(len(pairs), dtype=POSTING_DTYPE)
+    deltas = np.diff(row_of, prepend=0)
+    first = terms["start"][terms["df"] > 0]
+    deltas[first] = row_of[first]  # each term's list starts from row 0
+    postings["delta"] = deltas
+    postings["tf"] = np.minimum(tf, np.iinfo("<u2").max)
+
+    with open(os.path.join(folder, VOCAB_FILENAME), "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    np.save(os.path.join(folder, TERMS_FILENAME), terms)
+    np.save(os.path.join(folder, POSTINGS_FILENAME), postings)
+    np.save(os.path.join(folder, LENGTHS_FILENAME), lengths)
+
+
+class LexicalIndex:
+    """
+    BM25 postings of one segment. The arrays are memory-mapped; the
+    vocabulary (term → term id) is read on the first query.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.terms = np.load(os.path.join(folder, TERMS_FILENAME), mmap_mode="r")
+        self.postings = np.load(os.path.join(folder, POSTINGS_FILENAME), mmap_mode="r")
+        self.lengths = np.load(os.path.join(folder, LENGTHS_FILENAME), mmap_mode="r")
+        self.total_length = int(self.lengths.sum(dtype="int64"))
+        self._vocab = None
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, POSTINGS_FILENAME))
+
+    @property
+    def vocab(self) -> dict:
+        if self._vocab is None:
+            with open(os.path.join(self.folder, VOCAB_FILENAME), encoding="utf-8") as f:
+                words = f.read().split("\n")
+            self._vocab = {word: i for i, word in enumerate(words)} if len(self.terms) else {}
+        return self._vocab
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def nbytes(self) -> int:
+        """Resident size is the vocabulary dict once loaded; postings are mmapped."""
+        return 100 * len(self._vocab) if self._vocab is not None else 0
+
+    def _term_postings(self, term_id: int):
+        """(rows, term frequencies) of one term's postings."""
+        start, df = int(self.terms[term_id]["start"]), int(self.terms[term_id]["df"])
+        postings = self.postings[start:start + df]
+        return np.cumsum(postings["delta"], dtype="int64"), postings["tf"]
+
+    def doc_freqs(self, terms: list, deleted: np.ndarray = None) -> np.ndarray:
+        """Rows containing each term, not counting the rows set in the deleted mask."""
+        df = np.zeros(len(terms), dtype="float64")
+        for n, term in enumerate(terms):
+            i = self.vocab.get(term, -1)
+            if i < 0:
+                continue
+            df[n] = self.terms[i]["df"]
+            if deleted is not None:
+                df[n] -= np.count_nonzero(deleted[self._term_postings(i)[0]])
+        return df
+
+    def score(self, terms: list, idf: np.ndarray, avgdl: float):
+        """BM25 score of every row containing a query term, as (rows, scores)."""
+        rows, contributions = [], []
+        for term, term_idf in zip(terms, idf):
+            i = self.vocab.get(term, -1)
+            if i < 0:
+                continue
+            term_rows, tf = self._term_postings(i)
+            tf = tf.astype("float64")
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[term_rows] / avgdl)
+            rows.append(term_rows)
+            contributions.append(term_idf * tf * (BM25_K1 + 1) / (tf + norm))
+        if not rows:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float64")
+        if len(rows) == 1:
+            return rows[0], contributions[0]  # one term's postings list each row once
+
+        # Sum per row over the matched postings only, never over every row of the segment
+        hit_rows, slots = np.unique(np.concatenate(rows), return_inverse=True)
+        return hit_rows, np.bincount(slots, weights=np.concatenate(contributions))
+
+
+def query_idf(indexes: list, terms: list, deleted: list = None):
+    """
+    (idf per term, average row length) over the live rows of all the given
+    segments, so their scores compare. deleted holds each index's deleted-row
+    mask, or None where nothing is deleted.
+    """
+    deleted = deleted or [None] * len(indexes)
+    num_rows = total_length = 0
+    df = np.zeros(len(terms), dtype="float64")
+    for index, mask in zip(indexes, deleted):
+        num_rows += len(index) - (np.count_nonzero(mask) if mask is not None else 0)
+        total_length += index.total_length - (int(index.lengths[mask].sum(dtype="int64")) if mask is not None else 0)
+        df += index.doc_freqs(terms, mask)
+    if not num_rows or not terms:
+        return np.zeros(len(terms)), 1.0
+    idf = np.log(1 + (num_rows - df + 0.5) / (df + 0.5))
+    avgdl = max(total_length / num_rows, 1.0)
+    return idf, avgdl
+
+
+def fuse(dense: list, lexical: list, mode: str, top_k: int) -> list:
+    """
+    Combine two ranked candidate lists into the top_k (vector_id, score) pairs.
+    dense is [(vector_id, distance)] (smaller is better), lexical is
+    [(vector_id, bm25)] (larger is better).
+      "rrf":      sum of 1 / (RRF_K + rank) over the lists a candidate appears in
+      "weighted": HYBRID_DENSE_WEIGHT * min-max scaled similarity + the rest * scaled BM25
+    """
+    scores = {}
+    if mode == "rrf":
+        for ranked in (dense, lexical):
+            for rank, (vector_id, _) in enumerate(ranked):
+                scores[vector_id] = scores.get(vector_id, 0.0) + 1 / (RRF_K + rank + 1)
+    elif mode == "weighted":
+        if dense:
+            distances = np.array([d for _, d in dense])
+            spread = distances.max() - distances.min()
+            for vector_id, d in dense:
+                similarity = float((distances.max() - d) / spread) if spread > 0 else 1.0
+                scores[vector_id] = HYBRID_DENSE_WEIGHT * similarity
+        if lexical:
+            best = max(s for _, s in lexical)
+            for vector_id, s in lexical:
+                scores[vector_id] = scores.get(vector_id, 0.0) + (1 - HYBRID_DENSE_WEIGHT) * float(s / best)
+    else:
+        raise ValueError(f"Unknown fusion mode: {mode}")
+
+    return sorted(scores.items(), key=lambda item: -item[1])[:top_k]
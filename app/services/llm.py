@@ -1,16 +1,66 @@
 import os
+import json
+import time
+import queue
+from threading import Thread, Event
+
+from app.services import metrics
+from app.services.metrics import Histogram
+from app.services import model_client
 
 # ========= CONFIG =========
 MODE = "offline"       # "online" or "offline"
 LIBRARY = "huggingface"   # "openai" or "huggingface"
+# Seconds the local streamer waits for the next token before giving up
+STREAM_TOKEN_TIMEOUT = float(os.getenv("LLM_STREAM_TIMEOUT_S", "60"))
 # ==========================
 
+# Streamed answers: time to the first token and generation speed, per request
+ttft_ms = Histogram((50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000))
+tokens_per_s = Histogram((1, 2, 5, 10, 20, 50, 100, 200, 500))
+metrics.register("rag_llm_ttft_ms", "Time to the first token of streamed answers", ttft_ms)
+metrics.register("rag_llm_tokens_per_second", "Generation speed of streamed answers", tokens_per_s)
+tokens_streamed = metrics.counter("rag_llm_streamed_tokens_total", "Tokens of streamed answers")
+
+
+def build_prompt(faiss_results, query, max_tokens=0, tokenizer=None, max_positions=None):
+    """
+    The prompt for query over the retrieved chunks. With a tokenizer, the
+    context (best chunks first) is cut so that the prompt plus max_tokens new
+    tokens fit in the model's max_positions.
+    """
+    context = "\n".join([res["chunk"] for res in faiss_results])
+    prompt = f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"
+    if tokenizer is None:
+        return prompt
+
+    limit = max_positions - max_tokens
+    context_ids = tokenizer.encode(context)
+    keep = len(context_ids)
+    # Decoding a cut token list and encoding it again may not give the same count: check and repeat
+    while True:
+        excess = len(tokenizer.encode(prompt)) - limit
+        if excess <= 0 or keep == 0:
+            return prompt
+        keep = max(keep - excess, 0)
+        context = tokenizer.decode(context_ids[:keep])
+        prompt = f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"
+
 
-# --- Base function (default stub) ---
+# --- Base functions (default stub) ---
 def generate_answer(faiss_results, query, temperature=0.2, max_tokens=50):
     return f"LLM call function not implemented for this MODE - LIBRARY :: {MODE} - {LIBRARY}"
 
 
+def _stream_pieces(faiss_results, query, temperature, max_tokens, usage=None):
+    """
+    Yield the answer in text pieces. A backend whose pieces are not one token
+    each sets usage["tokens"] (usage is a dict, if given) to the number of
+    tokens it generated.
+    """
+    yield generate_answer(faiss_results, query, temperature, max_tokens)
+
+
 # === OPENAI (online only) ===
 if LIBRARY == "openai" and MODE == "online":
     from openai import OpenAI
@@ -21,8 +71,7 @@ if LIBRARY == "openai" and MODE == "online":
     client = OpenAI(api_key=OPENAI_API_KEY)
 
     def generate_answer(faiss_results, query, temperature=0.2, max_tokens=50):
-        context = "\n".join([res["chunk"] for res in faiss_results])
-        prompt = f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"
+        prompt = build_prompt(faiss_results, query)
 
         response = client.chat.completions.create(
             model="gpt-4o-mini",  # you can change to "gpt-4o"
@@ -35,6 +84,21 @@ if LIBRARY == "openai" and MODE == "online":
         )
         return response.choices[0].message["content"]
 
+    def _stream_pieces(faiss_results, query, temperature, max_tokens, usage=None):
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant who answers strictly based on context."},
+                {"role": "user", "content": build_prompt(faiss_results, query)}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
 
 # === HUGGING FACE (online API) ===
 elif LIBRARY == "huggingface" and MODE == "online":
@@ -48,8 +112,7 @@ elif LIBRARY == "huggingface" and MODE == "online":
     HEADERS = {"Authorization": f"Bearer {HF_TOKEN}"}
 
     def generate_answer(faiss_results, query, temperature=0.2, max_tokens=50):
-        context = "\n".join([res["chunk"] for res in faiss_results])
-        prompt = f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"
+        prompt = build_prompt(faiss_results, query)
 
         payload = {
             "inputs": prompt,
@@ -65,18 +128,54 @@ elif LIBRARY == "huggingface" and MODE == "online":
         result = response.json()
         return result[0]["generated_text"][len(prompt):].strip()
 
+    def _stream_pieces(faiss_results, query, temperature, max_tokens, usage=None):
+        # Text-generation-inference models stream one server-sent event per token
+        payload = {
+            "inputs": build_prompt(faiss_results, query),
+            "parameters": {
+                "temperature": temperature,
+                "max_new_tokens": max_tokens,
+                "do_sample": True
+            },
+            "stream": True
+        }
+        with requests.post(API_URL, headers=HEADERS, json=payload, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                token = event.get("token") or {}
+                if not token.get("special"):
+                    yield token.get("text", "")
+
 
 # === HUGGING FACE (offline/local) ===
 elif LIBRARY == "huggingface" and MODE == "offline":
-    from transformers import pipeline
+    from app.services import model_loader
 
     # NOTE: only small models will work with 4GB RAM
     HF_MODEL = "distilgpt2"
-    generator = pipeline("text-generation", model=HF_MODEL)
+
+    def _load_generator():
+        # Imported here: transformers (and torch) take seconds to import
+        from transformers import pipeline
+        return pipeline("text-generation", model=HF_MODEL)
+
+    # Loaded on first use (or by model_loader.warmup), not at import
+    _generator = model_loader.register("llm", _load_generator)
+
+    def _prompt(generator, faiss_results, query, max_tokens):
+        """build_prompt cut to the model's context window (1024 positions for distilgpt2)"""
+        max_positions = getattr(generator.model.config, "max_position_embeddings", None)
+        return build_prompt(
+            faiss_results, query, max_tokens, generator.tokenizer,
+            max_positions or generator.tokenizer.model_max_length,
+        )
 
     def generate_answer(faiss_results, query, temperature=0.2, max_tokens=50):
-        context = "\n".join([res["chunk"] for res in faiss_results])
-        prompt = f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"
+        generator = _generator.get()
+        prompt = _prompt(generator, faiss_results, query, max_tokens)
 
         outputs = generator(
             prompt,
@@ -86,3 +185,114 @@ elif LIBRARY == "huggingface" and MODE == "offline":
         )
 
         return outputs[0]["generated_text"][len(prompt):].strip()
+
+    def _stream_pieces(faiss_results, query, temperature, max_tokens, usage=None):
+        from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+
+        # The streamer hands over whole words, so the generated token ids are counted as they arrive
+        usage = {} if usage is None else usage
+        usage["tokens"] = 0
+
+        class CountingStreamer(TextIteratorStreamer):
+            def put(self, value):
+                if not (self.skip_prompt and self.next_tokens_are_prompt):
+                    usage["tokens"] += int(value.numel())
+                super().put(value)
+
+        # generate() runs in a thread and hands decoded text to the streamer as
+        # it goes; it stops at the next token once the consumer goes away
+        generator = _generator.get()
+        streamer = CountingStreamer(
+            generator.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT
+        )
+        stop = Event()
+        errors = []
+
+        class StopWhenClosed(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return stop.is_set()
+
+        def generate(prompt):
+            try:
+                generator(
+                    prompt,
+                    max_new_tokens=max_tokens,
+                    temperature=temperature,
+                    do_sample=True,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([StopWhenClosed()]),
+                )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                streamer.end()  # a failed generate() never ends the stream itself
+
+        worker = Thread(target=generate, args=(_prompt(generator, faiss_results, query, max_tokens),), daemon=True)
+        worker.start()
+        try:
+            try:
+                yield from streamer
+            except queue.Empty:
+                raise TimeoutError(f"{HF_MODEL} produced no token in {STREAM_TOKEN_TIMEOUT:g}s") from None
+            worker.join()
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+
+
+# With MODEL_SERVER_SOCKET set, answers come from the shared model server
+_local_generate_answer = generate_answer
+
+
+def generate_answer(faiss_results, query, temperature=0.2, max_tokens=50):
+    with metrics.timed("generate"):
+        if model_client.enabled():
+            return model_client.generate(faiss_results, query, temperature, max_tokens)
+        return _local_generate_answer(faiss_results, query, temperature, max_tokens)
+
+
+def stream_answer(faiss_results, query, temperature=0.2, max_tokens=50, stats=None):
+    """
+    Yield the answer in text pieces as the backend produces them. When the
+    stream ends, stats (a dict, if given) gets ttft_ms, tokens and
+    tokens_per_s; these are also recorded in the ttft_ms / tokens_per_s
+    histograms. tokens is the count of generated tokens the backend reports
+    (the local model: one piece per decoded word), else the count of pieces
+    (the remote APIs send one per token).
+    """
+    start = time.perf_counter()
+    first = None
+    num_pieces = 0
+    usage = {}
+    stream_pieces = model_client.stream_generate if model_client.enabled() else _stream_pieces
+    pieces = stream_pieces(faiss_results, query, temperature, max_tokens, usage)
+    try:
+        for piece in pieces:
+            if not piece:
+                continue
+            if first is None:
+                first = time.perf_counter()
+            num_pieces += 1
+            yield piece
+    finally:
+        pieces.close()  # stops generation when the consumer stops early
+    end = time.perf_counter()
+    tokens = usage.get("tokens", num_pieces)
+
+    first = first or end
+    result = {
+        "ttft_ms": round((first - start) * 1000, 1),
+        "tokens": tokens,
+        "tokens_per_s": round(tokens / (end - first), 1) if end > first else None,
+    }
+    ttft_ms.observe(result["ttft_ms"])
+    tokens_streamed.inc(tokens)
+    if result["tokens_per_s"] is not None:
+        tokens_per_s.observe(result["tokens_per_s"])
+    if stats is not None:
+        stats.update(result)
+
+
+def get_llm_stats() -> dict:
+    return {"ttft_ms": ttft_ms.snapshot(), "tokens_per_s": tokens_per_s.snapshot()}
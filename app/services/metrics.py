@@ -0,0 +1,259 @@
+# app/services/metrics.py
+import os
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+# ========= CONFIG =========
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # per-request stage breakdown in a Server-Timing header
+# ==========================
+
+# Seconds; stages range from sub-millisecond lookups to multi-second generation
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram with fixed upper bounds (Prometheus style:
+    each bucket counts observations <= its bound, plus an implicit +Inf bucket).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def collect(self):
+        """(bound, cumulative count) per bucket including "+Inf", the sum and the count"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets + ("+Inf",), counts):
+            running += n
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+    def snapshot(self) -> dict:
+        cumulative, total, count = self.collect()
+        return {"buckets": {str(bound): n for bound, n in cumulative}, "count": count, "sum": round(total, 3)}
+
+
+class Counter:
+    """Thread-safe monotonically increasing value"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+# ===== Registry (exposed at /metrics in the Prometheus text format) =====
+
+_families = {}       # name → {"kind", "help", "series": {label tuple: metric}}
+_collectors = []     # functions read at scrape time, see collector()
+_registry_lock = threading.Lock()
+
+
+def _child(name: str, kind: str, help: str, labels: dict, make):
+    key = tuple(labels.items())
+    with _registry_lock:
+        family = _families.setdefault(name, {"kind": kind, "help": help, "series": {}})
+        if key not in family["series"]:
+            family["series"][key] = make()
+        return family["series"][key]
+
+
+def histogram(name: str, help: str, buckets=STAGE_BUCKETS, **labels) -> Histogram:
+    """The histogram of name with these labels, created on first use"""
+    return _child(name, "histogram", help, labels, lambda: Histogram(buckets))
+
+
+def counter(name: str, help: str, **labels) -> Counter:
+    """The counter of name with these labels, created on first use"""
+    return _child(name, "counter", help, labels, Counter)
+
+
+def register(name: str, help: str, metric, **labels):
+    """Expose an existing Histogram or Counter under name with these labels"""
+    kind = "histogram" if isinstance(metric, Histogram) else "counter"
+    return _child(name, kind, help, labels, lambda: metric)
+
+
+def collector(fn):
+    """
+    Register fn, called at every scrape, returning [(name, kind, help, labels, value)]
+    for values that are cheaper to read when asked than to keep updated
+    (gauges such as index sizes). Usable as a decorator.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+# ===== Stage timing =====
+
+# Seconds per stage of the current request, if it is being timed (see TimingMiddleware).
+# Thread pools that copy the context (executors.run, FastAPI's threadpool) record into it too.
+_request_timings = ContextVar("request_timings", default=None)
+_stages = {}
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record one run of a stage: rag_stage_seconds{stage} and the request's Server-Timing"""
+    hist = _stages.get(stage)
+    if hist is None:
+        hist = _stages[stage] = histogram("rag_stage_seconds", "Time spent per processing stage", stage=stage)
+    hist.observe(seconds)
+    add_request_timing(stage, seconds)
+
+
+def add_request_timing(name: str, seconds: float):
+    """Add to the current request's Server-Timing breakdown only (no histogram)"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class timed:
+    """`with timed("stage"):` records the block's duration with observe_stage (a class: cheaper than a generator)"""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.stage, time.perf_counter() - self.start)
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware recording latency and count per route and status, and,
+    with SERVER_TIMING, adding the request's stage timings as a Server-Timing
+    header (streamed responses only include the stages before their first byte).
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        timings = {}
+        token = _request_timings.set(timings)
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = _server_timing_header(timings, time.perf_counter() - start)
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _request_timings.reset(token)
+            # The route template (not the raw path) keeps the label set small
+            route = getattr(scope.get("route"), "path", "unmatched")
+            histogram(
+                "rag_http_request_seconds", "Request latency per route", route=route, method=scope["method"]
+            ).observe(time.perf_counter() - start)
+            counter(
+                "rag_http_requests_total", "Requests per route and status",
+                route=route, method=scope["method"], status=str(status),
+            ).inc()
+
+
+def _server_timing_header(timings: dict, total: float) -> bytes:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in list(timings.items())]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+# ===== Process gauges =====
+
+@collector
+def _process_metrics():
+    cpu = os.times()
+    found = [("process_cpu_seconds_total", "counter", "User and system CPU time", {}, cpu.user + cpu.system)]
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        found.append(("process_resident_memory_bytes", "gauge", "Resident memory size", {}, rss))
+    except (OSError, ValueError):
+        pass  # not Linux
+    return found
+
+
+# ===== Prometheus text exposition =====
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        key + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value) -> str:
+    if value == "+Inf":
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text format (version 0.0.4)"""
+    lines = []
+    with _registry_lock:
+        families = [(name, dict(family, series=dict(family["series"]))) for name, family in _families.items()]
+
+    for name, family in families:
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for labels, metric in family["series"].items():
+            if family["kind"] == "counter":
+                lines.append(f"{name}{_labels(labels)} {_number(metric.value)}")
+                continue
+            cumulative, total, count = metric.collect()
+            for bound, n in cumulative:
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {n}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(float(total))}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    # Samples of one name must be consecutive, whichever collectors return them
+    collected = {}
+    for fn in list(_collectors):
+        for name, kind, help, labels, value in fn():
+            collected.setdefault(name, (kind, help, []))[2].append((labels, value))
+    for name, (kind, help, samples) in collected.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(tuple(labels.items()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,189 @@
+# app/services/model_client.py
+import os
+import json
+import socket
+import struct
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# ========= CONFIG =========
+# Unix socket of a shared model server (python -m app.cli.model_server).
+# Set it and this process embeds and generates through that server instead of
+# loading its own copy of the models; unset = models load in-process.
+SOCKET_PATH = os.getenv("MODEL_SERVER_SOCKET")
+SHM_MB = float(os.getenv("MODEL_SERVER_SHM_MB", "8"))  # per-connection buffer for embedding results
+TIMEOUT_S = float(os.getenv("MODEL_SERVER_TIMEOUT_S", "300"))
+# ==========================
+
+# Frame: 1-byte op (request) or status (response), 4-byte payload length, payload
+HEADER = struct.Struct("<BI")
+COUNT = struct.Struct("<I")
+EMBED_REPLY = struct.Struct("<IB")  # rows, 1 = vectors are in the shared buffer / 0 = inline
+
+# Ops
+HELLO, EMBED, TOKENS, GENERATE, STREAM, STATUS = range(1, 7)
+# Statuses
+OK, PIECE, ERROR = range(3)
+
+LANES = ("interactive", "bulk")
+
+
+class ModelServerError(Exception):
+    """The model server failed the request (the message is the server-side error)."""
+
+
+def enabled() -> bool:
+    return bool(SOCKET_PATH)
+
+
+# --- framing (shared with the server) ---
+def recv_exact(sock, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while n:
+        got = sock.recv_into(view[len(buf) - n:], n)
+        if not got:
+            raise ConnectionError("model server connection closed")
+        n -= got
+    return bytes(buf)
+
+
+def send_frame(sock, code: int, payload: bytes = b""):
+    sock.sendall(HEADER.pack(code, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    code, size = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return code, recv_exact(sock, size) if size else b""
+
+
+def pack_texts(texts: list) -> bytes:
+    parts = [COUNT.pack(len(texts))]
+    for text in texts:
+        data = text.encode("utf-8")
+        parts.append(COUNT.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def unpack_texts(payload: bytes, offset: int = 0) -> list:
+    (count,), offset = COUNT.unpack_from(payload, offset), offset + COUNT.size
+    texts = []
+    for _ in range(count):
+        (size,), offset = COUNT.unpack_from(payload, offset), offset + COUNT.size
+        texts.append(payload[offset:offset + size].decode("utf-8"))
+        offset += size
+    return texts
+
+
+# --- client ---
+def _close(sock, shm):
+    sock.close()
+    shm.close()
+    shm.unlink()
+
+
+class _Connection:
+    """
+    One socket to the model server plus the shared-memory buffer the server
+    writes embedding results into. Used by one thread at a time.
+    """
+
+    def __init__(self, path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(TIMEOUT_S)
+        self.sock.connect(path)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(int(SHM_MB * 1024 * 1024), 4096))
+        self._finalizer = weakref.finalize(self, _close, self.sock, self.shm)
+        self.call(HELLO, self.shm.name.encode("utf-8"))
+
+    def call(self, op: int, payload: bytes = b"") -> bytes:
+        send_frame(self.sock, op, payload)
+        status, reply = recv_frame(self.sock)
+        if status == ERROR:
+            raise ModelServerError(reply.decode("utf-8"))
+        return reply
+
+    def close(self):
+        self._finalizer()
+
+
+_local = threading.local()
+
+
+def _connection() -> _Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _Connection(SOCKET_PATH)
+    return conn
+
+
+def _request(fn):
+    """Run fn(conn); a broken connection is dropped so the next call reconnects."""
+    conn = _connection()
+    try:
+        return fn(conn)
+    except (OSError, ConnectionError):
+        _local.conn = None
+        conn.close()
+        raise
+
+
+def embed(texts: list, lane: str, dim: int) -> np.ndarray:
+    """Embeddings of texts from the model server, shape (len(texts), dim) float32"""
+    def call(conn):
+        reply = conn.call(EMBED, bytes([LANES.index(lane)]) + pack_texts(texts))
+        rows, in_shm = EMBED_REPLY.unpack_from(reply)
+        if in_shm:
+            return np.ndarray((rows, dim), dtype="float32", buffer=conn.shm.buf).copy()
+        return np.frombuffer(reply, dtype="float32", offset=EMBED_REPLY.size).reshape(rows, dim).copy()
+    return _request(call)
+
+
+def count_tokens(texts: list) -> np.ndarray:
+    return _request(lambda conn: np.frombuffer(conn.call(TOKENS, pack_texts(texts)), dtype="int64").copy())
+
+
+def _generate_payload(faiss_results, query, temperature, max_tokens) -> bytes:
+    return json.dumps({
+        "faiss_results": faiss_results, "query": query,
+        "temperature": temperature, "max_tokens": max_tokens,
+    }).encode("utf-8")
+
+
+def generate(faiss_results, query, temperature, max_tokens) -> str:
+    payload = _generate_payload(faiss_results, query, temperature, max_tokens)
+    return _request(lambda conn: conn.call(GENERATE, payload).decode("utf-8"))
+
+
+def stream_generate(faiss_results, query, temperature, max_tokens, usage=None):
+    """
+    Yield answer pieces as the server produces them (PIECE frames until OK);
+    the OK frame carries the backend's usage (see llm._stream_pieces).
+    """
+    conn = _connection()
+    try:
+        send_frame(conn.sock, STREAM, _generate_payload(faiss_results, query, temperature, max_tokens))
+        while True:
+            status, reply = recv_frame(conn.sock)
+            if status == PIECE:
+                yield reply.decode("utf-8")
+            elif status == ERROR:
+                raise ModelServerError(reply.decode("utf-8"))
+            else:
+                if usage is not None and reply:
+                    usage.update(json.loads(reply))
+                return
+    except BaseException:
+        # a stream abandoned half-way leaves frames on the socket: don't reuse it
+        _local.conn = None
+        conn.close()
+        raise
+
+
+def status() -> dict:
+    """Model load status reported by the server"""
+    return _request(lambda conn: json.loads(conn.call(STATUS)))
@@ -0,0 +1,93 @@
+# app/services/model_loader.py
+import os
+import threading
+import time
+
+from app.services import model_client
+
+# ========= CONFIG =========
+WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"  # preload models in the background at server startup
+# ==========================
+
+
+class LazyModel:
+    """
+    A model that is loaded on first use instead of at import time. get() is
+    thread-safe: concurrent first callers wait for a single load.
+    """
+
+    def __init__(self, name: str, load):
+        self.name = name
+        self._load = load
+        self._lock = threading.Lock()
+        self._model = None
+        self.load_seconds = None
+        self.error = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    try:
+                        model = self._load()
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.load_seconds = round(time.perf_counter() - start, 2)
+                    self.error = None
+                    self._model = model
+                    print(f"Loaded {self.name} model in {self.load_seconds}s")
+        return self._model
+
+    def status(self) -> dict:
+        return {"loaded": self.loaded, "load_seconds": self.load_seconds, "error": self.error}
+
+
+_models = {}
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def register(name: str, load) -> LazyModel:
+    """Declare a lazily loaded model; load() is called on its first get()"""
+    model = LazyModel(name, load)
+    _models[name] = model
+    return model
+
+
+def load_all():
+    """Load every registered model now (blocking)"""
+    for model in list(_models.values()):
+        try:
+            model.get()
+        except Exception as e:
+            print(f"Failed to load {model.name} model: {e}")
+
+
+def warmup():
+    """Start loading every registered model on a background thread (once)"""
+    global _warmup_thread
+    if model_client.enabled():
+        return  # the model server loads (and warms) the models
+    with _warmup_lock:
+        if _warmup_thread is None or (not _warmup_thread.is_alive() and not is_ready()):
+            _warmup_thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def is_ready() -> bool:
+    return all(status["loaded"] for status in get_model_status().values())
+
+
+def get_model_status() -> dict:
+    if model_client.enabled():
+        try:
+            return model_client.status()
+        except (OSError, model_client.ModelServerError) as e:
+            return {"model_server": {"loaded": False, "load_seconds": None, "error": str(e)}}
+    return {name: model.status() for name, model in _models.items()}
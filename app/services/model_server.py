@@ -0,0 +1,109 @@
+# app/services/model_server.py
+import os
+import json
+import socketserver
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from app.services import embedding, llm, model_client, model_loader
+from app.services.model_client import (
+    EMBED_REPLY, HELLO, EMBED, TOKENS, GENERATE, STREAM, STATUS, OK, PIECE, ERROR,
+    LANES, recv_frame, send_frame, unpack_texts,
+)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to a client's buffer without taking ownership of it (the client unlinks it)."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One client connection (one API worker thread); requests are served in order."""
+
+    def handle(self):
+        self.shm = None
+        try:
+            while True:
+                try:
+                    op, payload = recv_frame(self.request)
+                except ConnectionError:
+                    return
+                try:
+                    self.dispatch(op, payload)
+                except (OSError, ConnectionError):
+                    return
+                except Exception as e:
+                    send_frame(self.request, ERROR, f"{type(e).__name__}: {e}".encode("utf-8"))
+        finally:
+            if self.shm is not None:
+                self.shm.close()
+
+    def dispatch(self, op: int, payload: bytes):
+        if op == HELLO:
+            self.shm = _attach(payload.decode("utf-8"))
+            send_frame(self.request, OK)
+        elif op == EMBED:
+            vectors = embedding._embed(unpack_texts(payload, 1), LANES[payload[0]])
+            vectors = np.ascontiguousarray(vectors, dtype="float32")
+            if self.shm is not None and vectors.nbytes <= self.shm.size:
+                np.ndarray(vectors.shape, dtype="float32", buffer=self.shm.buf)[:] = vectors
+                send_frame(self.request, OK, EMBED_REPLY.pack(len(vectors), 1))
+            else:
+                send_frame(self.request, OK, EMBED_REPLY.pack(len(vectors), 0) + vectors.tobytes())
+        elif op == TOKENS:
+            counts = embedding.count_tokens(unpack_texts(payload))
+            send_frame(self.request, OK, np.asarray(counts, dtype="int64").tobytes())
+        elif op == GENERATE:
+            args = json.loads(payload)
+            answer = llm.generate_answer(args["faiss_results"], args["query"], args["temperature"], args["max_tokens"])
+            send_frame(self.request, OK, answer.encode("utf-8"))
+        elif op == STREAM:
+            args = json.loads(payload)
+            usage = {}
+            pieces = llm._stream_pieces(
+                args["faiss_results"], args["query"], args["temperature"], args["max_tokens"], usage
+            )
+            try:
+                for piece in pieces:
+                    send_frame(self.request, PIECE, piece.encode("utf-8"))
+            finally:
+                pieces.close()  # the client went away: stop generating
+            send_frame(self.request, OK, json.dumps(usage).encode("utf-8"))
+        elif op == STATUS:
+            send_frame(self.request, OK, json.dumps(model_loader.get_model_status()).encode("utf-8"))
+        else:
+            raise ValueError(f"unknown op {op}")
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path: str):
+    """
+    Serve the embedding and LLM models of this process to API workers over a
+    Unix socket. Embedding requests from all workers go through this process's
+    batcher, so concurrent workers share batches as well as the model weights.
+    """
+    # This process holds the models: never forward to another server
+    model_client.SOCKET_PATH = None
+
+    if os.path.exists(path):
+        os.unlink(path)  # stale socket from a previous run
+    server = ModelServer(path, _Handler)
+    os.chmod(path, 0o660)
+    model_loader.warmup()
+    print(f"Model server listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
@@ -0,0 +1,150 @@
+# app/services/query_cache.py
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.services.embedding import get_single_embedding, get_embeddings
+from app.services.embedding_store import model_id
+
+# ========= CONFIG =========
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", "3600"))
+EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "10000"))     # level 1 entries
+RESULT_CACHE_SIZE = int(os.getenv("QUERY_RESULT_CACHE_SIZE", "10000"))   # level 2 entries
+QUERY_CACHE_FILE = os.getenv("QUERY_CACHE_FILE")  # e.g. "data/query_cache.pkl"; unset = memory only
+# ==========================
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl seconds after insertion."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def drop_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+    def dump(self) -> list:
+        now = time.time()
+        with self._lock:
+            return [(key, value, expires_at) for key, (value, expires_at) in self._entries.items() if expires_at >= now]
+
+    def restore(self, entries: list):
+        now = time.time()
+        with self._lock:
+            for key, value, expires_at in entries:
+                if expires_at >= now:
+                    self._entries[key] = (value, expires_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Level 1: (embedding model, normalized query text) → embedding (shared by all users)
+embedding_cache = TTLCache(EMBED_CACHE_SIZE, QUERY_CACHE_TTL_S)
+# Level 2: (email, store generation, index version, normalized query, top_k, search knobs) → results
+result_cache = TTLCache(RESULT_CACHE_SIZE, QUERY_CACHE_TTL_S)
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and case; all-MiniLM-L6-v2 is uncased, so the embedding is unchanged."""
+    return " ".join(query.lower().split())
+
+
+def get_query_embedding(query: str):
+    key = (model_id(), normalize_query(query))
+    query_vec = embedding_cache.get(key)
+    if query_vec is None:
+        query_vec = get_single_embedding(key[1])
+        embedding_cache.put(key, query_vec)
+    return query_vec
+
+
+def get_query_embeddings(queries: list) -> np.ndarray:
+    """
+    Embeddings of many queries, shape (len(queries), dim). Cache misses are
+    embedded together in one call on the bulk lane, so batch jobs don't hold
+    up interactive searches.
+    """
+    model = model_id()
+    keys = [(model, normalize_query(query)) for query in queries]
+    found = {key: embedding_cache.get(key) for key in set(keys)}
+    misses = [key for key, query_vec in found.items() if query_vec is None]
+    for key, query_vec in zip(misses, get_embeddings([text for _, text in misses])):
+        found[key] = query_vec.reshape(1, -1)
+        embedding_cache.put(key, found[key])
+    return np.concatenate([found[key] for key in keys]) if keys else get_embeddings([])
+
+
+def result_key(email: str, generation: str, version: int, query: str, top_k: int, *knobs) -> tuple:
+    return (email, generation, version, normalize_query(query), top_k) + knobs
+
+
+def invalidate_user_results(email: str):
+    """Free a user's cached results; their index version has moved on, so they can't hit anyway."""
+    result_cache.drop_where(lambda key: key[0] == email)
+
+
+def get_query_cache_stats() -> dict:
+    return {"embeddings": embedding_cache.stats(), "results": result_cache.stats()}
+
+
+def load_query_cache():
+    """
+    Restore both levels from QUERY_CACHE_FILE, if persistence is enabled.
+    Embeddings of another model or backend are dropped. Results of a store
+    that was deleted and created again don't match its new generation.
+    """
+    if not QUERY_CACHE_FILE or not os.path.exists(QUERY_CACHE_FILE):
+        return
+    try:
+        with open(QUERY_CACHE_FILE, "rb") as f:
+            saved = pickle.load(f)
+        model = model_id()
+        embedding_cache.restore([entry for entry in saved["embeddings"] if entry[0][0] == model])
+        result_cache.restore(saved["results"])
+    except Exception as e:
+        print(f"Could not load query cache {QUERY_CACHE_FILE}: {e}")
+
+
+def save_query_cache():
+    """Write both levels to QUERY_CACHE_FILE, if persistence is enabled."""
+    if not QUERY_CACHE_FILE:
+        return
+    os.makedirs(os.path.dirname(QUERY_CACHE_FILE) or ".", exist_ok=True)
+    tmp_path = QUERY_CACHE_FILE + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"embeddings": embedding_cache.dump(), "results": result_cache.dump()}, f)
+    os.replace(tmp_path, QUERY_CACHE_FILE)
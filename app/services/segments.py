@@ -0,0 +1,772 @@
+# app/services/segments.py
+import os
+import json
+import fcntl
+import shutil
+import threading
+import time
+import faiss
+import pickle
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from app.services import metrics
+from app.services.embedding import EMBEDDING_DIM
+from app.services.index_cache import IndexCache
+from app.services.chunk_table import ChunkTable, SegmentWriter
+from app.services.index_factory import (
+    build_shards, shard_count, index_type, index_storage, index_nbytes, storage_for, read_index, save_index
+)
+from app.services.lexical import LexicalIndex, build_lexical
+from app.services.query_cache import invalidate_user_results
+
+DATA_DIR = "data/vectordb"
+# One lock file per store, so API worker processes sharing DATA_DIR take turns
+# to commit (kept outside DATA_DIR, where every folder is a store)
+LOCKS_DIR = "data/vectordb-locks"
+
+# ========= CACHE CONFIG =========
+CACHE_MAX_MB = int(os.getenv("VECTORSTORE_CACHE_MB", "512"))
+# ================================
+
+# ========= SEGMENT CONFIG =========
+MERGE_ENABLED = os.getenv("VECTORSTORE_MERGE", "1") == "1"
+MERGE_FACTOR = int(os.getenv("VECTORSTORE_MERGE_FACTOR", "8"))   # merge once this many segments share a size tier
+MERGE_MIN_ROWS = 10_000       # segments below this many live rows are all in the smallest tier
+MERGE_DELETED_RATIO = 0.3     # rewrite a segment once this fraction of its rows is deleted
+ORPHAN_TMP_MAX_AGE = 24 * 3600   # seconds after which a live process's unfinished segment counts as abandoned
+# ==================================
+
+MANIFEST_FILENAME = "manifest.json"
+SEGMENTS_DIRNAME = "segments"
+SEGMENT_INDEX_FILENAME = "vectordb.index"
+OWNERS_FILENAME = "owners.json"   # shared layout: doc_id → owning tenant of each document
+
+index_cache = IndexCache(CACHE_MAX_MB * 1024 * 1024)
+segment_merges = {
+    outcome: metrics.counter("rag_segment_merges_total", "Background segment merges per outcome", outcome=outcome)
+    for outcome in ("merged", "failed")
+}
+
+# One lock per store so that manifest swaps and cache refills don't interleave
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+# store → ((inode, mtime, size) of its manifest file, version): a cached
+# index is checked against the manifest on every hit without re-reading it
+_manifest_stats = {}
+
+# Segment merges run one at a time, off the request and ingest threads
+_merge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="segment-merge")
+_merges_scheduled = set()  # stores with a merge queued or running
+
+# Segments being written live in folders named with this prefix until they are
+# committed; folders with the prefix of a process that is gone were left by a crash
+_TMP_PREFIX = f".tmp-{os.getpid()}-{os.urandom(2).hex()}-"
+
+
+class Segment:
+    """
+    One immutable on-disk segment: a chunk table, the FAISS indexes over its
+    vectors (one per shard of rows) and the BM25 postings of its texts, plus the documents deleted
+    from it since it was written (tombstones; they are filtered out of
+    searches until the next merge). Segments of the shared store also know
+    the owner of each document; tenants arguments restrict a method to the
+    documents of those owners.
+    """
+
+    def __init__(self, name: str, shards: list, chunk_table: ChunkTable, deleted: dict, lexical: LexicalIndex,
+                 owners: dict = None):
+        self.name = name
+        self.shards = shards
+        self.chunk_table = chunk_table
+        self.lexical = lexical
+        self.deleted = deleted  # doc_id → rows
+        self.owners = owners    # doc_id → tenant in the shared layout, else None
+        self._deleted_mask = None
+        self._docs_by_owner = None
+        self.selector = None
+        if deleted:
+            ids = np.concatenate([make_vector_ids(doc_id, rows) for doc_id, rows in deleted.items()])
+            self._deleted_ids = faiss.IDSelectorBatch(ids)  # kept referenced: the selector doesn't own it
+            self.selector = faiss.IDSelectorNot(self._deleted_ids)
+
+    def _filtered(self, tenants) -> bool:
+        return tenants is not None and self.owners is not None
+
+    def has_document(self, doc_id: int, tenants: tuple = None) -> bool:
+        if self._filtered(tenants) and self.owners.get(doc_id) not in tenants:
+            return False
+        return self.chunk_table.has_document(doc_id) and doc_id not in self.deleted
+
+    def visible_docs(self, tenants: tuple) -> list:
+        """Live doc ids owned by one of tenants."""
+        if self._docs_by_owner is None:
+            docs_by_owner = {}
+            for doc_id, owner in self.owners.items():
+                docs_by_owner.setdefault(owner, []).append(doc_id)
+            self._docs_by_owner = docs_by_owner
+        return [
+            doc_id for tenant in tenants for doc_id in self._docs_by_owner.get(tenant, ())
+            if doc_id not in self.deleted
+        ]
+
+    def live_rows(self, tenants: tuple = None) -> int:
+        if self._filtered(tenants):
+            return sum(self.chunk_table.doc_rows[doc_id][1] for doc_id in self.visible_docs(tenants))
+        return len(self.chunk_table) - sum(self.deleted.values())
+
+    def visible_rows(self, tenants: tuple = None) -> np.ndarray:
+        """Row numbers of the live documents (of tenants, if given), in row order."""
+        if not self._filtered(tenants):
+            return np.flatnonzero(~self.deleted_row_mask())
+        spans = sorted(self.chunk_table.doc_rows[doc_id] for doc_id in self.visible_docs(tenants))
+        return np.concatenate(
+            [np.arange(start, start + count) for start, count in spans] or [np.zeros(0, dtype="int64")]
+        )
+
+    def deleted_row_mask(self) -> np.ndarray:
+        if self._deleted_mask is None:
+            mask = np.zeros(len(self.chunk_table), dtype=bool)
+            for doc_id in self.deleted:
+                start, count = self.chunk_table.doc_rows[doc_id]
+                mask[start:start + count] = True
+            self._deleted_mask = mask
+        return self._deleted_mask
+
+    def get_chunk(self, vector_id: int, tenants: tuple = None):
+        if not self.has_document(int(vector_id) >> 32, tenants):
+            return None
+        return self.chunk_table.lookup(vector_id)
+
+    def nbytes(self) -> int:
+        owners = 100 * len(self.owners) if self.owners else 0
+        indexes = sum(index_nbytes(shard) for shard in self.shards)
+        return indexes + self.chunk_table.nbytes() + self.lexical.nbytes() + owners
+
+
+class UserIndex:
+    """
+    A store's loaded segments. A document is live in at most one segment, so a
+    vector id resolves to one chunk. version increases with every manifest
+    swap and generation changes when the store is created again, so cached
+    query results can't go stale. In the shared layout users get a view with
+    tenants set: only the documents of those owners are visible.
+    """
+
+    def __init__(self, segments: list, version: int, tenants: tuple = None, generation: str = ""):
+        self.segments = segments
+        self.version = version
+        self.tenants = tenants
+        self.generation = generation
+
+    def for_tenants(self, tenants: tuple) -> "UserIndex":
+        return UserIndex(self.segments, self.version, tenants, self.generation)
+
+    def __len__(self):
+        return sum(segment.live_rows(self.tenants) for segment in self.segments)
+
+    def has_document(self, doc_id: int) -> bool:
+        return any(segment.has_document(doc_id, self.tenants) for segment in self.segments)
+
+    def get_chunk(self, vector_id: int):
+        """Resolve a vector id to (doc_id, chunk), or None if it no longer exists."""
+        for segment in self.segments:
+            hit = segment.get_chunk(vector_id, self.tenants)
+            if hit is not None:
+                return hit
+        return None
+
+    def nbytes(self) -> int:
+        """Rough resident size of the indexes (chunk texts and vectors are mmapped)."""
+        return sum(segment.nbytes() for segment in self.segments)
+
+
+def make_vector_ids(doc_id: int, num_chunks: int) -> np.ndarray:
+    """
+    Vector ids are (doc_id << 32) | chunk_idx, so all vectors of a document
+    form one contiguous id range that can be removed without touching the rest.
+    """
+    return (np.int64(doc_id) << 32) | np.arange(num_chunks, dtype="int64")
+
+
+def split_vector_id(vector_id: int):
+    vector_id = int(vector_id)
+    return vector_id >> 32, vector_id & 0xFFFFFFFF
+
+
+class StoreLock:
+    """
+    Held around every read-modify-commit of a store's manifest: a thread lock
+    for this process plus an flock on LOCKS_DIR/<store>.lock for the other
+    processes (API workers) that share DATA_DIR.
+    """
+
+    def __init__(self, store: str):
+        self.store = store
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            os.makedirs(LOCKS_DIR, exist_ok=True)
+            self._file = open(os.path.join(LOCKS_DIR, f"{self.store}.lock"), "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        except BaseException:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self._file.close()  # releases the flock
+            self._file = None
+        finally:
+            self._thread_lock.release()
+
+
+def store_lock(store: str) -> StoreLock:
+    with _store_locks_guard:
+        lock = _store_locks.get(store)
+        if lock is None:
+            lock = _store_locks[store] = StoreLock(store)
+        return lock
+
+
+def store_files(store: str):
+    user_folder = os.path.join(DATA_DIR, store)
+    index_file = os.path.join(user_folder, "vectordb.index")  # legacy single-index layout
+    chunks_file = os.path.join(user_folder, "chunks.pkl")     # legacy chunk storage
+    return user_folder, index_file, chunks_file
+
+
+def segment_folder(store: str, name: str) -> str:
+    user_folder, _, _ = store_files(store)
+    return os.path.join(user_folder, SEGMENTS_DIRNAME, name)
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_manifest(store: str):
+    """
+    The user's manifest: {"version", "next_segment", "segments": [{"name", "rows", "deleted"}]},
+    where deleted maps doc_id → rows. None if the user has no segment layout yet.
+    """
+    user_folder, _, _ = store_files(store)
+    manifest_file = os.path.join(user_folder, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    for entry in manifest["segments"]:
+        entry["deleted"] = {int(doc_id): rows for doc_id, rows in entry["deleted"].items()}
+    return manifest
+
+
+def new_manifest(version: int = 0) -> dict:
+    """The manifest of a new store; its random generation tells it apart from a deleted store of the same name."""
+    return {"version": version, "generation": os.urandom(8).hex(), "next_segment": 1, "segments": []}
+
+
+def commit_manifest(store: str, manifest: dict) -> int:
+    """
+    Atomically replace the manifest with the next version; called under the user lock.
+    This swap is the commit point of every write: segments it doesn't list are garbage.
+    """
+    user_folder, _, _ = store_files(store)
+    manifest["version"] += 1
+    tmp_path = os.path.join(user_folder, MANIFEST_FILENAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(user_folder, MANIFEST_FILENAME))
+    _fsync_dir(user_folder)
+    # Results cached for the users of the shared store are keyed by email and
+    # simply stop matching the new version
+    invalidate_user_results(store)
+    return manifest["version"]
+
+
+def read_version(store: str) -> int:
+    manifest = read_manifest(store)
+    return manifest["version"] if manifest else 0
+
+
+def _manifest_version(store: str) -> int:
+    """
+    read_version, re-reading the manifest only when its file changed (every
+    commit replaces it, so another process's commit changes the inode).
+    """
+    user_folder, _, _ = store_files(store)
+    try:
+        st = os.stat(os.path.join(user_folder, MANIFEST_FILENAME))
+    except FileNotFoundError:
+        return 0
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    known = _manifest_stats.get(store)
+    if known is not None and known[0] == key:
+        return known[1]
+    version = read_version(store)
+    if time.time() - st.st_mtime > 1:
+        # A commit within the file system's timestamp granularity could reuse
+        # the inode with the same mtime and size: only trust settled files
+        _manifest_stats[store] = (key, version)
+    return version
+
+
+def new_segment_folder(store: str) -> str:
+    """A private folder to write a segment into; it becomes visible when renamed and listed in the manifest."""
+    user_folder, _, _ = store_files(store)
+    segments_folder = os.path.join(user_folder, SEGMENTS_DIRNAME)
+    os.makedirs(segments_folder, exist_ok=True)
+    return os.path.join(segments_folder, f"{_TMP_PREFIX}{os.urandom(4).hex()}")
+
+
+def _shard_file(folder: str, shard: int) -> str:
+    """vectordb.index, then vectordb.1.index, vectordb.2.index, ... for the other shards."""
+    if shard == 0:
+        return os.path.join(folder, SEGMENT_INDEX_FILENAME)
+    return os.path.join(folder, f"vectordb.{shard}.index")
+
+
+def _save_shards(folder: str, shards: list):
+    for shard, index in enumerate(shards):
+        save_index(_shard_file(folder, shard), index)
+    shard = len(shards)
+    while os.path.exists(_shard_file(folder, shard)):
+        # Left over from a segment that had more shards before it was re-encoded
+        os.remove(_shard_file(folder, shard))
+        shard += 1
+
+
+def _read_shards(folder: str) -> list:
+    shards = []
+    while os.path.exists(_shard_file(folder, len(shards))):
+        shards.append(read_index(_shard_file(folder, len(shards))))
+    return shards
+
+
+def write_segment_files(folder: str, chunk_table: ChunkTable) -> list:
+    """Build the FAISS shards and BM25 postings of a finished chunk table and store them next to it."""
+    shards = build_shards(chunk_table.vectors(), chunk_table.ids())
+    _save_shards(folder, shards)
+    build_lexical(folder, chunk_table.texts(), len(chunk_table))
+    return shards
+
+
+def write_owners(folder: str, owners: dict):
+    with open(os.path.join(folder, OWNERS_FILENAME), "w") as f:
+        json.dump(owners, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_owners(folder: str):
+    """doc_id → tenant of a shared-store segment, or None for a per-user segment."""
+    path = os.path.join(folder, OWNERS_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return {int(doc_id): owner for doc_id, owner in json.load(f).items()}
+
+
+def published_segment(store: str, entry: dict, shards: list) -> Segment:
+    """The Segment for a just-published manifest entry, reusing the shards built for it."""
+    folder = segment_folder(store, entry["name"])
+    return Segment(
+        entry["name"], shards, ChunkTable(folder, EMBEDDING_DIM), entry["deleted"], LexicalIndex(folder),
+        read_owners(folder),
+    )
+
+
+def publish_segment(store: str, manifest: dict, tmp_folder: str, rows: int, deleted: dict = None) -> dict:
+    """Give a written segment its final name and add it to manifest (not yet committed)."""
+    name = f"seg-{manifest['next_segment']:08d}"
+    manifest["next_segment"] += 1
+    os.rename(tmp_folder, segment_folder(store, name))
+    entry = {"name": name, "rows": rows, "deleted": deleted or {}}
+    manifest["segments"].append(entry)
+    return entry
+
+
+def _flat_index_vectors(index):
+    """(ids, vectors) of an IDMap2 over a flat index, read back without re-embedding."""
+    vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+    return faiss.vector_to_array(index.id_map).astype("int64"), vectors
+
+
+def migrate_legacy_layout(email: str):
+    """
+    Convert a single-index folder (vectordb.index with chunks.pkl, or with a
+    chunks.npy table) into one segment plus a manifest. Nothing is re-embedded:
+    vectors come from the chunk table or are copied out of the index. Indexes
+    written before vector ids were introduced get ids that follow the
+    insertion order of the pickled dict, which is how they were added.
+    """
+    user_folder, index_file, chunks_file = store_files(email)
+    index = read_index(index_file)
+    tmp_folder = new_segment_folder(email)
+    writer = SegmentWriter(tmp_folder, EMBEDDING_DIM)
+
+    if os.path.exists(chunks_file):
+        with open(chunks_file, "rb") as f:
+            all_chunks = pickle.load(f)
+        if isinstance(index, faiss.IndexIDMap2):
+            ids, vectors = _flat_index_vectors(index)
+        else:
+            vectors = index.reconstruct_n(0, index.ntotal)
+            ids = np.concatenate(
+                [make_vector_ids(doc_id, len(chunks)) for doc_id, chunks in all_chunks.items()]
+                or [np.zeros(0, dtype="int64")]
+            )
+            n = min(len(ids), len(vectors))
+            ids, vectors = ids[:n], vectors[:n]
+        row_of = {int(vector_id): row for row, vector_id in enumerate(ids)}
+        for doc_id, chunks in sorted(all_chunks.items()):
+            rows = [row_of[int(i)] for i in make_vector_ids(doc_id, len(chunks)) if int(i) in row_of]
+            writer.add_chunks(doc_id, chunks[:len(rows)], vectors[rows])
+    else:
+        table = ChunkTable(user_folder, EMBEDDING_DIM)
+        if table.has_vectors:
+            for doc_id, (start, count) in sorted(table.doc_rows.items()):
+                writer.add_rows(table, start, count)
+        else:
+            # Tables from before vectors were stored: the flat index still has them
+            ids, vectors = _flat_index_vectors(index)
+            row_of = {int(vector_id): row for row, vector_id in enumerate(ids)}
+            for doc_id, (start, count) in sorted(table.doc_rows.items()):
+                doc_ids = [int(i) for i in table.ids()[start:start + count] if int(i) in row_of]
+                writer.add_chunks(
+                    doc_id, [table.lookup(i)[1] for i in doc_ids], vectors[[row_of[i] for i in doc_ids]]
+                )
+
+    chunk_table = writer.finish()
+    write_segment_files(tmp_folder, chunk_table)
+
+    version = 0
+    meta_file = os.path.join(user_folder, "meta.json")
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            version = json.load(f).get("version", 0)
+    manifest = new_manifest(version)
+    publish_segment(email, manifest, tmp_folder, len(chunk_table))
+    commit_manifest(email, manifest)
+
+    for name in ("vectordb.index", "chunks.pkl", "chunks.npy", "chunks.bin", "meta.json"):
+        path = os.path.join(user_folder, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+def _abandoned_tmp_folder(folder: str, name: str) -> bool:
+    """
+    True for a segment still being written (".tmp-<pid>-...") whose process
+    is gone, or that nobody touched for ORPHAN_TMP_MAX_AGE (the pid was reused).
+    """
+    if name.startswith(_TMP_PREFIX):
+        return False
+    try:
+        pid = int(name.split("-")[1])
+        age = time.time() - os.path.getmtime(folder)
+    except (IndexError, ValueError, OSError):
+        return True
+    return not _pid_alive(pid) or age > ORPHAN_TMP_MAX_AGE
+
+
+def _remove_orphan_segments(store: str, manifest: dict):
+    """
+    Delete segment folders a crash left behind (written but never committed,
+    or merged away); called under the store lock, so no other process is
+    between publishing a segment and committing it.
+    """
+    user_folder, _, _ = store_files(store)
+    segments_folder = os.path.join(user_folder, SEGMENTS_DIRNAME)
+    if not os.path.isdir(segments_folder):
+        return
+    live = {entry["name"] for entry in manifest["segments"]}
+    for name in os.listdir(segments_folder):
+        folder = os.path.join(segments_folder, name)
+        if name in live:
+            continue
+        # Folders other workers are still writing are left to them
+        if name.startswith(".tmp-") and not _abandoned_tmp_folder(folder, name):
+            continue
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def _open_segment(store: str, entry: dict) -> Segment:
+    folder = segment_folder(store, entry["name"])
+    shards = _read_shards(folder)
+    chunk_table = ChunkTable(folder, EMBEDDING_DIM)
+
+    if (
+        index_storage(shards[0]) != storage_for(index_type(shards[0]))
+        or len(shards) != shard_count(len(chunk_table))
+        or sum(shard.ntotal for shard in shards) != len(chunk_table)  # interrupted re-encode
+    ):
+        # The deployment switched storage mode or shard count: re-encode from the stored vectors
+        shards = build_shards(chunk_table.vectors(), chunk_table.ids())
+        _save_shards(folder, shards)
+    if not LexicalIndex.exists(folder):
+        # Segments written before BM25 postings were added
+        build_lexical(folder, chunk_table.texts(), len(chunk_table))
+
+    return Segment(
+        entry["name"], shards, chunk_table, dict(entry["deleted"]), LexicalIndex(folder), read_owners(folder)
+    )
+
+
+def _load_user_state(store: str):
+    """
+    Load a store's segments from disk as a UserIndex, or None if it has no index.
+    Called under the store lock.
+    """
+    user_folder, index_file, _ = store_files(store)
+    manifest = read_manifest(store)
+    if manifest is None:
+        if not os.path.exists(index_file):
+            return None
+        migrate_legacy_layout(store)
+        manifest = read_manifest(store)
+
+    _remove_orphan_segments(store, manifest)
+    segments = [_open_segment(store, entry) for entry in manifest["segments"]]
+    return UserIndex(segments, manifest["version"], generation=manifest.get("generation", ""))
+
+
+def _cache_user_index(store: str, user_index: UserIndex) -> UserIndex:
+    index_cache.put(store, user_index, user_index.nbytes())
+    return user_index
+
+
+def current_store_index(store: str):
+    """
+    The store's UserIndex matching its manifest on disk; called under the user lock.
+    A cached index the manifest has moved on from (a commit by another process)
+    is brought up to date, reusing the segments it already has.
+    """
+    user_index = index_cache.get(store)
+    if user_index is None:
+        return _load_user_state(store)
+    manifest = read_manifest(store)
+    if manifest is None:
+        return None
+    generation = manifest.get("generation", "")
+    if manifest["version"] == user_index.version and generation == user_index.generation:
+        return user_index
+    segments = _manifest_segments(store, manifest, user_index)
+    return _cache_user_index(store, UserIndex(segments, manifest["version"], generation=generation))
+
+
+def get_store_index(store: str):
+    """
+    The cached UserIndex of a store, loaded from disk on a miss and brought up
+    to date when another process committed since; None if it has no index yet.
+    """
+    user_index = index_cache.get(store)
+    if user_index is not None and user_index.version == _manifest_version(store):
+        return user_index
+
+    with store_lock(store):
+        with metrics.timed("index_load"):
+            user_index = current_store_index(store)
+        if user_index is None:
+            index_cache.invalidate(store)
+            return None
+
+        return _cache_user_index(store, user_index)
+
+
+@metrics.collector
+def _index_metrics():
+    """Size of every cached store (a store not searched lately is not in memory) and the cache counters"""
+    found = []
+    for store, user_index, nbytes in index_cache.entries():
+        labels = {"store": store}
+        found.append(("rag_index_rows", "gauge", "Live rows per cached store", labels, len(user_index)))
+        found.append(("rag_index_bytes", "gauge", "Estimated memory per cached store", labels, nbytes))
+        found.append(("rag_index_segments", "gauge", "Segments per cached store", labels, len(user_index.segments)))
+    stats = index_cache.stats()
+    for name in ("hits", "misses", "evictions"):
+        found.append((f"rag_index_cache_{name}_total", "counter", f"Index cache {name}", {}, stats[name]))
+    return found
+
+
+def _manifest_segments(store: str, manifest: dict, user_index: UserIndex, new_segments: dict = None) -> list:
+    """
+    The Segments of manifest's entries, with its tombstones. They are reused
+    from user_index or new_segments; entries neither has (the cached index
+    predates a commit by a merge or another process) are opened from disk.
+    """
+    loaded = {segment.name: segment for segment in (user_index.segments if user_index else [])}
+    loaded.update(new_segments or {})
+    segments = []
+    for entry in manifest["segments"]:
+        segment = loaded.get(entry["name"])
+        if segment is None:
+            segment = _open_segment(store, entry)
+        elif segment.deleted != entry["deleted"]:
+            segment = Segment(
+                segment.name, segment.shards, segment.chunk_table, dict(entry["deleted"]), segment.lexical,
+                segment.owners,
+            )
+        segments.append(segment)
+    return segments
+
+
+def apply_manifest(store: str, manifest: dict, user_index: UserIndex, new_segments: dict) -> UserIndex:
+    """
+    Commit manifest and cache the matching UserIndex; called under the user lock.
+    Segments are reused from user_index or taken from new_segments (see _manifest_segments).
+    """
+    version = commit_manifest(store, manifest)
+    segments = _manifest_segments(store, manifest, user_index, new_segments)
+    return _cache_user_index(store, UserIndex(segments, version, generation=manifest.get("generation", "")))
+
+
+def tombstone(store: str, manifest: dict, user_index: UserIndex, doc_id: int, tenants: tuple = None) -> bool:
+    """Mark doc_id deleted in every segment where it is live (and owned by tenants); True if there was one."""
+    loaded = {segment.name: segment for segment in (user_index.segments if user_index else [])}
+    found = False
+    for entry in manifest["segments"]:
+        if doc_id in entry["deleted"]:
+            continue
+        segment = loaded.get(entry["name"]) or _open_segment(store, entry)
+        if segment.has_document(doc_id, tenants):
+            entry["deleted"][doc_id] = segment.chunk_table.doc_rows[doc_id][1]
+            found = True
+    return found
+
+
+def _merge_tier(entry: dict) -> int:
+    live = entry["rows"] - sum(entry["deleted"].values())
+    tier = 0
+    while live >= MERGE_MIN_ROWS * MERGE_FACTOR ** tier:
+        tier += 1
+    return tier
+
+
+def _plan_merge(manifest: dict) -> list:
+    """
+    Names of the segments to merge next, or [] if the layout is fine:
+    a segment with too many deleted rows is rewritten on its own, otherwise
+    MERGE_FACTOR segments of the smallest crowded size tier are merged.
+    """
+    for entry in manifest["segments"]:
+        if entry["rows"] and sum(entry["deleted"].values()) >= MERGE_DELETED_RATIO * entry["rows"]:
+            return [entry["name"]]
+
+    tiers = {}
+    for entry in manifest["segments"]:
+        tiers.setdefault(_merge_tier(entry), []).append(entry["name"])
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= MERGE_FACTOR:
+            return tiers[tier][:MERGE_FACTOR]
+    return []
+
+
+def _merge_once(store: str) -> bool:
+    """Run one planned merge; returns False when there was nothing to merge."""
+    with store_lock(store):
+        manifest = read_manifest(store)
+        names = _plan_merge(manifest) if manifest else []
+        if not names:
+            return False
+        user_index = current_store_index(store)
+        sources = [segment for segment in user_index.segments if segment.name in names]
+
+    # Sources are immutable, so they are read without the lock. Tombstones
+    # added meanwhile are carried over to the merged segment below.
+    live_docs = sorted(
+        (doc_id, segment, start, count)
+        for segment in sources
+        for doc_id, (start, count) in segment.chunk_table.doc_rows.items()
+        if doc_id not in segment.deleted
+    )
+    tmp_folder = new_segment_folder(store)
+    writer = SegmentWriter(tmp_folder, EMBEDDING_DIM)
+    try:
+        for doc_id, segment, start, count in live_docs:
+            writer.add_rows(segment.chunk_table, start, count)
+        chunk_table = writer.finish()
+        owners = {
+            doc_id: segment.owners[doc_id] for doc_id, segment, _, _ in live_docs if segment.owners is not None
+        }
+        if owners:
+            write_owners(tmp_folder, owners)
+        shards = write_segment_files(tmp_folder, chunk_table)
+    except Exception:
+        writer.discard()
+        raise
+
+    with store_lock(store):
+        manifest = read_manifest(store)
+        current = {entry["name"]: entry for entry in manifest["segments"]}
+        if not all(name in current for name in names):
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            return True
+
+        deleted = {}
+        for segment in sources:
+            for doc_id, rows in current[segment.name]["deleted"].items():
+                if doc_id not in segment.deleted and chunk_table.has_document(doc_id):
+                    deleted[doc_id] = rows
+        manifest["segments"] = [entry for entry in manifest["segments"] if entry["name"] not in names]
+        new_segments = {}
+        if len(chunk_table):
+            entry = publish_segment(store, manifest, tmp_folder, len(chunk_table), deleted)
+            new_segments[entry["name"]] = published_segment(store, entry, shards)
+        else:
+            # Everything in the sources was deleted
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+        apply_manifest(store, manifest, current_store_index(store), new_segments)
+
+        for name in names:
+            shutil.rmtree(segment_folder(store, name), ignore_errors=True)
+    segment_merges["merged"].inc()
+    print(f"Merged {len(names)} segment(s) of {store} into {len(chunk_table)} rows")
+    return True
+
+
+def _run_merges(store: str):
+    try:
+        while _merge_once(store):
+            pass
+    except Exception as e:
+        # The sources stay as they are; the next write to the store schedules another try
+        segment_merges["failed"].inc()
+        print(f"Segment merge for {store} failed: {e!r}")
+    finally:
+        with _store_locks_guard:
+            _merges_scheduled.discard(store)
+
+
+def schedule_merge(store: str):
+    """Queue a background merge for this user unless one is already pending."""
+    if not MERGE_ENABLED:
+        return
+    with _store_locks_guard:
+        if store in _merges_scheduled:
+            return
+        _merges_scheduled.add(store)
+    _merge_executor.submit(_run_merges, store)
@@ -1,101 +1,583 @@
 import os
+import heapq
+import shutil
+import time
 import faiss
-import pickle
 import numpy as np
-from app.services.embedding import get_embeddings, get_single_embedding, EMBEDDING_DIM
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from app.services import metrics
+from app.services.embedding import EMBEDDING_DIM
+from app.services.embedding_store import embed_chunks
+from app.services.chunk_table import ChunkTable, SegmentWriter
+from app.services.chunker import chunk_text, batched
+from app.services.index_factory import IVF_MIN_VECTORS, search_params, search_index
+from app.services.lexical import tokenize, query_idf, fuse, FUSION_MODES, HYBRID_CANDIDATES
+from app.services.query_cache import get_query_embedding, get_query_embeddings, result_cache, result_key
+from app.services.segments import (
+    DATA_DIR, UserIndex, index_cache, store_lock, store_files, segment_folder, read_manifest, new_manifest,
+    commit_manifest, new_segment_folder, write_segment_files, write_owners, read_owners, published_segment,
+    publish_segment, migrate_legacy_layout, current_store_index, get_store_index, apply_manifest, tombstone,
+    schedule_merge,
+)
 
-DATA_DIR = "data/vectordb"
+# ========= SEARCH CONFIG =========
+SEARCH_THREADS = int(os.getenv("VECTORSTORE_SEARCH_THREADS", str(os.cpu_count() or 1)))
+BATCH_SEARCH_BLOCK = 256      # search_batch: queries embedded and searched per step
+# =================================
+
+# ========= INGEST CONFIG =========
+EMBED_BATCH_CHUNKS = int(os.getenv("EMBED_BATCH_CHUNKS", "256"))  # chunks embedded and staged per step
+# =================================
+
+# ========= LAYOUT CONFIG =========
+# "per_user": one store (manifest + segments) per email under DATA_DIR/<email>/.
+# "shared": a single store under DATA_DIR/_shared/ for every user; each document
+# is tagged with its owner and searches only see the caller's documents.
+VECTORSTORE_LAYOUT = os.getenv("VECTORSTORE_LAYOUT", "per_user")
+# Shared layout: tenants (owner emails) whose documents every user can also search
+SHARED_TENANTS = tuple(t for t in os.getenv("VECTORSTORE_SHARED_TENANTS", "").split(",") if t)
+SHARED_SCAN_ROWS = IVF_MIN_VECTORS   # a tenant with at most this many rows in a segment is scanned exactly
+MIGRATE_SEGMENT_ROWS = 500_000       # migrate_to_shared: rows per shared segment written
+MIGRATE_GROUP_USERS = 256            # migrate_to_shared: per-user stores copied into one segment at most
+# =================================
+
+LAYOUTS = ("per_user", "shared")
+SHARED_STORE = "_shared"          # store name of the shared layout (emails always contain "@")
+
+chunks_indexed = metrics.counter("rag_chunks_indexed_total", "Chunks written to segments (uploads and bulk loads)")
+
+# Shards and segments of a query are searched in parallel; FAISS releases the GIL
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="vector-search")
+
+
+def _store_of(email: str) -> str:
+    """The store (folder under DATA_DIR) holding this user's vectors."""
+    if VECTORSTORE_LAYOUT not in LAYOUTS:
+        raise ValueError(f"Unknown vectorstore layout: {VECTORSTORE_LAYOUT}")
+    return SHARED_STORE if VECTORSTORE_LAYOUT == "shared" else email
+
+
+def _owner_tenants(email: str):
+    """tenants argument that limits writes to the user's own documents (None: the whole store is theirs)."""
+    return (email,) if _store_of(email) == SHARED_STORE else None
+
+
+def get_user_index(email: str):
+    """
+    Return the cached UserIndex for this user, loading it from disk on a miss.
+    In the shared layout it is a view of the shared store limited to the user's
+    documents and SHARED_TENANTS. Returns None if there is no index yet.
+    """
+    store = _store_of(email)
+    user_index = get_store_index(store)
+    if user_index is None or store != SHARED_STORE:
+        return user_index
+    return user_index.for_tenants((email,) + SHARED_TENANTS)
+
+
+def invalidate_user_index(email: str):
+    """Drop a user's cached index so the next search reloads it from disk."""
+    index_cache.invalidate(_store_of(email))
+
+
+def get_cache_stats() -> dict:
+    return index_cache.stats()
 
 
 def split_text(text: str, chunk_size: int = 30, overlap: int = 5) -> list[str]:
     """
-    Split text into smaller chunks with optional overlap.
+    Split text into fixed windows of words with optional overlap
+    (the original strategy; see app.services.chunker for the others).
     """
-        
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        chunks.append(chunk)
-    return chunks
+    return list(chunk_text(text, "words", chunk_size, overlap))
 
 
-def update_vectorstore(email: str, doc_id: int, text_content):
+def update_vectorstore(email: str, doc_id: int, text_content, on_stage=None):
     """
-    Split document into chunks and add to user's FAISS index.
+    Split document into chunks and write them to a new segment of the user's store.
+    text_content is the document text (chunked with the default strategy) or
+    an iterable of its chunks (see app.services.chunker); chunks are embedded
+    and written to disk EMBED_BATCH_CHUNKS at a time, so memory use doesn't
+    grow with the document. The segment and its index are built without the
+    user lock; committing it is one manifest swap that also tombstones any
+    earlier version of the document. The cached index is replaced (write-through).
+    on_stage, if given, is called with "chunking", "embedding" and "indexing".
     """
+    on_stage = on_stage or (lambda stage: None)
+
+    on_stage("chunking")
+    chunks = chunk_text(text_content) if isinstance(text_content, str) else text_content
+    store = _store_of(email)
 
-    text_chunks = split_text(text_content)
+    writer = SegmentWriter(new_segment_folder(store), EMBEDDING_DIM)
+    try:
+        on_stage("embedding")
+        batches = batched(chunks, EMBED_BATCH_CHUNKS)
+        while True:
+            # Chunks are produced lazily: the chunker runs as each batch is drawn
+            with metrics.timed("chunk"):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            # Chunks embedded before (any user, any document) come from the embedding store
+            with metrics.timed("embed_chunks"):
+                vectors = embed_chunks(batch)
+            writer.add_chunks(doc_id, batch, vectors)
 
-    embeddings = get_embeddings(text_chunks)
+        on_stage("indexing")
+        with metrics.timed("index_build"):
+            chunk_table = writer.finish()
+            if store == SHARED_STORE:
+                write_owners(writer.folder, {doc_id: email})
+            shards = write_segment_files(writer.folder, chunk_table)
+    except Exception:
+        writer.discard()
+        raise
 
-    # User folder
-    user_folder = os.path.join(DATA_DIR, email)
-    os.makedirs(user_folder, exist_ok=True)
+    with metrics.timed("index_commit"), store_lock(store):
+        user_index = current_store_index(store)
+        manifest = read_manifest(store) or new_manifest()
 
-    index_file = os.path.join(user_folder, "vectordb.index")
-    chunks_file = os.path.join(user_folder, "chunks.pkl")
+        # Re-upload under the same doc_id: the old version stops being live
+        tombstone(store, manifest, user_index, doc_id, _owner_tenants(email))
+        entry = publish_segment(store, manifest, writer.folder, len(chunk_table))
+        segment = published_segment(store, entry, shards)
+        apply_manifest(store, manifest, user_index, {segment.name: segment})
 
-    if os.path.exists(index_file) and os.path.exists(chunks_file):
-        # Load existing index + chunks
-        index = faiss.read_index(index_file)
-        with open(chunks_file, "rb") as f:
-            all_chunks = pickle.load(f)
-    else:
-        # Create new index + chunks
-        index = faiss.IndexFlatL2(EMBEDDING_DIM)
-        all_chunks = {}
+    chunks_indexed.inc(len(chunk_table))
+    schedule_merge(store)
 
-    # Add new embeddings to index
-    index.add(embeddings)
 
-    # Store chunks by doc_id
-    all_chunks[doc_id] = text_chunks
+def delete_from_vectorstore(email: str, doc_id: int):
+    """
+    Remove one document's vectors and chunks from the user's store.
+    Deleting only records a tombstone in the manifest: the document's ids
+    are filtered out of searches and the rows are dropped by the next merge.
+    """
+    store = _store_of(email)
+    with store_lock(store):
+        user_index = current_store_index(store)
+        manifest = read_manifest(store)
+        if manifest is None or not tombstone(store, manifest, user_index, doc_id, _owner_tenants(email)):
+            return
+        apply_manifest(store, manifest, user_index, {})
 
-    # Save back
-    faiss.write_index(index, index_file)
-    with open(chunks_file, "wb") as f:
-        pickle.dump(all_chunks, f)
+    schedule_merge(store)
 
 
-def get_faiss_results(email: str, query: str, top_k: int = 5):
+def _user_store_tables(email: str) -> list:
+    """(chunk table, tombstones) of each segment of a per-user store, migrating a legacy layout first."""
+    with store_lock(email):
+        manifest = read_manifest(email)
+        if manifest is None:
+            _, index_file, _ = store_files(email)
+            if not os.path.exists(index_file):
+                return []
+            migrate_legacy_layout(email)
+            manifest = read_manifest(email)
+    return [
+        (ChunkTable(segment_folder(email, entry["name"]), EMBEDDING_DIM), entry["deleted"])
+        for entry in manifest["segments"]
+    ]
+
+
+def _write_shared_segment(docs: list):
+    """Copy docs [(doc_id, email, table, start, count)] into a new shared segment; returns its folder and rows."""
+    folder = new_segment_folder(SHARED_STORE)
+    writer = SegmentWriter(folder, EMBEDDING_DIM)
+    try:
+        for doc_id, email, table, start, count in docs:
+            writer.add_rows(table, start, count)
+        chunk_table = writer.finish()
+        write_owners(folder, {doc_id: email for doc_id, email, _, _, _ in docs})
+        write_segment_files(folder, chunk_table)
+    except Exception:
+        writer.discard()
+        raise
+    return folder, len(chunk_table)
+
+
+def migrate_to_shared(emails: list, segment_rows: int = MIGRATE_SEGMENT_ROWS) -> dict:
     """
-    Retrieve top-k chunks from the user's FAISS index for a query
+    Copy the live documents of these per-user stores into the shared store,
+    tagged with their owner. Vectors, texts and postings are copied, nothing
+    is re-embedded. Stores are copied MIGRATE_GROUP_USERS at a time into
+    segments of about segment_rows rows, and the shared manifest is committed
+    once at the end: an interrupted run leaves the shared store untouched.
+    Documents already in the shared store are skipped, so a run can be repeated.
+    Writes to the shared store must not run meanwhile (serve the per_user layout).
     """
-    user_folder = os.path.join(DATA_DIR, email)
-    index_file = os.path.join(user_folder, "vectordb.index")
-    chunks_file = os.path.join(user_folder, "chunks.pkl")
+    shared_docs = set()
+    manifest = read_manifest(SHARED_STORE)
+    for entry in (manifest["segments"] if manifest else []):
+        table = ChunkTable(segment_folder(SHARED_STORE, entry["name"]), EMBEDDING_DIM)
+        shared_docs.update(doc_id for doc_id in table.doc_rows if doc_id not in entry["deleted"])
 
-    if not os.path.exists(index_file) or not os.path.exists(chunks_file):
-        return []
+    written, stats = [], {"users": 0, "documents": 0, "rows": 0, "segments": 0}
+    try:
+        group, group_rows, group_users = [], 0, 0
+        for position, email in enumerate(emails):
+            for table, deleted in _user_store_tables(email):
+                for doc_id, (start, count) in table.doc_rows.items():
+                    if doc_id in deleted or doc_id in shared_docs:
+                        continue
+                    shared_docs.add(doc_id)
+                    group.append((doc_id, email, table, start, count))
+                    group_rows += count
+            stats["users"] += 1
+            group_users += 1
+
+            # Each store in the group keeps its files open until the segment is written
+            full = group_rows >= segment_rows or group_users >= MIGRATE_GROUP_USERS
+            if full or position == len(emails) - 1:
+                if group:
+                    group.sort(key=lambda doc: doc[0])
+                    written.append(_write_shared_segment(group))
+                    stats["documents"] += len(group)
+                    stats["rows"] += group_rows
+                group, group_rows, group_users = [], 0, 0
+    except Exception:
+        for folder, _ in written:
+            shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    if written:
+        with store_lock(SHARED_STORE):
+            manifest = read_manifest(SHARED_STORE) or new_manifest()
+            for folder, rows in written:
+                publish_segment(SHARED_STORE, manifest, folder, rows)
+            commit_manifest(SHARED_STORE, manifest)
+            index_cache.invalidate(SHARED_STORE)
+        schedule_merge(SHARED_STORE)
+    stats["segments"] = len(written)
+    return stats
+
+
+def bulk_load(store: str, docs, replace: bool = False, segment_rows: int = MIGRATE_SEGMENT_ROWS) -> dict:
+    """
+    Write docs, an iterable of (doc_id, owner email, chunks, vectors) in
+    increasing doc_id order, into new segments of about segment_rows rows and
+    commit them all with one manifest swap. replace drops every existing
+    segment in the same commit (a full rebuild); otherwise earlier versions
+    of these documents are tombstoned. Nothing is visible before the commit,
+    so an interrupted load leaves the store as it was. Other writes to the
+    store (e.g. uploads in a server process) must not run meanwhile.
+    """
+    written, doc_ids = [], []
+    stats = {"documents": 0, "rows": 0, "segments": 0}
+    writer, owners = None, {}
+
+    def finish_segment():
+        chunk_table = writer.finish()
+        if not len(chunk_table):
+            shutil.rmtree(writer.folder, ignore_errors=True)
+            return
+        if store == SHARED_STORE:
+            write_owners(writer.folder, owners)
+        write_segment_files(writer.folder, chunk_table)
+        written.append((writer.folder, len(chunk_table)))
+
+    try:
+        for doc_id, owner, chunks, vectors in docs:
+            if writer is None:
+                writer, owners = SegmentWriter(new_segment_folder(store), EMBEDDING_DIM), {}
+            writer.add_chunks(doc_id, chunks, vectors)
+            owners[doc_id] = owner
+            doc_ids.append(doc_id)
+            stats["documents"] += 1
+            stats["rows"] += len(chunks)
+            if writer.count >= segment_rows:
+                finish_segment()
+                writer = None
+        if writer is not None:
+            finish_segment()
+            writer = None
+    except Exception:
+        if writer is not None:
+            writer.discard()
+        for folder, _ in written:
+            shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    with store_lock(store):
+        user_index = current_store_index(store)  # also migrates a legacy layout
+        manifest = read_manifest(store) or new_manifest()
+        replaced = []
+        if replace:
+            replaced = [entry["name"] for entry in manifest["segments"]]
+            manifest["segments"] = []
+        else:
+            for doc_id in doc_ids:
+                tombstone(store, manifest, user_index, doc_id)
+        for folder, rows in written:
+            publish_segment(store, manifest, folder, rows)
+        commit_manifest(store, manifest)
+        index_cache.invalidate(store)
+        for name in replaced:
+            shutil.rmtree(segment_folder(store, name), ignore_errors=True)
+
+    chunks_indexed.inc(stats["rows"])
+    schedule_merge(store)
+    stats["segments"] = len(written)
+    return stats
+
+
+def store_emails(store: str) -> list:
+    """Users whose documents a store holds: the email of a per-user store, the owners of the shared one."""
+    if store != SHARED_STORE:
+        return [store]
+    manifest = read_manifest(store)
+    emails = set()
+    for entry in (manifest["segments"] if manifest else []):
+        emails.update((read_owners(segment_folder(store, entry["name"])) or {}).values())
+    return sorted(emails)
+
+
+def document_chunks(email: str, doc_id: int):
+    """The indexed chunk texts of a live document (in order), or None if the store doesn't have it."""
+    store = _store_of(email)
+    manifest = read_manifest(store)
+    for entry in (manifest["segments"] if manifest else []):
+        if doc_id in entry["deleted"]:
+            continue
+        chunk_table = ChunkTable(segment_folder(store, entry["name"]), EMBEDDING_DIM)
+        if chunk_table.has_document(doc_id):
+            start, count = chunk_table.doc_rows[doc_id]
+            return [chunk_table.text(row) for row in range(start, start + count)]
+    return None
 
-    # Load index + chunks
-    index = faiss.read_index(index_file)
-    with open(chunks_file, "rb") as f:
-        all_chunks = pickle.load(f)
-
-    # Flatten chunks (doc_id → chunks)
-    flat_chunks = []
-    chunk_map = []  # maps index position → (doc_id, chunk_idx)
-    for doc_id, chunks in all_chunks.items():
-        for i, ch in enumerate(chunks):
-            flat_chunks.append(ch)
-            chunk_map.append((doc_id, i))
-
-    # Encode query
-    query_vec = get_single_embedding(query)
-
-    # Search
-    distances, indices = index.search(query_vec, top_k)
-
-    results = []
-    for idx, dist in zip(indices[0], distances[0]):
-        if idx < len(flat_chunks):
-            doc_id, chunk_idx = chunk_map[idx]
-            results.append({
+
+def remove_user_store(email: str):
+    """Delete a per-user store folder (after migrate_to_shared has copied it)."""
+    user_folder, _, _ = store_files(email)
+    with store_lock(email):
+        index_cache.invalidate(email)
+        shutil.rmtree(user_folder, ignore_errors=True)
+
+
+def live_chunk_texts():
+    """
+    Texts of every live (not deleted) chunk of every store, read from the
+    committed manifests; what the embedding store's garbage collection keeps.
+    """
+    if not os.path.isdir(DATA_DIR):
+        return
+    for store in sorted(os.listdir(DATA_DIR)):
+        manifest = read_manifest(store) if os.path.isdir(os.path.join(DATA_DIR, store)) else None
+        for entry in (manifest or {"segments": []})["segments"]:
+            chunk_table = ChunkTable(segment_folder(store, entry["name"]), EMBEDDING_DIM)
+            for doc_id, (start, count) in chunk_table.doc_rows.items():
+                if doc_id not in entry["deleted"]:
+                    for row in range(start, start + count):
+                        yield chunk_table.text(row)
+
+
+def _merge_top_k(per_segment: list, num_queries: int, top_k: int):
+    """Merge per-segment (distances, ids) results into the overall top_k per query."""
+    out_distances = np.full((num_queries, top_k), np.inf, dtype="float32")
+    out_ids = np.full((num_queries, top_k), -1, dtype="int64")
+    for qi in range(num_queries):
+        best = heapq.nsmallest(top_k, (
+            (float(dist), int(vector_id))
+            for distances, ids in per_segment
+            for dist, vector_id in zip(distances[qi], ids[qi])
+            if vector_id >= 0
+        ))
+        for rank, (dist, vector_id) in enumerate(best):
+            out_distances[qi, rank] = dist
+            out_ids[qi, rank] = vector_id
+    return out_distances, out_ids
+
+
+def _scan_rows(chunk_table: ChunkTable, rows: np.ndarray, query_vecs: np.ndarray, top_k: int):
+    """Exact top_k over some rows of a table from their stored vectors, shaped like index.search."""
+    vectors = np.ascontiguousarray(chunk_table.vectors()[rows], dtype="float32")
+    k = min(top_k, len(rows))
+    distances, found = faiss.knn(np.ascontiguousarray(query_vecs, dtype="float32"), vectors, k)
+    out_distances = np.full((len(query_vecs), top_k), np.inf, dtype="float32")
+    out_ids = np.full((len(query_vecs), top_k), -1, dtype="int64")
+    out_distances[:, :k] = distances
+    out_ids[:, :k] = np.where(found >= 0, chunk_table.ids()[rows][found], -1)
+    return out_distances, out_ids
+
+
+def run_parallel(tasks: list, executor: ThreadPoolExecutor = None) -> list:
+    """Results of zero-argument callables, run on the search pool (inline when there is only one)."""
+    if len(tasks) <= 1:
+        return [task() for task in tasks]
+    return list((executor or _search_executor).map(lambda task: task(), tasks))
+
+
+def search_user_index(user_index: UserIndex, query_vecs: np.ndarray, top_k: int,
+                      nprobe: int = None, ef_search: int = None):
+    """
+    Search every shard of every segment of a user (skipping tombstoned documents)
+    in parallel and merge the top_k.
+    In a shared-store view the search is limited to the tenants' rows: exactly
+    from the stored vectors when they are few (SHARED_SCAN_ROWS), otherwise
+    through the index with an ID selector.
+    """
+    tasks = []
+    selectors = []  # kept referenced until the searches are done: params don't own them
+    for segment in user_index.segments:
+        selector = segment.selector
+        if user_index.tenants is not None and segment.owners is not None:
+            rows = segment.visible_rows(user_index.tenants)
+            if len(rows) == 0:
+                continue
+            if len(rows) <= SHARED_SCAN_ROWS:
+                tasks.append(partial(_scan_rows, segment.chunk_table, rows, query_vecs, top_k))
+                continue
+            # Tombstoned rows are already left out of the tenants' rows
+            selector = faiss.IDSelectorBatch(segment.chunk_table.ids()[rows])
+            selectors.append(selector)
+        elif segment.live_rows() == 0:
+            continue
+        for shard in segment.shards:
+            params = search_params(shard, nprobe, ef_search, selector)
+            tasks.append(partial(
+                search_index, shard, query_vecs, top_k, params, exact_vectors=segment.chunk_table.vectors_for
+            ))
+    return _merge_top_k(run_parallel(tasks), len(query_vecs), top_k)
+
+
+def lexical_search(user_index: UserIndex, query: str, top_k: int) -> list:
+    """BM25 top_k over the live rows of all the user's segments, as [(vector_id, score)]."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    # idf and average length come from every live row, also in a shared-store view
+    segments = [segment for segment in user_index.segments if segment.live_rows()]
+    idf, avgdl = query_idf(
+        [segment.lexical for segment in segments], terms,
+        [segment.deleted_row_mask() if segment.deleted else None for segment in segments],
+    )
+
+    candidates = []
+    for segment in segments:
+        rows, scores = segment.lexical.score(terms, idf, avgdl)
+        if user_index.tenants is not None and segment.owners is not None:
+            visible = np.isin(rows, segment.visible_rows(user_index.tenants), assume_unique=True)
+            rows, scores = rows[visible], scores[visible]
+        elif segment.deleted:
+            live = ~segment.deleted_row_mask()[rows]
+            rows, scores = rows[live], scores[live]
+        if len(rows) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            rows, scores = rows[best], scores[best]
+        candidates.extend(zip(segment.chunk_table.ids()[rows].tolist(), scores.tolist()))
+    return heapq.nlargest(top_k, candidates, key=lambda candidate: candidate[1])
+
+
+def _search_block(user_index: UserIndex, queries: list, query_vecs: np.ndarray, top_k: int,
+                  nprobe: int, ef_search: int, fusion: str) -> list:
+    """Result lists of several queries, searched with one matrix search per shard."""
+    fetch = top_k if fusion == "dense" else top_k * HYBRID_CANDIDATES
+    with metrics.timed("vector_search"):
+        distances, indices = search_user_index(user_index, query_vecs, fetch, nprobe, ef_search)
+
+    found = []
+    lexical_seconds = lookup_seconds = 0.0
+    for query, row_distances, row_ids in zip(queries, distances, indices):
+        dense = [(int(i), float(d)) for i, d in zip(row_ids, row_distances) if i >= 0]
+        if fusion == "dense":
+            ranked = [(vector_id, dist, None) for vector_id, dist in dense]
+        else:
+            start = time.perf_counter()
+            dense_distance = dict(dense)
+            ranked = [
+                (vector_id, dense_distance.get(vector_id), score)
+                for vector_id, score in fuse(dense, lexical_search(user_index, query, fetch), fusion, top_k)
+            ]
+            lexical_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = []
+        for vector_id, dist, score in ranked:
+            hit = user_index.get_chunk(vector_id)
+            if hit is None:
+                continue
+            doc_id, chunk = hit
+            result = {
                 "doc_id": doc_id,
-                "chunk": flat_chunks[idx],
-                "distance": float(dist)
-            })
+                "chunk": chunk,
+                "distance": dist
+            }
+            if score is not None:
+                result["score"] = score
+            results.append(result)
+        found.append(results)
+        lookup_seconds += time.perf_counter() - start
+
+    # One observation per block, not per query
+    if fusion != "dense":
+        metrics.observe_stage("lexical_search", lexical_seconds)
+    metrics.observe_stage("chunk_lookup", lookup_seconds)
+    return found
+
+
+def get_faiss_results(email: str, query: str, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+                      fusion: str = "dense", query_vec: np.ndarray = None):
+    """
+    Retrieve top-k chunks from the user's FAISS index for a query.
+    nprobe (IVF) and ef_search (HNSW) override the index defaults for this query only.
+    fusion "rrf" or "weighted" merges the dense hits with BM25 hits (see lexical.fuse);
+    those results also carry the fused "score".
+    query_vec is the query's embedding, if the caller already computed it.
+    Repeated queries are answered from the query cache until the index changes.
+    """
+    if fusion not in FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode: {fusion}")
+
+    user_index = get_user_index(email)
+    if user_index is None:
+        return []
 
+    key = result_key(email, user_index.generation, user_index.version, query, top_k, nprobe, ef_search, fusion)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return [dict(r) for r in cached]
+
+    # Encode query and search
+    if query_vec is None:
+        query_vec = get_query_embedding(query)
+    results = _search_block(user_index, [query], query_vec, top_k, nprobe, ef_search, fusion)[0]
+
+    result_cache.put(key, [dict(r) for r in results])
     return results
+
+
+def search_batch(email: str, queries: list, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+                 fusion: str = "dense"):
+    """
+    Yield (query, results) for each query, in order, with the same results as
+    get_faiss_results. Queries are handled BATCH_SEARCH_BLOCK at a time: the
+    cache misses of a block are embedded in one call and searched with one
+    matrix search per shard. The whole batch sees one version of the index.
+    """
+    if fusion not in FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode: {fusion}")
+
+    user_index = get_user_index(email)
+    for block in batched(queries, BATCH_SEARCH_BLOCK):
+        if user_index is None:
+            for query in block:
+                yield query, []
+            continue
+
+        keys = [
+            result_key(email, user_index.generation, user_index.version, query, top_k, nprobe, ef_search, fusion)
+            for query in block
+        ]
+        found = [result_cache.get(key) for key in keys]
+        misses = [i for i, results in enumerate(found) if results is None]
+        if misses:
+            miss_queries = [block[i] for i in misses]
+            searched = _search_block(
+                user_index, miss_queries, get_query_embeddings(miss_queries), top_k, nprobe, ef_search, fusion
+            )
+            for i, results in zip(misses, searched):
+                result_cache.put(keys[i], [dict(r) for r in results])
+                found[i] = results
+
+        for query, results in zip(block, found):
+            yield query, [dict(r) for r in results]
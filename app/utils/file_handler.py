@@ -0,0 +1,77 @@
+# app/utils/file_handler.py
+import asyncio
+import codecs
+
+BLOCK_SIZE = 1024 * 1024  # bytes read / written per step when streaming files
+
+
+class TextStats:
+    """
+    Document metadata counted block by block while a file streams past, so
+    it matches len(text.split()) / text.count(".") without holding the text.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.words = 0
+        self.sentences = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._in_word = False  # previous block ended inside a word
+
+    def feed(self, block: bytes, final: bool = False):
+        self.size += len(block)
+        text = self._decoder.decode(block, final)
+        if not text:
+            return
+        words = len(text.split())
+        if self._in_word and not text[0].isspace():
+            words -= 1  # the first word continues the last one of the previous block
+        self.words += words
+        self.sentences += text.count(".")
+        self._in_word = not text[-1].isspace()
+
+
+def _write_block(f, stats: TextStats, block: bytes):
+    f.write(block)
+    stats.feed(block)
+
+
+async def save_upload(upload, path: str) -> TextStats:
+    """
+    Stream an UploadFile to path in BLOCK_SIZE blocks, counting its metadata on the way.
+    Writing and counting run in a worker thread so the event loop keeps serving requests.
+    """
+    stats = TextStats()
+    with open(path, "wb") as f:
+        while True:
+            block = await upload.read(BLOCK_SIZE)
+            if not block:
+                break
+            await asyncio.to_thread(_write_block, f, stats, block)
+    stats.feed(b"", final=True)
+    return stats
+
+
+def iter_file_text(path: str):
+    """Yield the decoded text of a utf-8 file BLOCK_SIZE bytes at a time."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            text = decoder.decode(block, final=not block)
+            if text:
+                yield text
+            if not block:
+                break
+
+
+def iter_file_words(path: str):
+    """Yield the whitespace-separated words of a utf-8 file, reading it BLOCK_SIZE at a time."""
+    partial = ""
+    for text in iter_file_text(path):
+        words = (partial + text).split()
+        # The last word may continue in the next block
+        partial = words.pop() if words and not text[-1].isspace() else ""
+        yield from words
+    if partial:
+        yield partial
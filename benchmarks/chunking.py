@@ -0,0 +1,123 @@
+"""
+Chunk counts, ingest time and retrieval quality of the chunking strategies.
+
+    python -m benchmarks.chunking --files docs/*.txt --queries 200 --k 5
+    python -m benchmarks.chunking --email someone@example.com --size 128 --overlap 16
+
+Queries are sentences sampled from the documents; a query counts as found when
+one of the top-k chunks contains the whole sentence (hit@k, MRR).
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from app.services import chunker
+from app.services.embedding import get_embeddings, count_tokens
+from app.services.ingest import UPLOAD_DIR
+from app.services.index_factory import build_index
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def sample_queries(texts: list, num_queries: int, min_words: int = 8, seed: int = 0) -> list:
+    sentences = [
+        _normalize(sentence)
+        for text in texts
+        for sentence in re.split(r"(?<=[.!?])\s+", text)
+        if len(sentence.split()) >= min_words
+    ]
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(sentences), min(num_queries, len(sentences)), replace=False)
+    return [sentences[i] for i in picks]
+
+
+def run(texts: list, queries: list, k: int, strategies: list, size: int = None, overlap: int = None):
+    query_vecs = get_embeddings(queries)
+
+    report = []
+    for strategy in strategies:
+        _, chunk_size, chunk_overlap = chunker.resolve_config(
+            strategy, size if strategy != "words" else None, overlap if strategy != "words" else None
+        )
+
+        start = time.perf_counter()
+        chunks = [chunk for text in texts for chunk in chunker.chunk_text(text, strategy, chunk_size, chunk_overlap)]
+        chunk_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = get_embeddings(chunks)
+        embed_s = time.perf_counter() - start
+
+        index = build_index("flat", vectors, np.arange(len(chunks), dtype="int64"), storage="float32")
+        _, found = index.search(query_vecs, k)
+
+        normalized = [_normalize(chunk) for chunk in chunks]
+        hits, reciprocal_ranks = 0, 0.0
+        for query, row in zip(queries, found):
+            for rank, chunk_id in enumerate(row):
+                if chunk_id >= 0 and query in normalized[chunk_id]:
+                    hits += 1
+                    reciprocal_ranks += 1 / (rank + 1)
+                    break
+
+        tokens = count_tokens(chunks)
+        report.append({
+            "strategy": strategy,
+            "size": chunk_size,
+            "overlap": chunk_overlap,
+            "chunks": len(chunks),
+            "mean_tokens": round(float(tokens.mean()), 1) if len(chunks) else 0.0,
+            "max_tokens": int(tokens.max()) if len(chunks) else 0,
+            "chunk_s": round(chunk_s, 3),
+            "embed_s": round(embed_s, 3),
+            "index_mb": round(vectors.nbytes / 2**20, 2),
+            f"hit@{k}": round(hits / max(len(queries), 1), 4),
+            "mrr": round(reciprocal_ranks / max(len(queries), 1), 4),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", nargs="*", default=[], help="text files to chunk")
+    parser.add_argument("--email", help="use this user's uploaded documents")
+    parser.add_argument("--strategies", nargs="*", default=list(chunker.STRATEGIES))
+    parser.add_argument("--size", type=int, help="chunk size in tokens (default: CHUNK_SIZE)")
+    parser.add_argument("--overlap", type=int, help="overlap in tokens (default: CHUNK_OVERLAP)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.files for path in glob.glob(pattern)]
+    if args.email:
+        paths += glob.glob(os.path.join(UPLOAD_DIR, args.email, "*"))
+    if not paths:
+        parser.error("no documents: pass --files or --email")
+
+    texts = []
+    for path in paths:
+        with open(path, "rb") as f:
+            texts.append(f.read().decode("utf-8", errors="ignore"))
+    queries = sample_queries(texts, args.queries)
+    report = run(texts, queries, args.k, args.strategies, args.size, args.overlap)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(paths)} documents, {len(queries)} queries, k={args.k}")
+    columns = list(report[0])
+    print("  ".join(f"{c:>11}" for c in columns))
+    for row in report:
+        print("  ".join(f"{str(row[c]):>11}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
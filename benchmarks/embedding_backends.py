@@ -0,0 +1,114 @@
+"""
+Ingest embedding throughput of the embedding backends (PyTorch, ONNX fp32, ONNX int8).
+
+    python -m benchmarks.embedding_backends --files docs/*.txt
+    python -m benchmarks.embedding_backends --chunks 2000 --backends torch onnx-int8 --threads 4
+
+Chunks are cut from the files (or synthetic text) the way uploads are, then
+embedded in batches of the embedding batcher's size. Every backend embeds the
+same chunks; cosine is against the torch vectors (mean / min over chunks).
+ONNX models are exported on first use and the export time is reported apart
+from load time.
+"""
+import argparse
+import glob
+import json
+import time
+
+import numpy as np
+
+from app.services import chunker, embedding, embedding_onnx
+
+
+def synthetic_texts(num_words: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    vocab = [f"term{i}" for i in range(5000)] + "the a of to and in is for on with as by".split()
+    words = rng.choice(vocab, num_words)
+    return [". ".join(" ".join(words[i:i + 12]) for i in range(start, start + 600, 12))
+            for start in range(0, num_words, 600)]
+
+
+def run(chunks: list, backends: list, batch_size: int) -> list:
+    report, reference = [], None
+    for backend in backends:
+        export_s = 0.0
+        if backend != "torch":
+            start = time.perf_counter()
+            embedding_onnx.export(embedding.MODEL_NAME, quantize=backend == "onnx-int8")
+            export_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        model = embedding.load_embedder(backend)
+        load_s = time.perf_counter() - start
+
+        model.encode(chunks[:batch_size], batch_size=batch_size)  # warm up
+        batch_ms, vectors = [], []
+        start = time.perf_counter()
+        for i in range(0, len(chunks), batch_size):
+            batch_start = time.perf_counter()
+            vectors.append(np.asarray(model.encode(chunks[i:i + batch_size], batch_size=batch_size), dtype="float32"))
+            batch_ms.append((time.perf_counter() - batch_start) * 1000)
+        total_s = time.perf_counter() - start
+        vectors = np.concatenate(vectors)
+
+        row = {
+            "backend": backend,
+            "chunks_per_s": round(len(chunks) / total_s, 1),
+            "batch_p50_ms": round(float(np.percentile(batch_ms, 50)), 1),
+            "batch_p95_ms": round(float(np.percentile(batch_ms, 95)), 1),
+            "load_s": round(load_s, 2),
+            "export_s": round(export_s, 2),
+        }
+        if reference is None and backend == "torch":
+            reference = vectors
+        if reference is not None:
+            cosine = (vectors * reference).sum(axis=1) / (
+                np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+            )
+            row["cosine_mean"] = round(float(cosine.mean()), 5)
+            row["cosine_min"] = round(float(cosine.min()), 5)
+        report.append(row)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", nargs="*", default=[], help="text files to chunk (default: synthetic text)")
+    parser.add_argument("--chunks", type=int, default=1000, help="chunks to embed per backend")
+    parser.add_argument("--backends", nargs="*", default=list(embedding.BACKENDS), choices=embedding.BACKENDS)
+    parser.add_argument("--batch", type=int, default=embedding.MAX_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, help="intra-op threads for torch and onnxruntime")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+        embedding_onnx.ONNX_THREADS = args.threads
+
+    paths = [path for pattern in args.files for path in glob.glob(pattern)]
+    texts = [open(path, encoding="utf-8", errors="ignore").read() for path in paths]
+    chunks = []
+    for text in texts or synthetic_texts(args.chunks * 200):
+        chunks.extend(chunker.chunk_text(text))
+        if len(chunks) >= args.chunks:
+            break
+    chunks = chunks[:args.chunks]
+    if not chunks:
+        parser.error("no text to embed")
+
+    backends = sorted(set(args.backends), key=embedding.BACKENDS.index)
+    report = run(chunks, backends, args.batch)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(chunks)} chunks, batch size {args.batch}")
+    columns = list(dict.fromkeys(c for row in report for c in row))
+    print("  ".join(f"{c:>13}" for c in columns))
+    for row in report:
+        print("  ".join(f"{str(row.get(c, '-')):>13}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Memory saved and recall lost by the quantized storage modes, measured against
+the float32 IndexFlatL2 path, with and without the exact float32 re-rank.
+
+    python -m benchmarks.quantization_report --vectors 50000 --k 10
+    python -m benchmarks.quantization_report --email someone@example.com --index hnsw
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from app.services import index_factory
+from benchmarks.recall_report import synthetic_corpus, user_corpus, recall_at_k
+
+
+def serialized_bytes(index) -> int:
+    if isinstance(index, faiss.IndexBinary):
+        return len(faiss.serialize_index_binary(index))
+    return len(faiss.serialize_index(index))
+
+
+def run(vectors: np.ndarray, num_queries: int, k: int, kind: str, rerank_factor: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(len(vectors), dtype="int64")
+    picks = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.05 * rng.standard_normal((len(picks), vectors.shape[1])).astype("float32")
+
+    baseline = index_factory.build_index("flat", vectors, ids, storage="float32")
+    _, truth = baseline.search(queries, k)
+    baseline_bytes = serialized_bytes(baseline)
+
+    def exact_vectors(candidate_ids):
+        return candidate_ids, vectors[candidate_ids]
+
+    report = []
+    for storage in index_factory.STORAGE_TYPES:
+        index_kind = "flat" if storage == "binary" else kind
+        index = index_factory.build_index(index_kind, vectors, ids, storage=storage)
+        size = serialized_bytes(index)
+
+        for factor in sorted({0, rerank_factor}):
+            index_factory.RERANK_FACTOR = factor
+            start = time.perf_counter()
+            for q in queries:
+                index_factory.search_index(index, q.reshape(1, -1), k, exact_vectors=exact_vectors)
+            query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            _, found = index_factory.search_index(index, queries, k, exact_vectors=exact_vectors)
+            report.append({
+                "storage": storage,
+                "index": index_kind,
+                "rerank_factor": factor,
+                "recall@k": round(recall_at_k(found, truth), 4),
+                "query_ms": round(query_ms, 3),
+                "index_mb": round(size / 2**20, 2),
+                "memory_saved": round(1 - size / baseline_bytes, 3),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", help="use this user's stored vectors instead of a synthetic corpus")
+    parser.add_argument("--vectors", type=int, default=50_000, help="synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index", default="flat", choices=["flat", "ivf_flat", "hnsw"])
+    parser.add_argument("--rerank-factor", type=int, default=index_factory.RERANK_FACTOR or 4)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    vectors = user_corpus(args.email) if args.email else synthetic_corpus(args.vectors)
+    report = run(vectors, args.queries, args.k, args.index, args.rerank_factor)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{len(vectors)} vectors, {args.queries} queries, k={args.k}, baseline float32 IndexFlatL2")
+    print(f"{'storage':<9}{'index':<10}{'rerank':>7}{'recall@k':>10}{'query ms':>10}{'MB':>9}{'saved':>8}")
+    for row in report:
+        print(f"{row['storage']:<9}{row['index']:<10}{row['rerank_factor']:>7}{row['recall@k']:>10}"
+              f"{row['query_ms']:>10}{row['index_mb']:>9}{row['memory_saved']:>8}")
+
+
+if __name__ == "__main__":
+    main()
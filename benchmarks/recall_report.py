@@ -0,0 +1,116 @@
+"""
+Recall@k report for the vectorstore index backends against the exact Flat baseline.
+
+    python -m benchmarks.recall_report --vectors 50000 --queries 200 --k 10
+    python -m benchmarks.recall_report --email someone@example.com --nprobe 8 32
+
+With --email the stored vectors of that user are used, otherwise a synthetic
+clustered corpus is generated.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.services import index_factory, vectorstore
+from app.services.embedding import EMBEDDING_DIM
+
+
+def synthetic_corpus(num_vectors: int, num_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around random centroids, roughly like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((num_clusters, EMBEDDING_DIM)).astype("float32")
+    labels = rng.integers(0, num_clusters, num_vectors)
+    vectors = centroids[labels] + 0.6 * rng.standard_normal((num_vectors, EMBEDDING_DIM)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype("float32")
+
+
+def user_corpus(email: str) -> np.ndarray:
+    """The live vectors of every segment of a user's store."""
+    user_index = vectorstore.get_user_index(email)
+    if user_index is None:
+        return np.zeros((0, EMBEDDING_DIM), dtype="float32")
+    parts = []
+    for segment in user_index.segments:
+        rows = segment.visible_rows(user_index.tenants)
+        parts.append(np.asarray(segment.chunk_table.vectors()[rows], dtype="float32"))
+    return np.concatenate(parts or [np.zeros((0, EMBEDDING_DIM), dtype="float32")])
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(vectors: np.ndarray, num_queries: int, k: int, nprobes: list, ef_searches: list, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(len(vectors), dtype="int64")
+    picks = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.05 * rng.standard_normal((len(picks), vectors.shape[1])).astype("float32")
+
+    baseline = index_factory.build_index("flat", vectors, ids)
+    _, truth = baseline.search(queries, k)
+
+    report = []
+    for kind in index_factory.INDEX_TYPES:
+        if kind in ("ivf_flat", "ivf_pq") and len(vectors) < index_factory._min_train_size(kind, len(vectors)):
+            print(f"skipping {kind}: needs {index_factory._min_train_size(kind, len(vectors))} vectors to train")
+            continue
+
+        start = time.perf_counter()
+        index = index_factory.build_index(kind, vectors, ids)
+        build_s = time.perf_counter() - start
+
+        knobs = {"ivf_flat": nprobes, "ivf_pq": nprobes, "hnsw": ef_searches}.get(kind, [None])
+        for knob in knobs:
+            if kind == "hnsw":
+                params = index_factory.search_params(index, ef_search=knob)
+            else:
+                params = index_factory.search_params(index, nprobe=knob)
+
+            start = time.perf_counter()
+            for q in queries:
+                index.search(q.reshape(1, -1), k, params=params)
+            query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            _, found = index.search(queries, k, params=params)
+            report.append({
+                "index": kind,
+                "knob": knob,
+                "recall@k": round(recall_at_k(found, truth), 4),
+                "query_ms": round(query_ms, 3),
+                "build_s": round(build_s, 2),
+                "memory_mb": round(index_factory.index_nbytes(index) / 2**20, 1),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", help="use this user's stored vectors instead of a synthetic corpus")
+    parser.add_argument("--vectors", type=int, default=50_000, help="synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    vectors = user_corpus(args.email) if args.email else synthetic_corpus(args.vectors)
+    report = run(vectors, args.queries, args.k, args.nprobe, args.ef_search)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{len(vectors)} vectors, {args.queries} queries, k={args.k}")
+    print(f"{'index':<10}{'knob':>6}{'recall@k':>10}{'query ms':>10}{'build s':>9}{'MB':>8}")
+    for row in report:
+        knob = "-" if row["knob"] is None else row["knob"]
+        print(f"{row['index']:<10}{knob:>6}{row['recall@k']:>10}{row['query_ms']:>10}{row['build_s']:>9}{row['memory_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
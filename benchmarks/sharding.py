@@ -0,0 +1,91 @@
+"""
+Single-query search latency as a corpus is split into more shards searched in parallel.
+
+    python -m benchmarks.sharding --vectors 1000000 --shards 1 2 4 8 --queries 200
+    python -m benchmarks.sharding --email someone@example.com --index hnsw
+
+For each shard count the corpus is split into that many indexes (as
+index_factory.build_shards does for a segment) and every query searches them on
+that many threads, merging the per-shard top-k. Speedup is against 1 shard and
+recall@k against the 1-shard results.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from app.services import index_factory, vectorstore
+from benchmarks.recall_report import synthetic_corpus, user_corpus, recall_at_k
+
+
+def run(vectors: np.ndarray, num_queries: int, k: int, shard_counts: list, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(len(vectors), dtype="int64")
+    picks = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.05 * rng.standard_normal((len(picks), vectors.shape[1])).astype("float32")
+
+    report, baseline = [], None
+    for num_shards in shard_counts:
+        start = time.perf_counter()
+        shards = index_factory.build_shards(vectors, ids, num_shards)
+        build_s = time.perf_counter() - start
+
+        latencies, found = [], []
+        with ThreadPoolExecutor(max_workers=num_shards) as executor:
+            for q in queries:
+                q = q.reshape(1, -1)
+                start = time.perf_counter()
+                per_shard = vectorstore.run_parallel(
+                    [partial(index_factory.search_index, shard, q, k) for shard in shards], executor
+                )
+                _, top_ids = vectorstore._merge_top_k(per_shard, 1, k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found.append(top_ids[0])
+        found = np.array(found)
+        if baseline is None:
+            baseline = (float(np.median(latencies)), found)
+
+        report.append({
+            "shards": num_shards,
+            "index": index_factory.index_type(shards[0]),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "speedup": round(baseline[0] / float(np.median(latencies)), 2),
+            f"recall@{k}": round(recall_at_k(found, baseline[1]), 4),
+            "build_s": round(build_s, 2),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=500_000, help="synthetic corpus size")
+    parser.add_argument("--email", help="use this user's stored vectors instead of a synthetic corpus")
+    parser.add_argument("--index", default="flat", choices=index_factory.INDEX_TYPES, help="index type of every shard")
+    parser.add_argument("--shards", type=int, nargs="*", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    index_factory.INDEX_TYPE = args.index
+    vectors = user_corpus(args.email) if args.email else synthetic_corpus(args.vectors)
+    if len(vectors) == 0:
+        parser.error("no vectors to search")
+    report = run(vectors, args.queries, args.k, sorted(set(args.shards)))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(vectors)} vectors, {args.queries} queries, k={args.k}")
+    columns = list(report[0])
+    print("  ".join(f"{c:>10}" for c in columns))
+    for row in report:
+        print("  ".join(f"{str(row[c]):>10}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
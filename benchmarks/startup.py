@@ -0,0 +1,81 @@
+"""
+Process startup cost: how long importing the app takes and how much memory it
+holds before and after the models are loaded.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --module app.services.vectorstore --no-load
+
+Every run is a fresh interpreter (nothing cached in-process). A run imports the
+module, then loads every model registered with model_loader and embeds one
+query. Since models load lazily, import_s is what a worker, test run or CLI
+pays before it can do anything; load_s is paid once, on first use or by the
+background warmup.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+CHILD = """
+import importlib, json, resource, sys, time
+
+def rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+report = {}
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+report["import_s"] = time.perf_counter() - start
+report["rss_import_mb"] = rss_mb()
+
+if sys.argv[2] == "1":
+    from app.services import model_loader
+    from app.services.embedding import get_single_embedding
+    start = time.perf_counter()
+    model_loader.load_all()
+    report["load_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    get_single_embedding("warm up query")
+    report["first_query_ms"] = (time.perf_counter() - start) * 1000
+    report["rss_loaded_mb"] = rss_mb()
+print(json.dumps(report))
+"""
+
+
+def measure(module: str, load: bool) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, module, "1" if load else "0"],
+        capture_output=True, text=True, check=True,
+    )
+    # the JSON report is the last line; the app may print before it
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(module: str, runs: int, load: bool) -> dict:
+    samples = [measure(module, load) for _ in range(runs)]
+    report = {"module": module, "runs": runs}
+    for key in samples[0]:
+        report[key] = round(float(np.median([s[key] for s in samples])), 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to import (main = the FastAPI app)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-load", action="store_true", help="only measure the import, not model loading")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.module, args.runs, not args.no_load)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:>16}  {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Deterministic stand-ins for the embedding model and the LLM, so benchmarks run
+offline and measure the app rather than the models.
+
+    from benchmarks import stubs
+    stubs.install(embed_ms=2, llm_ms=50)   # before the first embedding / answer
+
+The embedder hashes words into EMBEDDING_DIM buckets (texts sharing words are
+close, so searches find what they should); the LLM echoes the query. The
+optional delays sleep, releasing the GIL the way model inference does.
+"""
+import re
+import time
+import zlib
+
+import numpy as np
+
+from app.services import model_loader, model_client, embedding, llm
+from app.services.embedding import EMBEDDING_DIM
+
+
+class StubEmbedder:
+    """The part of the SentenceTransformer interface embedding.py uses; no tokenizer (word counts are used)"""
+
+    def __init__(self, batch_ms: float = 0.0, text_ms: float = 0.0):
+        self.batch_ms = batch_ms
+        self.text_ms = text_ms
+
+    def encode(self, texts: list, **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                h = zlib.crc32(word.encode("utf-8"))  # stable across runs, unlike hash()
+                vectors[row, h % EMBEDDING_DIM] += 1.0 if h & 0x80000000 else -1.0
+        vectors[:, 0] += 1e-3  # no all-zero rows
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        delay = self.batch_ms + self.text_ms * len(texts)
+        if delay:
+            time.sleep(delay / 1000)
+        return vectors
+
+
+def install(embed_ms: float = 0.0, embed_text_ms: float = 0.0, llm_ms: float = 0.0, llm_tokens: int = 8):
+    """
+    Swap the models for stubs (in this process). embed_ms / embed_text_ms: delay
+    per encode call / per text; llm_ms: delay per answer, spread over llm_tokens
+    streamed pieces.
+    """
+    model_client.SOCKET_PATH = None  # answer in this process, not from a model server
+    embedder = StubEmbedder(embed_ms, embed_text_ms)
+    embedding._embedder = model_loader.register("embedding", lambda: embedder)
+
+    def answer(faiss_results, query, temperature=0.2, max_tokens=50):
+        if llm_ms:
+            time.sleep(llm_ms / 1000)
+        return f"stub answer to {query!r} from {len(faiss_results)} chunks"
+
+    def pieces(faiss_results, query, temperature, max_tokens, usage=None):
+        for i in range(llm_tokens):
+            if llm_ms:
+                time.sleep(llm_ms / 1000 / llm_tokens)
+            if usage is not None:
+                usage["tokens"] = i + 1   # one token per piece
+            yield f"token{i} "
+
+    llm._local_generate_answer = answer
+    llm._stream_pieces = pieces
+    llm._generator = model_loader.register("llm", lambda: answer)
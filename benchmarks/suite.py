@@ -0,0 +1,517 @@
+"""
+Performance benchmark suite: microbenchmarks of the ingest and search paths
+and an in-process load test of the FastAPI app, on a synthetic corpus, with the
+models replaced by deterministic stubs (offline and reproducible).
+
+    python -m benchmarks.suite --out baseline.json
+    python -m benchmarks.suite --users 4 --docs 50 --words 2000 --queries 200
+    python -m benchmarks.suite --compare baseline.json --tolerance 0.2    # exit code 1 on a regression
+    python -m benchmarks.suite --only load --concurrency 32 --mix search=0.7,upload=0.2,stream=0.1
+    python -m benchmarks.suite --embed-ms 5 --llm-ms 200                  # stubs with model-like latency
+
+Microbenchmarks time split_text, get_embeddings, update_vectorstore,
+get_faiss_results and the delete_file route one call at a time. The load test
+runs --concurrency clients against the app through httpx's ASGI transport
+(no server, no network), issuing --requests requests of the --mix, then waits
+for the uploads to be indexed.
+
+The report (JSON with --out / --json) has p50/p95/p99 latency in ms and
+throughput per benchmark, and the peak RSS after each phase. With --compare,
+latency or RSS above the baseline by more than --tolerance, or throughput
+below it, is a regression.
+
+Everything runs in a scratch directory (its own app.db and data/), removed at
+the end unless --keep; the repository's data is never touched.
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The app is imported only once the working directory is the scratch one: the
+# DB path is made absolute when the engine is created, at import.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # the app is imported from the scratch directory
+WARMUP_CALLS = 3          # untimed calls before each microbenchmark
+MIN_DELTA_MS = 0.1        # latency changes smaller than this are never regressions
+# Latency metrics compared, with the samples needed for each to be stable enough
+MIN_SAMPLES = {"p50_ms": 1, "mean_ms": 1, "p95_ms": 20, "p99_ms": 100}
+DEFAULT_MIX = "search=0.8,upload=0.1,stream=0.05,home=0.05"
+LOAD_OPS = ("search", "stream", "upload", "home")
+
+
+# ===== Synthetic corpus =====
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vo", "zi", "pa", "qu", "do", "fe", "gi", "ho", "ju"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def synthetic_text(num_words: int, words: list, weights: list, rng: random.Random) -> str:
+    """Sentences of 8-20 Zipf-distributed words, in paragraphs of about five sentences"""
+    picked = rng.choices(words, weights, k=num_words)
+    sentences, i = [], 0
+    while i < len(picked):
+        n = rng.randint(8, 20)
+        sentences.append(" ".join(picked[i:i + n]).capitalize() + ".")
+        i += n
+    return "\n\n".join(" ".join(sentences[p:p + 5]) for p in range(0, len(sentences), 5))
+
+
+def synthetic_corpus(users: int, docs: int, num_words: int, seed: int = 0) -> dict:
+    """{email: [(doc name, text)]}, the same for the same arguments"""
+    rng = random.Random(seed)
+    words = vocabulary(5000, rng)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return {
+        f"bench{u}@example.com": [
+            (f"doc{d}.txt", synthetic_text(num_words, words, weights, rng)) for d in range(docs)
+        ]
+        for u in range(users)
+    }
+
+
+def sample_queries(texts: list, count: int, rng: random.Random) -> list:
+    """Runs of 4-8 consecutive words taken from the texts (so every query has matches)"""
+    queries = []
+    for _ in range(count):
+        tokens = rng.choice(texts).replace(".", "").split()
+        start = rng.randrange(max(len(tokens) - 8, 1))
+        queries.append(" ".join(tokens[start:start + rng.randint(4, 8)]))
+    return queries
+
+
+# ===== Measurement =====
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def summarize(latencies: list, seconds: float, items: int = None, unit: str = None) -> dict:
+    """Latency percentiles (ms) and throughput of one benchmark"""
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    report = {
+        "count": len(latencies),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "ops_per_s": round(len(latencies) / seconds, 2) if seconds else None,
+    }
+    if unit:
+        report[f"{unit}_per_s"] = round(items / seconds, 1) if seconds else None
+    return report
+
+
+def timed_calls(fn, calls: list):
+    """Call fn(*args) for each args in calls; (latencies in s, wall seconds, results)"""
+    latencies, results = [], []
+    start = time.perf_counter()
+    for args in calls:
+        t = time.perf_counter()
+        results.append(fn(*args))
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - start, results
+
+
+# ===== Microbenchmarks =====
+
+def create_documents(corpus: dict) -> dict:
+    """Users, Document rows and upload files for the corpus; {email: [(doc_id, text)]}"""
+    from app.database import SessionLocal
+    from app.models import User, Document
+    from app.services.ingest import upload_path
+
+    db = SessionLocal()
+    try:
+        users = {email: User(email=email, password="-") for email in corpus}
+        db.add_all(users.values())
+        db.flush()
+        rows = {
+            email: [Document(user_id=users[email].user_id, doc_name=name, size=len(text) // 1024,
+                             total_words=len(text.split()), total_sentences=text.count("."))
+                    for name, text in docs]
+            for email, docs in corpus.items()
+        }
+        db.add_all([row for docs in rows.values() for row in docs])
+        db.commit()
+        created = {}
+        for email, docs in corpus.items():
+            created[email] = []
+            for row, (name, text) in zip(rows[email], docs):
+                path = upload_path(email, row.doc_id, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                created[email].append((row.doc_id, text))
+        return created
+    finally:
+        db.close()
+
+
+def wait_for_merges():
+    """Block until queued segment merges are done, so they don't overlap the next measurement"""
+    from app.services import segments
+    segments._merge_executor.submit(lambda: None).result()  # one worker: runs after them
+
+
+def index_corpus(corpus: dict):
+    """Untimed: the corpus's documents, indexed (for --only load)"""
+    from app.services.vectorstore import update_vectorstore
+    for email, entries in create_documents(corpus).items():
+        for doc_id, text in entries:
+            update_vectorstore(email, doc_id, text)
+    wait_for_merges()
+
+
+def _delete(delete_file, doc_id: int):
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return delete_file(doc_id, db)
+    finally:
+        db.close()
+
+
+def run_micro(corpus: dict, args, rng: random.Random) -> dict:
+    from app.routes.delete import delete_file  # imports FastAPI: not inside the timed calls
+    from app.services.embedding import get_embeddings
+    from app.services.vectorstore import split_text, update_vectorstore, get_faiss_results
+
+    report = {}
+    docs = create_documents(corpus)
+    texts = [text for entries in docs.values() for _, text in entries]
+    words = sum(len(text.split()) for text in texts)
+
+    # split_text: one document per call
+    for text in texts[:WARMUP_CALLS]:
+        split_text(text)
+    latencies, seconds, chunk_lists = timed_calls(split_text, [(text,) for text in texts])
+    report["split_text"] = summarize(latencies, seconds, words, "words")
+    chunks = [chunk for chunk_list in chunk_lists for chunk in chunk_list]
+
+    # get_embeddings: --embed-batch chunks per call
+    batches = [(chunks[i:i + args.embed_batch],) for i in range(0, len(chunks), args.embed_batch)]
+    for batch in batches[:WARMUP_CALLS]:
+        get_embeddings(*batch)
+    latencies, seconds, _ = timed_calls(get_embeddings, batches)
+    report["get_embeddings"] = summarize(latencies, seconds, len(chunks), "texts")
+
+    # update_vectorstore: one document per call, into each user's store
+    calls = [(email, doc_id, text) for email, entries in docs.items() for doc_id, text in entries]
+    latencies, seconds, _ = timed_calls(update_vectorstore, calls)
+    report["update_vectorstore"] = summarize(latencies, seconds, words, "words")
+    wait_for_merges()
+
+    # get_faiss_results: --queries sampled queries per user, against their own store
+    calls = [
+        (email, query, args.top_k, None, None, args.fusion)
+        for email, entries in docs.items()
+        for query in sample_queries([text for _, text in entries], args.queries, rng)
+    ]
+    for email in docs:
+        for query in sample_queries(texts, WARMUP_CALLS, rng):
+            get_faiss_results(email, "warmup " + query, args.top_k, fusion=args.fusion)
+    latencies, seconds, results = timed_calls(get_faiss_results, calls)
+    report["get_faiss_results"] = summarize(latencies, seconds)
+    report["get_faiss_results"]["empty_results"] = sum(1 for r in results if not r)
+
+    # delete_file route: --delete-fraction of each user's documents
+    calls = [
+        (delete_file, doc_id) for entries in docs.values()
+        for doc_id, _ in entries[:max(1, int(len(entries) * args.delete_fraction))]
+    ]
+    latencies, seconds, _ = timed_calls(_delete, calls)
+    report["delete_file"] = summarize(latencies, seconds)
+    return report
+
+
+# ===== Load test =====
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        op, _, weight = part.partition("=")
+        if op.strip() not in LOAD_OPS:
+            raise ValueError(f"Unknown operation in --mix: {op} (expected {LOAD_OPS})")
+        weights[op.strip()] = float(weight or 1)
+    return weights
+
+
+def _ensure_users(emails: list) -> dict:
+    """{email: user_id}, creating the users the micro phase didn't"""
+    from app.database import SessionLocal
+    from app.models import User
+    db = SessionLocal()
+    try:
+        existing = {user.email: user.user_id for user in db.query(User).filter(User.email.in_(emails))}
+        for email in emails:
+            if email not in existing:
+                user = User(email=email, password="-")
+                db.add(user)
+                db.flush()
+                existing[email] = user.user_id
+        db.commit()
+        return existing
+    finally:
+        db.close()
+
+
+def _pending_jobs() -> int:
+    from app.database import SessionLocal
+    from app.models import IngestJob
+    from app.services.ingest import FINISHED_STATES
+    db = SessionLocal()
+    try:
+        return db.query(IngestJob).filter(IngestJob.status.notin_(FINISHED_STATES)).count()
+    finally:
+        db.close()
+
+
+async def _load(app, corpus: dict, user_ids: dict, args, rng: random.Random) -> dict:
+    import httpx
+
+    mix = parse_mix(args.mix)
+    ops, weights = list(mix), list(mix.values())
+    texts = [text for docs in corpus.values() for _, text in docs]
+    words = sorted({word for text in texts[:20] for word in text.replace(".", "").split()})
+    word_weights = [1 / rank for rank in range(1, len(words) + 1)]
+    queries = {email: sample_queries([t for _, t in docs], 1000, rng) for email, docs in corpus.items()}
+    emails = list(corpus)
+
+    latencies = {op: [] for op in ops}
+    statuses = {}
+    remaining = [args.requests]
+    uploads = [0]
+
+    async def request(client, op: str):
+        email = rng.choice(emails)
+        headers = {"Cookie": f"user_id={user_ids[email]}"}
+        if op in ("search", "stream"):
+            form = {"query": rng.choice(queries[email]), "top_k": str(args.top_k), "fusion": args.fusion,
+                    "temperature": "0.1", "max_tokens": "20"}
+            return await client.post("/search" if op == "search" else "/search/stream", data=form, headers=headers)
+        if op == "upload":
+            uploads[0] += 1
+            text = synthetic_text(args.words, words, word_weights, rng)
+            return await client.post(
+                "/upload/", data={"email": email}, files={"file": (f"load{uploads[0]}.txt", text.encode("utf-8"))}
+            )
+        return await client.get("/home", headers=headers)
+
+    async def worker(client):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            op = rng.choices(ops, weights)[0]
+            start = time.perf_counter()
+            response = await request(client, op)
+            latencies[op].append(time.perf_counter() - start)
+            key = f"{op} {response.status_code}"
+            statuses[key] = statuses.get(key, 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+            seconds = time.perf_counter() - start
+
+            # Uploads are indexed in the background: wait for the ingest pool to drain
+            drain_start = time.perf_counter()
+            while _pending_jobs() and time.perf_counter() - drain_start < args.drain_timeout:
+                await asyncio.sleep(0.05)
+            ingest_seconds = time.perf_counter() - start
+
+    report = {op: summarize(values, seconds) for op, values in latencies.items() if values}
+    report["total"] = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seconds": round(seconds, 3),
+        "ops_per_s": round(args.requests / seconds, 2),
+        "statuses": dict(sorted(statuses.items())),
+        "errors": sum(n for key, n in statuses.items() if int(key.split()[1]) >= 400),
+    }
+    if uploads[0]:
+        report["ingest"] = {
+            "documents": uploads[0],
+            "seconds": round(ingest_seconds, 3),
+            "docs_per_s": round(uploads[0] / ingest_seconds, 2),
+            "unfinished": _pending_jobs(),
+        }
+    return report
+
+
+def run_load(corpus: dict, args, rng: random.Random) -> dict:
+    import main  # imported here: it initializes the DB in the working directory
+    user_ids = _ensure_users(list(corpus))
+    return asyncio.run(_load(main.app, corpus, user_ids, args, rng))
+
+
+# ===== Report and baseline comparison =====
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    (benchmark, metric, baseline, current, change, regression) for the metrics
+    in both reports; tail percentiles only where both have enough samples.
+    """
+    rows = []
+    for section in ("micro", "load"):
+        for name, metrics in report.get(section, {}).items():
+            base_metrics = baseline.get(section, {}).get(name, {})
+            for metric, value in metrics.items():
+                base = base_metrics.get(metric)
+                if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+                    continue
+                if metric in MIN_SAMPLES:
+                    if min(metrics.get("count", 0), base_metrics.get("count", 0)) < MIN_SAMPLES[metric]:
+                        continue
+                    regression = value - base > max(base * tolerance, MIN_DELTA_MS)
+                elif metric.endswith("_per_s"):
+                    regression = value < base * (1 - tolerance)
+                else:
+                    continue
+                rows.append((f"{section}.{name}", metric, base, value, round(value / base - 1, 3), regression))
+    for phase, value in report.get("peak_rss_mb", {}).items():
+        base = baseline.get("peak_rss_mb", {}).get(phase)
+        if base:
+            rows.append((f"rss.{phase}", "peak_rss_mb", base, value, round(value / base - 1, 3), value > base * (1 + tolerance)))
+    return rows
+
+
+def print_report(report: dict):
+    print(f"commit {report['meta']['commit']}  {json.dumps(report['meta']['config'])}")
+    for section in ("micro", "load"):
+        for name, metrics in report.get(section, {}).items():
+            values = "  ".join(f"{key}={value}" for key, value in metrics.items() if not isinstance(value, dict))
+            print(f"{section:>5} {name:<20} {values}")
+    print(f"peak RSS (MB): {report['peak_rss_mb']}")
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _scratch_dir(work_dir: str = None) -> str:
+    """A working directory with app/templates and app/static (main.py loads them relative to it)"""
+    work_dir = work_dir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.makedirs(os.path.join(work_dir, "app"), exist_ok=True)
+    for name in ("templates", "static"):
+        link = os.path.join(work_dir, "app", name)
+        if not os.path.exists(link):
+            os.symlink(os.path.join(ROOT, "app", name), link)
+    return work_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--docs", type=int, default=20, help="documents per user")
+    parser.add_argument("--words", type=int, default=1500, help="words per document")
+    parser.add_argument("--queries", type=int, default=100, help="microbenchmark queries per user")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--fusion", default="dense", choices=("dense", "rrf", "weighted"))
+    parser.add_argument("--embed-batch", type=int, default=32, help="texts per get_embeddings call")
+    parser.add_argument("--delete-fraction", type=float, default=0.2, help="documents per user deleted")
+    parser.add_argument("--requests", type=int, default=300, help="load test requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="load test concurrent clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"load test operations and weights ({', '.join(LOAD_OPS)})")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="seconds to wait for uploads to be indexed")
+    parser.add_argument("--only", choices=("micro", "load"), help="run one phase only")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-models", action="store_true", help="use the configured models instead of stubs")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="stub embedder delay per call")
+    parser.add_argument("--embed-text-ms", type=float, default=0.0, help="stub embedder delay per text")
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="stub LLM delay per answer")
+    parser.add_argument("--work-dir", help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--out", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change allowed before a regression")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    work_dir = _scratch_dir(args.work_dir)
+    if not args.keep and not args.work_dir:
+        # At exit, once the background threads (ingest, segment merges) have finished
+        atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    os.chdir(work_dir)  # for good: background threads use paths relative to it
+
+    from app.database import init_db
+    from app.services import index_factory, vectorstore
+    from app.services.embedding import EMBEDDING_BACKEND
+    if not args.real_models:
+        from benchmarks import stubs
+        stubs.install(args.embed_ms, args.embed_text_ms, args.llm_ms)
+
+    init_db()
+    rng = random.Random(args.seed)
+    corpus = synthetic_corpus(args.users, args.docs, args.words, args.seed)
+    config = {key: value for key, value in vars(args).items()
+              if key not in ("work_dir", "keep", "out", "compare", "tolerance", "json")}
+    config.update(index=index_factory.INDEX_TYPE, layout=vectorstore.VECTORSTORE_LAYOUT,
+                  backend="stub" if not args.real_models else EMBEDDING_BACKEND)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": config,
+        },
+        "peak_rss_mb": {},
+    }
+    if args.only in (None, "micro"):
+        report["micro"] = run_micro(corpus, args, rng)
+        report["peak_rss_mb"]["micro"] = peak_rss_mb()
+    else:
+        index_corpus(corpus)
+    if args.only in (None, "load"):
+        report["load"] = run_load(corpus, args, rng)
+        report["peak_rss_mb"]["load"] = peak_rss_mb()
+
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["config"] != report["meta"]["config"]:
+            print("warning: the baseline was run with a different configuration")
+        rows = compare(report, baseline, args.tolerance)
+        regressions = [row for row in rows if row[5]]
+        print(f"\nvs {args.compare} (commit {baseline['meta']['commit']}), tolerance {args.tolerance:.0%}:")
+        for name, metric, base, value, change, regression in rows:
+            flag = "REGRESSION" if regression else ""
+            print(f"  {name:<28} {metric:<14} {base:>12} -> {value:<12} {change:+.1%}  {flag}")
+        print(f"{len(regressions)} regression(s)")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
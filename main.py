@@ -1,30 +1,65 @@
+import json
+import time
+
 from fastapi import FastAPI, Request, Cookie, Depends, Form
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from sqlalchemy.orm import Session
 from app.database import get_db, init_db
-from app.models import User, Document
+from app.auth.utils import get_user, get_user_async, get_user_cache_stats
+from app.docs.utils import list_documents, DOCS_PAGE_SIZE
 
 # Services
-from app.services.vectorstore import get_faiss_results
-from app.services.llm import generate_answer
+from app.services.vectorstore import get_faiss_results, get_cache_stats
+from app.services.lexical import FUSION_MODES
+from app.services.embedding import get_embedding_stats
+from app.services.embedding_store import get_embedding_store_stats
+from app.services.llm import generate_answer, stream_answer, get_llm_stats
+from app.services.ingest import resume_pending_jobs
+from app.services.query_cache import get_query_cache_stats, load_query_cache, save_query_cache, get_query_embedding
+from app.services import executors, model_loader, metrics
+from app.services.executors import PoolSaturated, get_executor_stats
 
 # Routers
-from app.routes import upload, download, delete
+from app.routes import upload, download, delete, search
 from app.auth import routes as auth_routes
 from app.docs import routes as docs_routes
 
 init_db()
 
 app = FastAPI(title="RAG Document Search Engine", version="0.1.0")
+# Latency per route, and with SERVER_TIMING=1 a Server-Timing header with each request's stages
+app.add_middleware(metrics.TimingMiddleware)
 
 # Static & templates
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 
+@app.exception_handler(PoolSaturated)
+def pool_saturated(request: Request, exc: PoolSaturated):
+    """Shed load instead of queueing without bound: the client should retry"""
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+
+@app.on_event("startup")
+def startup():
+    # Pick up uploads whose indexing was interrupted by a restart
+    resume_pending_jobs()
+    load_query_cache()
+    # Models load lazily on first use; warm them up in the background so
+    # /health answers immediately and /ready flips once they are in memory
+    if model_loader.WARMUP:
+        model_loader.warmup()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    save_query_cache()
+
+
 @app.get("/")
 def root(request: Request):
     """Login page"""
@@ -32,23 +67,25 @@ def root(request: Request):
 
 
 @app.get("/home")
-def home(request: Request, user_id: str = Cookie(None), db: Session = Depends(get_db)):
-    """User dashboard showing uploaded docs + search bar"""
+def home(request: Request, user_id: str = Cookie(None), page: int = 1, page_size: int = DOCS_PAGE_SIZE,
+         db: Session = Depends(get_db)):
+    """User dashboard showing uploaded docs (one page of them) + search bar"""
     if not user_id:
         return RedirectResponse(url="/")
 
-    user = db.query(User).filter(User.user_id == int(user_id)).first()
+    user = get_user(user_id, db=db)
     if not user:
         return RedirectResponse(url="/")
 
-    documents = db.query(Document).filter(Document.user_id == user.user_id).all()
+    listing = list_documents(db, user.user_id, page, page_size)
 
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
             "email": user.email,
-            "documents": documents,
+            "documents": listing["documents"],
+            "listing": listing,
             "query": "",
             "faiss_results": [],
             "llm_answer": "",
@@ -60,30 +97,40 @@ def home(request: Request, user_id: str = Cookie(None), db: Session = Depends(ge
 
 
 @app.post("/search")
-def perform_search(
+async def perform_search(
     request: Request,
     user_id: str = Cookie(None),
     query: str = Form(...),
     top_k: int = Form(5),
     temperature: float = Form(0.7),
     max_tokens: int = Form(5),
-    db: Session = Depends(get_db),
+    nprobe: int = Form(None),
+    ef_search: int = Form(None),
+    fusion: str = Form("dense"),
 ):
     """Perform RAG search across all docs for this user"""
     if not user_id:
         return RedirectResponse(url="/")
 
-    user = db.query(User).filter(User.user_id == int(user_id)).first()
+    # No DB session is held while the models run: the user comes from the cache
+    user = await get_user_async(user_id)
     if not user:
         return RedirectResponse(url="/")
 
-    documents = db.query(Document).filter(Document.user_id == user.user_id).all()
+    if fusion not in FUSION_MODES:
+        return {"error": f"Unknown fusion mode: {fusion}"}
 
-    # 1. FAISS retrieval (search across user's vector DB)
-    faiss_results = get_faiss_results(user.email, query, top_k)
+    # 1. FAISS retrieval (search across user's vector DB), optionally fused with BM25.
+    # Embedding, search and generation each run on their own bounded pool, off the event loop.
+    executors.admit("embedding", "search", "generation")
+    query_vec = await executors.run("embedding", get_query_embedding, query)
+    faiss_results = await executors.run(
+        "search", get_faiss_results, user.email, query, top_k,
+        nprobe=nprobe, ef_search=ef_search, fusion=fusion, query_vec=query_vec
+    )
 
     # 2. LLM answer
-    llm_answer = generate_answer(faiss_results, query, temperature, max_tokens)
+    llm_answer = await executors.run("generation", generate_answer, faiss_results, query, temperature, max_tokens)
 
     search = {
         "query": query,
@@ -122,14 +169,142 @@ def perform_search(
     #     }
     # )
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/search/stream")
+async def stream_search(
+    user_id: str = Cookie(None),
+    query: str = Form(...),
+    top_k: int = Form(5),
+    temperature: float = Form(0.7),
+    max_tokens: int = Form(5),
+    nprobe: int = Form(None),
+    ef_search: int = Form(None),
+    fusion: str = Form("dense"),
+):
+    """
+    Same search as /search, as Server-Sent Events: a "results" event as soon as
+    retrieval is done, a "token" event per piece of the LLM answer, then "done"
+    with time-to-first-token and tokens/s (or "error" if generation fails).
+    """
+    if not user_id:
+        return RedirectResponse(url="/")
+
+    user = await get_user_async(user_id)
+    if not user:
+        return RedirectResponse(url="/")
+
+    if fusion not in FUSION_MODES:
+        return {"error": f"Unknown fusion mode: {fusion}"}
+
+    # Once the stream has started it's too late for a 503
+    executors.admit("embedding", "search", "generation")
+
+    async def events():
+        start = time.perf_counter()
+        query_vec = await executors.run("embedding", get_query_embedding, query)
+        faiss_results = await executors.run(
+            "search", get_faiss_results, user.email, query, top_k,
+            nprobe=nprobe, ef_search=ef_search, fusion=fusion, query_vec=query_vec
+        )
+        yield _sse("results", {
+            "query": query,
+            "results": [
+                {"doc_id": r["doc_id"], "doc_name": f"Doc {r['doc_id']}", "text": r["chunk"]}
+                for r in faiss_results
+            ],
+            "retrieval_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+
+        stats = {}
+        try:
+            pieces = executors.iterate(
+                "generation", stream_answer, faiss_results, query, temperature, max_tokens, stats=stats
+            )
+            async for piece in pieces:
+                yield _sse("token", piece)
+        except Exception as e:
+            yield _sse("error", str(e))
+            return
+        yield _sse("done", stats)
+
+    # no-cache / no buffering so proxies pass each event through as it is produced
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
 @app.get("/health")
-def health():
+async def health():
+    # async: answered on the event loop even when every worker thread is busy
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 200 once every model is loaded, 503 while they are still loading
+    (a probe also starts the warmup if it is not already running).
+    """
+    if model_loader.is_ready():
+        return {"status": "ready", "models": model_loader.get_model_status()}
+    model_loader.warmup()
+    return JSONResponse({"status": "loading", "models": model_loader.get_model_status()}, status_code=503)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latencies, counters and gauges in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    """Hit / miss / eviction counters of the in-process index cache"""
+    return get_cache_stats()
+
+
+@app.get("/stats/embedding")
+def embedding_stats():
+    """Batch-size and queue-wait histograms of the embedding scheduler"""
+    return get_embedding_stats()
+
+
+@app.get("/stats/embedding-store")
+def embedding_store_stats():
+    """Size and hit rate of the content-addressed chunk embedding store"""
+    return get_embedding_store_stats()
+
+
+@app.get("/stats/llm")
+def llm_stats():
+    """Time-to-first-token and tokens/s histograms of streamed answers"""
+    return get_llm_stats()
+
+
+@app.get("/stats/executors")
+def executor_stats():
+    """Running / queued / rejected tasks and queue wait per inference pool"""
+    return get_executor_stats()
+
+
+@app.get("/stats/query-cache")
+def query_cache_stats():
+    """Hit / miss counters of the query-embedding and result caches"""
+    return get_query_cache_stats()
+
+
+@app.get("/stats/user-cache")
+def user_cache_stats():
+    """Hit / miss counters of the cookie → user lookup cache"""
+    return get_user_cache_stats()
+
+
 # Routers
 app.include_router(auth_routes.router, prefix="/auth", tags=["Auth"])
 app.include_router(upload.router, prefix="/upload", tags=["Upload"])
 app.include_router(docs_routes.router, prefix="/docs", tags=["Docs"])
 app.include_router(download.router, prefix="/docs", tags=["Download"])
 app.include_router(delete.router, prefix="/docs", tags=["Delete"])
+app.include_router(search.router, prefix="/api/search", tags=["Search"])
@@ -0,0 +1,44 @@
+"""Shared fixtures: the app's services on stub models, writing into temporary directories."""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from benchmarks import stubs
+from app.services import embedding_store, segments
+from app.services.query_cache import result_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+stubs.install()
+
+
+def pytest_configure(config):
+    # app.db is resolved against the working directory when app.database is
+    # first imported, data/ when it is used: run from a scratch directory
+    # (with the templates and static files main.py loads), never the repository
+    config.workdir = tempfile.mkdtemp(prefix="rag-tests-")
+    os.makedirs(os.path.join(config.workdir, "app"))
+    for name in ("templates", "static"):
+        os.symlink(os.path.join(ROOT, "app", name), os.path.join(config.workdir, "app", name))
+    config.origdir = os.getcwd()
+    os.chdir(config.workdir)
+
+
+def pytest_unconfigure(config):
+    os.chdir(config.origdir)
+    shutil.rmtree(config.workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A fresh working directory (data/ goes there) and empty caches; merges only run when a test calls them"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(embedding_store, "STORE_ENABLED", False)
+    monkeypatch.setattr(segments, "MERGE_ENABLED", False)
+    segments.index_cache.clear()
+    result_cache.drop_where(lambda key: True)
+    yield tmp_path
+    segments.index_cache.clear()
+    result_cache.drop_where(lambda key: True)
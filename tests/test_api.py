@@ -0,0 +1,116 @@
+"""HTTP behaviour of the search endpoints: batch search and load shedding."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.routes import search
+from app.services import executors
+from app.services.vectorstore import update_vectorstore, get_faiss_results
+
+EMAIL = "api@example.com"
+
+
+@pytest.fixture(scope="module")
+def app():
+    import main  # imported here, from the session's working directory: it creates the DB and mounts app/static
+    return main.app
+
+
+@pytest.fixture
+def client(app):
+    from app.database import SessionLocal
+    from app.models import User
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == EMAIL).first()
+        if user is None:
+            user = User(email=EMAIL, password="-")
+            db.add(user)
+            db.commit()
+        user_id = user.user_id
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    client.cookies.set("user_id", str(user_id))
+    return client
+
+
+def batch_lines(response) -> list:
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_search_streams_one_line_per_query_in_order(client, store):
+    update_vectorstore(EMAIL, 1, "printer error codes and paper trays. " * 20)
+    update_vectorstore(EMAIL, 2, "warranty terms and service visits. " * 20)
+    queries = ["printer error", "warranty", "printer error", "nothing like it"]
+
+    lines = batch_lines(client.post("/api/search/batch", json={"queries": queries, "top_k": 3, "fusion": "rrf"}))
+
+    assert [line["index"] for line in lines] == [0, 1, 2, 3]
+    assert [line["query"] for line in lines] == queries
+    for line in lines:
+        assert line["results"] == get_faiss_results(EMAIL, line["query"], 3, fusion="rrf")
+        assert "answer" not in line
+    assert lines[1]["results"][0]["doc_id"] == 2
+
+
+def test_batch_search_answers_when_asked(client, store):
+    update_vectorstore(EMAIL, 1, "printer error codes and paper trays. " * 20)
+
+    lines = batch_lines(client.post("/api/search/batch", json={"queries": ["printer error"], "answer": True}))
+
+    assert isinstance(lines[0]["answer"], str) and lines[0]["answer"]
+
+
+def test_batch_search_of_a_user_without_documents_returns_empty_results(client, store):
+    lines = batch_lines(client.post("/api/search/batch", json={"queries": ["a", "b"]}))
+
+    assert [line["results"] for line in lines] == [[], []]
+
+
+def test_batch_search_rejects_bad_requests(client, store, monkeypatch):
+    monkeypatch.setattr(search, "MAX_BATCH_QUERIES", 2)
+
+    assert client.post("/api/search/batch", json={"queries": ["a"], "fusion": "magic"}).status_code == 400
+    assert client.post("/api/search/batch", json={"queries": ["a", "b", "c"]}).status_code == 400
+    client.cookies.clear()
+    assert client.post("/api/search/batch", json={"queries": ["a"]}).status_code == 401
+
+
+def saturate(monkeypatch, pool: str):
+    """Make a pool look full: every worker busy and no room in the queue"""
+    bounded = executors._pools[pool]
+    monkeypatch.setattr(bounded, "max_queue", 0)
+    monkeypatch.setattr(bounded, "in_flight", bounded.workers)
+
+
+def test_search_works_when_the_pools_have_room(client):
+    response = client.post("/search", data={"query": "anything"})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/search", "/search/stream"])
+@pytest.mark.parametrize("pool", ["embedding", "search", "generation"])
+def test_full_pool_sheds_the_request_with_503(client, monkeypatch, path, pool):
+    saturate(monkeypatch, pool)
+    rejected = executors._pools[pool].rejected
+
+    response = client.post(path, data={"query": "anything"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert pool in response.json()["error"]
+    assert executors._pools[pool].rejected == rejected + 1
+
+
+def test_full_pool_sheds_batch_search_with_503(client, monkeypatch):
+    saturate(monkeypatch, "search")
+
+    response = client.post("/api/search/batch", json={"queries": ["a", "b"]})
+
+    assert response.status_code == 503
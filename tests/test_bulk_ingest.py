@@ -0,0 +1,107 @@
+"""Resuming an interrupted bulk load: Document rows and their stats (the worker pools are not started)."""
+import os
+from datetime import datetime
+
+import pytest
+
+from app.database import SessionLocal, init_db
+from app.models import User, Document
+from app.services import bulk_ingest
+from app.services.bulk_ingest import BulkIngest
+
+EMAIL = "bulk@example.com"
+TEXT = "The printer shows an error. The paper tray is empty.\n" * 30
+
+
+@pytest.fixture
+def user_id():
+    init_db()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == EMAIL).first()
+        if user is None:
+            user = User(email=EMAIL, password="-")
+            db.add(user)
+            db.commit()
+        return user.user_id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def run(tmp_path, user_id):
+    paths = []
+    for name in ("a.txt", "b.txt"):
+        paths.append(tmp_path / name)
+        paths[-1].write_text(TEXT)
+    return BulkIngest([{"email": EMAIL, "path": str(path)} for path in paths], work_dir=str(tmp_path / "work"))
+
+
+def documents(doc_ids: list) -> list:
+    db = SessionLocal()
+    try:
+        return db.query(Document).filter(Document.doc_id.in_(doc_ids)).order_by(Document.doc_id).all()
+    finally:
+        db.close()
+
+
+def user_documents(user_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(Document).filter(Document.user_id == user_id).count()
+    finally:
+        db.close()
+
+
+def test_a_committed_insert_is_found_again(run, user_id):
+    run.create_documents()
+    doc_ids = [doc["doc_id"] for doc in run.state["docs"]]
+    count = user_documents(user_id)
+
+    # Interrupted after the commit, before the doc_ids were saved with the docs
+    for doc in run.state["docs"]:
+        doc["doc_id"] = None
+    run.state["inserting"] = doc_ids
+    run.create_documents()
+
+    assert [doc["doc_id"] for doc in run.state["docs"]] == doc_ids
+    assert user_documents(user_id) == count
+
+
+def test_an_uncommitted_insert_is_not_confused_with_other_uploads(run, user_id):
+    db = SessionLocal()
+    try:
+        # An upload from the server at the same time, given the ids the interrupted run had flushed
+        other = Document(
+            user_id=user_id, doc_name="other.txt", doc_uploaded_date=datetime.fromisoformat(run.state["started"])
+        )
+        db.add(other)
+        db.commit()
+        other_id = other.doc_id
+    finally:
+        db.close()
+    run.state["inserting"] = [other_id, other_id + 1]
+
+    run.create_documents()
+
+    doc_ids = [doc["doc_id"] for doc in run.state["docs"]]
+    assert other_id not in doc_ids
+    assert [row.doc_name for row in documents(doc_ids)] == ["a.txt", "b.txt"]
+    assert run.state["inserting"] is None
+
+
+def test_stats_of_documents_chunked_before_an_interruption_are_saved(run):
+    run.create_documents()
+    os.makedirs(os.path.dirname(run.chunks_file(0)))
+    for doc in run.state["docs"]:
+        # Chunked by the interrupted run: the spool file holds the stats
+        bulk_ingest._chunk_document(
+            doc["path"], None, run.chunks_file(doc["doc_id"]),
+            doc["chunk_strategy"], doc["chunk_size"], doc["chunk_overlap"],
+        )
+
+    run.chunk()
+
+    rows = documents([doc["doc_id"] for doc in run.state["docs"]])
+    assert [(row.total_words, row.total_sentences) for row in rows] == [(len(TEXT.split()), 60)] * 2
+    assert run.state["stats_saved"]
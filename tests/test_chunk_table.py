@@ -0,0 +1,44 @@
+"""Chunk tables: rows by vector id, texts and the per-document directory."""
+import os
+
+import numpy as np
+
+from app.services.chunk_table import ChunkTable, SegmentWriter, DOCS_FILENAME
+
+DIM = 4
+
+
+def write_table(folder) -> ChunkTable:
+    writer = SegmentWriter(str(folder), DIM)
+    writer.add_chunks(3, ["a", "bé"], np.ones((2, DIM), dtype="float32"))
+    writer.add_chunks(3, ["c"], np.ones((1, DIM), dtype="float32"))   # same document, second call
+    writer.add_chunks(8, ["d", "e", "f"], np.zeros((3, DIM), dtype="float32"))
+    return writer.finish()
+
+
+def test_documents_and_chunks_are_found_by_id(tmp_path):
+    table = write_table(tmp_path)
+
+    assert table.doc_rows == {3: (0, 3), 8: (3, 3)}
+    assert table.lookup((3 << 32) | 1) == (3, "bé")
+    assert table.lookup((8 << 32) | 2) == (8, "f")
+    assert table.lookup((8 << 32) | 3) is None
+    assert list(table.texts()) == ["a", "bé", "c", "d", "e", "f"]
+
+
+def test_tables_without_a_document_directory_are_scanned(tmp_path):
+    expected = write_table(tmp_path).doc_rows
+    os.remove(os.path.join(tmp_path, DOCS_FILENAME))
+
+    assert ChunkTable(str(tmp_path), DIM).doc_rows == expected
+
+
+def test_copied_rows_keep_their_texts(tmp_path):
+    source = write_table(tmp_path / "source")
+    writer = SegmentWriter(str(tmp_path / "copy"), DIM)
+    start, count = source.doc_rows[8]
+    writer.add_rows(source, start, count)
+    copy = writer.finish()
+
+    assert copy.doc_rows == {8: (0, 3)}
+    assert list(copy.texts()) == ["d", "e", "f"]
@@ -0,0 +1,57 @@
+"""Chunk size and overlap of the chunking strategies."""
+import pytest
+
+from app.services.chunker import chunk_text, resolve_config, MAX_CHUNK_TOKENS
+from app.services.embedding import count_tokens
+
+TEXT = "\n\n".join(
+    " ".join(f"Paragraph {p} sentence {s} has a few words in it." for s in range(6)) for p in range(8)
+)
+
+
+def test_word_windows_have_size_and_overlap():
+    words = [f"w{i}" for i in range(25)]
+
+    chunks = list(chunk_text(" ".join(words), "words", 10, 3))
+
+    assert chunks == [" ".join(words[start:start + 10]) for start in (0, 7, 14, 21)]
+
+
+@pytest.mark.parametrize("strategy", ["tokens", "sentences", "paragraphs", "recursive"])
+def test_chunks_fit_the_token_budget(strategy):
+    chunks = list(chunk_text(TEXT, strategy, 40, 10))
+
+    assert len(chunks) > 1
+    assert max(count_tokens(chunks)) <= 40
+    # Every word of the document is in some chunk, in order
+    assert " ".join(chunks).split()[:5] == TEXT.split()[:5]
+    assert chunks[-1].split()[-1] == TEXT.split()[-1]
+
+
+def test_sentence_chunks_overlap_by_whole_sentences():
+    chunks = list(chunk_text(TEXT, "sentences", 40, 15))
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        last_sentence = previous.rsplit(". ", 1)[-1]
+        assert chunk.startswith(last_sentence)
+
+
+def test_no_overlap():
+    chunks = list(chunk_text(TEXT, "sentences", 40, 0))
+
+    assert " ".join(chunks) == " ".join(TEXT.split())
+
+
+def test_size_is_capped_by_the_embedder_window():
+    assert resolve_config("recursive", 10_000, 0) == ("recursive", MAX_CHUNK_TOKENS, 0)
+
+
+@pytest.mark.parametrize("size, overlap", [(10, 10), (10, 12), (10, -1)])
+def test_impossible_overlap_is_rejected(size, overlap):
+    with pytest.raises(ValueError):
+        resolve_config("tokens", size, overlap)
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        resolve_config("chapters")
@@ -0,0 +1,75 @@
+"""Document listings: pages of a user's documents, newest first."""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal, init_db
+from app.docs import utils as docs_utils
+from app.docs.utils import list_documents
+from app.models import User, Document
+
+EMAIL = "docs@example.com"
+
+
+@pytest.fixture(scope="module")
+def user_id():
+    """A user with 7 documents, doc0.txt … doc6.txt in upload order"""
+    init_db()
+    db = SessionLocal()
+    try:
+        user = User(email=EMAIL, password="-")
+        db.add(user)
+        db.flush()
+        db.add_all([Document(user_id=user.user_id, doc_name=f"doc{i}.txt") for i in range(7)])
+        # Another user's documents never show up
+        other = User(email="other-" + EMAIL, password="-")
+        db.add(other)
+        db.flush()
+        db.add(Document(user_id=other.user_id, doc_name="other.txt"))
+        db.commit()
+        return user.user_id
+    finally:
+        db.close()
+
+
+def names(listing: dict) -> list:
+    return [doc.doc_name for doc in listing["documents"]]
+
+
+@pytest.mark.parametrize("page, expected", [
+    (1, ["doc6.txt", "doc5.txt", "doc4.txt"]),
+    (3, ["doc0.txt"]),
+    (0, ["doc6.txt", "doc5.txt", "doc4.txt"]),   # out of range: clamped to the first / last page
+    (9, ["doc0.txt"]),
+])
+def test_pages_are_newest_first(user_id, page, expected):
+    with SessionLocal() as db:
+        listing = list_documents(db, user_id, page, 3)
+
+    assert names(listing) == expected
+    assert (listing["pages"], listing["total"], listing["page_size"]) == (3, 7, 3)
+
+
+def test_page_size_is_bounded(user_id, monkeypatch):
+    monkeypatch.setattr(docs_utils, "MAX_DOCS_PAGE_SIZE", 4)
+    with SessionLocal() as db:
+        assert len(list_documents(db, user_id, 1, 100)["documents"]) == 4
+        assert names(list_documents(db, user_id, 1, 0)) == ["doc6.txt"]
+
+
+def test_a_user_without_documents_has_one_empty_page():
+    with SessionLocal() as db:
+        listing = list_documents(db, -1)
+
+    assert (listing["documents"], listing["page"], listing["pages"], listing["total"]) == ([], 1, 1, 0)
+
+
+def test_list_endpoint(user_id):
+    import main  # imported here, from the session's working directory (see test_api)
+    client = TestClient(main.app)
+
+    assert client.get("/docs/list").status_code == 401
+    client.cookies.set("user_id", str(user_id))
+    listing = client.get("/docs/list", params={"page": 2, "page_size": 5}).json()
+
+    assert [doc["doc_name"] for doc in listing["documents"]] == ["doc1.txt", "doc0.txt"]
+    assert (listing["page"], listing["pages"], listing["total"]) == (2, 2, 7)
@@ -0,0 +1,62 @@
+"""Parity of the ONNX embedding backends with the PyTorch (sentence-transformers) backend."""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+from app.services import embedding, embedding_onnx
+
+TEXTS = [
+    "How do I reset my password?",
+    "The error ERR-7 means the printer is out of paper.",
+    "Quarterly revenue grew 12% year over year, driven by subscriptions.",
+    "a",
+    " ".join(["A long paragraph that is truncated at the model's maximum sequence length."] * 40),
+]
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+@pytest.fixture(scope="module", autouse=True)
+def onnx_dir(tmp_path_factory):
+    original = embedding_onnx.ONNX_DIR
+    embedding_onnx.ONNX_DIR = str(tmp_path_factory.mktemp("onnx"))
+    yield embedding_onnx.ONNX_DIR
+    embedding_onnx.ONNX_DIR = original
+
+
+@pytest.fixture(scope="module")
+def torch_model():
+    try:
+        return embedding.load_embedder("torch")
+    except OSError as e:
+        pytest.skip(f"{embedding.MODEL_NAME} is not available: {e}")
+
+
+@pytest.mark.parametrize("backend, min_cosine", [("onnx", 0.9999), ("onnx-int8", 0.97)])
+def test_onnx_backend_matches_torch(torch_model, backend, min_cosine):
+    expected = torch_model.encode(TEXTS)
+    vectors = embedding.load_embedder(backend).encode(TEXTS)
+
+    assert vectors.shape == expected.shape
+    assert vectors.dtype == np.float32
+    assert cosine(vectors, expected).min() >= min_cosine
+
+
+def test_onnx_backend_uses_the_same_tokenizer(torch_model):
+    onnx_model = embedding.load_embedder("onnx")
+    assert onnx_model.tokenizer(TEXTS)["input_ids"] == torch_model.tokenizer(TEXTS)["input_ids"]
+
+
+def test_export_is_cached(torch_model):
+    path = embedding_onnx.export(embedding.MODEL_NAME)
+    mtime = os.path.getmtime(path)
+    assert embedding_onnx.export(embedding.MODEL_NAME) == path
+    assert os.path.getmtime(path) == mtime
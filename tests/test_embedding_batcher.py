@@ -0,0 +1,85 @@
+"""The embedding batcher: shared model calls, lane priority and per-caller results."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.services.embedding import EmbeddingBatcher, EMBEDDING_DIM
+
+
+class Encoder:
+    """Row i of a text "t<i>" is filled with i; records every batch it is called with"""
+
+    def __init__(self, block_first: bool = False):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block_first:
+            self.release.set()
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        self.started.set()
+        self.release.wait(5)
+        return np.array([[float(text[1:])] * EMBEDDING_DIM for text in texts], dtype="float32")
+
+
+def texts(start: int, count: int) -> list:
+    return [f"t{i}" for i in range(start, start + count)]
+
+
+def test_concurrent_callers_get_their_own_rows():
+    encoder = Encoder()
+    batcher = EmbeddingBatcher(encoder, window_ms=50, max_batch=64)
+
+    def embed(caller):
+        return caller, batcher.submit(texts(caller * 10, 3 + caller % 4)).result(5)
+
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(embed, range(16)))
+
+    for caller, vectors in results:
+        expected = np.arange(caller * 10, caller * 10 + 3 + caller % 4, dtype="float32")
+        assert vectors.shape == (len(expected), EMBEDDING_DIM)
+        assert (vectors[:, 0] == expected).all()
+    assert len(encoder.batches) < 16          # callers shared model calls
+    assert all(len(batch) <= 64 for batch in encoder.batches)
+
+
+def test_large_requests_are_split_across_batches():
+    encoder = Encoder()
+    batcher = EmbeddingBatcher(encoder, window_ms=1, max_batch=8)
+
+    vectors = batcher.submit(texts(0, 20)).result(5)
+
+    assert [len(batch) for batch in encoder.batches] == [8, 8, 4]
+    assert (vectors[:, 0] == np.arange(20)).all()
+
+
+def test_interactive_texts_go_ahead_of_waiting_bulk_texts():
+    encoder = Encoder(block_first=True)
+    batcher = EmbeddingBatcher(encoder, window_ms=1, max_batch=4)
+    first = batcher.submit(texts(0, 4), "bulk")
+    assert encoder.started.wait(5)            # the model is busy with the first batch
+
+    bulk = batcher.submit(texts(100, 6), "bulk")
+    query = batcher.submit(texts(200, 1), "interactive")
+    encoder.release.set()
+
+    assert query.result(5)[0, 0] == 200
+    bulk.result(5)
+    first.result(5)
+    assert encoder.batches[1] == ["t200", "t100", "t101", "t102"]
+    assert encoder.batches[2] == ["t103", "t104", "t105"]
+
+
+def test_a_failed_model_call_fails_its_callers():
+    def encode(texts):
+        raise RuntimeError("out of memory")
+
+    batcher = EmbeddingBatcher(encode, window_ms=1, max_batch=8)
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        batcher.submit(texts(0, 3)).result(5)
+    assert batcher.submit([]).result(5).shape == (0, EMBEDDING_DIM)
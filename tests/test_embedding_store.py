@@ -0,0 +1,87 @@
+"""The embedding store shared by several processes: appends, compaction and crash recovery."""
+import os
+
+import numpy as np
+
+from app.services import embedding_store
+from app.services.embedding_store import EmbeddingStore, chunk_key
+
+DIM = 4
+
+
+def keys_and_vectors(start: int, count: int):
+    keys = [chunk_key(f"chunk {i}", "model") for i in range(start, start + count)]
+    vectors = np.arange(start, start + count, dtype="float32")[:, None].repeat(DIM, axis=1)
+    return keys, vectors
+
+
+# Each EmbeddingStore opens its own lock files, so two instances flock each other like two processes
+def test_rows_added_by_another_process_are_found(tmp_path):
+    first, second = EmbeddingStore(str(tmp_path), DIM), EmbeddingStore(str(tmp_path), DIM)
+    keys, vectors = keys_and_vectors(0, 5)
+
+    first.add(keys[:3], vectors[:3])
+    second.add(keys[2:], vectors[2:])   # keys[2] is already there: not appended twice
+
+    for store in (first, second):
+        found_vectors, found = store.lookup(keys)
+        assert found.all() and len(store) == 5
+        np.testing.assert_array_equal(found_vectors, vectors)
+
+
+def test_compaction_while_another_process_has_the_store_open(tmp_path):
+    worker, gc = EmbeddingStore(str(tmp_path), DIM), EmbeddingStore(str(tmp_path), DIM)
+    keys, vectors = keys_and_vectors(0, 6)
+    worker.add(keys[:4], vectors[:4])
+    gc.refresh()
+    keep_from, generation = len(gc), gc.generation
+    worker.add(keys[4:], vectors[4:])   # added while the GC collects references: kept
+
+    assert gc.collect_garbage({keys[0]}, keep_from, generation) == 3
+
+    found_vectors, found = worker.lookup(keys)
+    assert found.tolist() == [True, False, False, False, True, True]
+    np.testing.assert_array_equal(found_vectors[found], vectors[[0, 4, 5]])
+    worker.add(keys[1:2], vectors[1:2])
+    assert gc.lookup(keys[1:2])[1].all()
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("gen-")) == ["gen-1"]
+
+
+def test_a_second_compaction_of_the_same_references_does_nothing(tmp_path):
+    first, second = EmbeddingStore(str(tmp_path), DIM), EmbeddingStore(str(tmp_path), DIM)
+    keys, vectors = keys_and_vectors(0, 4)
+    first.add(keys, vectors)
+    generation = second.generation
+
+    assert first.collect_garbage(set(keys[:2]), 4, generation) == 2
+    assert second.collect_garbage(set(keys[2:]), 4, generation) == 0   # planned against the old generation
+    assert second.lookup(keys)[1].tolist() == [True, True, False, False]
+
+
+def test_a_torn_append_is_cut_off(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIM)
+    keys, vectors = keys_and_vectors(0, 3)
+    store.add(keys[:2], vectors[:2])
+    with open(store.vectors_file, "ab") as f:
+        f.write(vectors[2].tobytes())   # the crash came before the key was written
+
+    reopened = EmbeddingStore(str(tmp_path), DIM)
+    reopened.add(keys[2:], vectors[2:])
+
+    found_vectors, found = EmbeddingStore(str(tmp_path), DIM).lookup(keys)
+    assert found.all()
+    np.testing.assert_array_equal(found_vectors, vectors)
+
+
+def test_gc_removes_only_the_stores_of_models_no_process_has_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "STORE_ENABLED", True)
+    monkeypatch.setattr(embedding_store, "_store", None)
+    in_use = EmbeddingStore(str(tmp_path / "other-model-in-use"), DIM)
+    os.makedirs(tmp_path / "retired-model" / "gen-0")
+
+    stats = embedding_store.collect_garbage([])
+
+    assert stats["other_models_removed"] == 1
+    assert "other-model-in-use" in os.listdir(tmp_path) and "retired-model" not in os.listdir(tmp_path)
+    assert len(in_use) == 0
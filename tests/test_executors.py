@@ -0,0 +1,56 @@
+"""iterate(): a blocking iterator on a pool thread, consumed from the event loop."""
+import asyncio
+import itertools
+import threading
+
+import pytest
+
+from app.services import executors
+
+
+class Tokens:
+    """An endless stream that has to be closed, like a generation in progress"""
+
+    def __init__(self):
+        self.count = itertools.count()
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.count)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_stopping_early_closes_the_iterator_and_frees_the_thread():
+    tokens = Tokens()
+
+    async def first_three():
+        pieces = executors.iterate("generation", lambda: tokens)
+        found = []
+        async for item in pieces:
+            found.append(item)
+            if len(found) == 3:
+                break
+        await pieces.aclose()  # what the server does when the client disconnects
+        return found
+
+    assert asyncio.run(first_three()) == [0, 1, 2]
+    assert tokens.closed.wait(5)
+    executors._pools["generation"].submit(lambda: None).result(5)
+    assert executors.get_executor_stats()["generation"]["running"] == 0
+
+
+def test_errors_reach_the_consumer():
+    def failing():
+        yield "partial"
+        raise RuntimeError("generation failed")
+
+    async def consume():
+        return [item async for item in executors.iterate("generation", failing)]
+
+    with pytest.raises(RuntimeError, match="generation failed"):
+        asyncio.run(consume())
@@ -0,0 +1,50 @@
+"""Uploads stream to disk block by block with the same metadata as reading the whole text."""
+import asyncio
+import io
+
+import pytest
+
+from app.utils import file_handler
+from app.utils.file_handler import TextStats, save_upload, iter_file_words
+
+TEXT = "Café au lait.  Naïve résumé\twords…\n split\u2003across blocks. Ünïcode ends here. " * 7
+
+
+class FakeUpload:
+    """The part of UploadFile save_upload uses"""
+
+    def __init__(self, data: bytes):
+        self._file = io.BytesIO(data)
+
+    async def read(self, size: int) -> bytes:
+        return self._file.read(size)
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 7, 64, 1 << 20])
+def test_stats_match_the_whole_text_for_any_block_size(block_size):
+    data = TEXT.encode("utf-8")
+    stats = TextStats()
+    for start in range(0, len(data), block_size):
+        stats.feed(data[start:start + block_size])   # blocks split multi-byte characters too
+    stats.feed(b"", final=True)
+
+    assert (stats.size, stats.words, stats.sentences) == (len(data), len(TEXT.split()), TEXT.count("."))
+
+
+def test_save_upload_streams_the_file_and_counts_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_handler, "BLOCK_SIZE", 5)
+    data = TEXT.encode("utf-8")
+    path = tmp_path / "doc.txt"
+
+    stats = asyncio.run(save_upload(FakeUpload(data), str(path)))
+
+    assert path.read_bytes() == data
+    assert (stats.size, stats.words, stats.sentences) == (len(data), len(TEXT.split()), TEXT.count("."))
+
+
+def test_words_are_read_back_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_handler, "BLOCK_SIZE", 4)
+    path = tmp_path / "doc.txt"
+    path.write_bytes(TEXT.encode("utf-8"))
+
+    assert list(iter_file_words(str(path))) == TEXT.split()
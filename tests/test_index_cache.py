@@ -0,0 +1,53 @@
+"""The LRU cache of loaded indexes and its memory budget."""
+from app.services import segments, vectorstore
+from app.services.index_cache import IndexCache
+from app.services.vectorstore import update_vectorstore, get_faiss_results
+
+
+def test_least_recently_used_entries_are_evicted_over_budget():
+    cache = IndexCache(100)
+    cache.put("a", "A", 40)
+    cache.put("b", "B", 40)
+    assert cache.get("a") == "A"          # b is now the least recently used
+
+    cache.put("c", "C", 40)
+
+    assert cache.get("b") is None
+    assert [key for key, _, _ in cache.entries()] == ["a", "c"]
+    assert cache.stats()["bytes"] == 80
+    assert cache.stats()["evictions"] == 1
+
+
+def test_replacing_and_invalidating_keep_the_byte_count():
+    cache = IndexCache(100)
+    cache.put("a", "A", 40)
+    cache.put("a", "A2", 60)
+    assert cache.get("a") == "A2"
+    assert cache.stats()["bytes"] == 60
+
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_an_entry_larger_than_the_budget_is_not_cached():
+    cache = IndexCache(100)
+    cache.put("a", "A", 40)
+    cache.put("huge", "H", 101)
+
+    assert cache.get("huge") is None
+    assert cache.get("a") == "A"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 0)
+
+
+def test_searches_reuse_the_loaded_index(store):
+    update_vectorstore("user@example.com", 1, "apples and pears " * 20)
+    segments.index_cache.clear()
+
+    get_faiss_results("user@example.com", "apples", 3)
+    loaded = segments.index_cache.get("user@example.com")
+    get_faiss_results("user@example.com", "pears", 3)
+
+    assert segments.index_cache.get("user@example.com") is loaded
+    assert vectorstore.get_cache_stats()["bytes"] == loaded.nbytes()
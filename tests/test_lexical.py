@@ -0,0 +1,100 @@
+"""BM25 postings and rank fusion of dense and BM25 candidates."""
+import numpy as np
+import pytest
+
+from app.services import lexical
+from app.services.lexical import LexicalIndex, build_lexical, fuse, query_idf, tokenize
+
+TEXTS = [
+    "printer error ERR-42 on tray two",
+    "the printer jams",
+    "error codes list",
+    "tray two is empty, printer idle",
+    "nothing relevant here",
+    "error error error printer",
+]
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Error ERR-42 in v1.2") == ["error", "err-42", "err", "42", "in", "v1.2", "v1", "2"]
+
+
+def lexical_index(folder, texts) -> LexicalIndex:
+    folder.mkdir()
+    build_lexical(str(folder), iter(texts), len(texts))
+    return LexicalIndex(str(folder))
+
+
+def bm25(texts, terms, idf, avgdl):
+    """Plain BM25 of every row, for comparison"""
+    scores = np.zeros(len(texts))
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        for term, term_idf in zip(terms, idf):
+            tf = tokens.count(term)
+            norm = lexical.BM25_K1 * (1 - lexical.BM25_B + lexical.BM25_B * len(tokens) / avgdl)
+            scores[row] += term_idf * tf * (lexical.BM25_K1 + 1) / (tf + norm)
+    return scores
+
+
+@pytest.mark.parametrize("query", ["printer", "printer error tray", "err-42 missing"])
+def test_scores_match_plain_bm25_on_the_matched_rows(tmp_path, query):
+    index = lexical_index(tmp_path / "segment", TEXTS)
+    terms = list(dict.fromkeys(tokenize(query)))
+    idf, avgdl = query_idf([index], terms)
+
+    rows, scores = index.score(terms, idf, avgdl)
+
+    expected = bm25(TEXTS, terms, idf, avgdl)
+    assert rows.tolist() == np.flatnonzero(expected).tolist()
+    np.testing.assert_allclose(scores, expected[rows])
+
+
+def test_idf_leaves_out_deleted_rows(tmp_path):
+    deleted = np.array([True, False, True, False, False, False])
+    index = lexical_index(tmp_path / "segment", TEXTS)
+    live = lexical_index(tmp_path / "live", [text for text, gone in zip(TEXTS, deleted) if not gone])
+    terms = ["printer", "error", "tray"]
+
+    idf, avgdl = query_idf([index], terms, [deleted])
+
+    expected_idf, expected_avgdl = query_idf([live], terms)
+    np.testing.assert_allclose(idf, expected_idf)
+    assert avgdl == pytest.approx(expected_avgdl)
+
+
+def test_rrf_prefers_candidates_both_retrievers_found():
+    dense = [(1, 0.1), (2, 0.2), (3, 0.3)]
+    lexical_hits = [(3, 9.0), (4, 5.0)]
+
+    ranked = [vector_id for vector_id, _ in fuse(dense, lexical_hits, "rrf", 4)]
+
+    assert ranked == [3, 1, 2, 4]
+
+
+def test_rrf_ignores_score_scale():
+    dense = [(1, 0.1), (2, 50.0)]
+    assert fuse(dense, [], "rrf", 2) == fuse([(1, 0.0), (2, 0.01)], [], "rrf", 2)
+
+
+def test_weighted_mixes_scaled_scores(monkeypatch):
+    monkeypatch.setattr(lexical, "HYBRID_DENSE_WEIGHT", 0.5)
+    dense = [(1, 0.0), (2, 1.0)]         # similarities 1 and 0 after scaling
+    lexical_hits = [(2, 10.0), (3, 4.0)]  # scaled to 1 and 0.4
+
+    assert fuse(dense, lexical_hits, "weighted", 3) == [(1, 0.5), (2, 0.5), (3, pytest.approx(0.2))]
+
+
+def test_weighted_dense_weight_decides_ties(monkeypatch):
+    dense = [(1, 0.0), (2, 1.0)]
+    lexical_hits = [(2, 10.0), (1, 1.0)]
+
+    monkeypatch.setattr(lexical, "HYBRID_DENSE_WEIGHT", 0.8)
+    assert fuse(dense, lexical_hits, "weighted", 2)[0][0] == 1
+    monkeypatch.setattr(lexical, "HYBRID_DENSE_WEIGHT", 0.2)
+    assert fuse(dense, lexical_hits, "weighted", 2)[0][0] == 2
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        fuse([], [], "dense", 5)
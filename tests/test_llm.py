@@ -0,0 +1,67 @@
+"""Prompts fit the generation model's context window; streamed answers report real token counts."""
+import re
+
+from app.services import llm
+from app.services.llm import build_prompt, stream_answer
+
+
+class WordTokenizer:
+    """Words and runs of whitespace as tokens (decode(encode(text)) == text)"""
+
+    def encode(self, text):
+        return re.findall(r"\S+|\s+", text)
+
+    def decode(self, ids):
+        return "".join(ids)
+
+
+def results(count: int, words: int) -> list:
+    return [{"chunk": " ".join(f"c{i}w{j}" for j in range(words))} for i in range(count)]
+
+
+def test_prompt_is_cut_to_the_context_window():
+    tokenizer = WordTokenizer()
+    # Ten 200-word chunks are about 4000 tokens here: more than 1024 positions
+    prompt = build_prompt(results(10, 200), "what is c0w5?", 50, tokenizer, 1024)
+
+    assert len(tokenizer.encode(prompt)) + 50 <= 1024
+    assert "c0w0 c0w1" in prompt          # the best chunk is kept
+    assert "c9w0" not in prompt
+    assert prompt.endswith("Question: what is c0w5?\n\nAnswer:")
+
+
+def test_prompt_that_fits_is_unchanged():
+    tokenizer = WordTokenizer()
+    faiss_results = results(2, 20)
+
+    assert build_prompt(faiss_results, "q", 50, tokenizer, 1024) == build_prompt(faiss_results, "q")
+
+
+def test_prompt_without_tokenizer_keeps_every_chunk():
+    prompt = build_prompt(results(10, 200), "q")
+
+    assert all(f"c{i}w199" in prompt for i in range(10))
+
+
+def test_streamed_answers_report_the_tokens_the_backend_generated(monkeypatch):
+    def word_pieces(faiss_results, query, temperature, max_tokens, usage=None):
+        for word in ("Paper ", "tray ", "empty."):
+            usage["tokens"] = usage.get("tokens", 0) + 3   # several tokens decode to one word
+            yield word
+
+    monkeypatch.setattr(llm, "_stream_pieces", word_pieces)
+    stats = {}
+
+    assert "".join(stream_answer([], "q", stats=stats)) == "Paper tray empty."
+    assert stats["tokens"] == 9
+
+
+def test_pieces_count_as_tokens_when_the_backend_reports_none(monkeypatch):
+    def token_pieces(faiss_results, query, temperature, max_tokens, usage=None):
+        yield from ("Paper", " tray", "", " empty.")
+
+    monkeypatch.setattr(llm, "_stream_pieces", token_pieces)
+    stats = {}
+
+    list(stream_answer([], "q", stats=stats))
+    assert stats["tokens"] == 3
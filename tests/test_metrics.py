@@ -0,0 +1,93 @@
+"""Metrics: the Prometheus text exposition and the Server-Timing header."""
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.services import metrics
+
+
+def families() -> dict:
+    return {family.name: family for family in text_string_to_metric_families(metrics.render())}
+
+
+def test_render_is_valid_prometheus_text():
+    hist = metrics.histogram("test_render_seconds", "A test histogram", buckets=(0.1, 1), path='a "b" \\c')
+    for value in (0.05, 0.5, 5):
+        hist.observe(value)
+    metrics.counter("test_render_total", "A test counter", outcome="ok").inc(3)
+
+    found = families()
+
+    samples = {(s.name, s.labels.get("le")): s.value for s in found["test_render_seconds"].samples}
+    assert samples == {
+        ("test_render_seconds_bucket", "0.1"): 1, ("test_render_seconds_bucket", "1"): 2,
+        ("test_render_seconds_bucket", "+Inf"): 3, ("test_render_seconds_sum", None): 5.55,
+        ("test_render_seconds_count", None): 3,
+    }
+    assert found["test_render_seconds"].samples[0].labels["path"] == 'a "b" \\c'
+    assert found["test_render"].type == "counter" and found["test_render"].samples[0].value == 3
+    assert found["process_resident_memory_bytes"].type == "gauge"
+
+
+def test_each_family_is_declared_once_before_its_samples():
+    metrics.counter("test_family_total", "Two series of one family", kind="a").inc()
+    metrics.counter("test_family_total", "Two series of one family", kind="b").inc()
+    declared = []
+    for line in metrics.render().splitlines():
+        if line.startswith("# HELP "):
+            declared.append(line.split()[2])
+        elif line.startswith("# TYPE "):
+            assert line.split()[2] == declared[-1]
+        else:
+            assert re.match(r"[a-zA-Z_:][a-zA-Z0-9_:]*", line).group().startswith(declared[-1]), line
+
+    assert len(declared) == len(set(declared))
+    assert declared.count("test_family_total") == 1
+
+
+def timed_app(server_timing: bool) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(metrics.TimingMiddleware, server_timing=server_timing)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):   # sync: runs on the threadpool, which copies the request's context
+        with metrics.timed("embed_query"):
+            pass
+        metrics.add_request_timing("faiss_search", 0.002)
+        return {"item_id": item_id}
+
+    return TestClient(app)
+
+
+def test_server_timing_lists_the_request_stages():
+    response = timed_app(server_timing=True).get("/items/1")
+
+    entries = dict(part.split(";dur=") for part in response.headers["server-timing"].split(", "))
+    assert list(entries) == ["embed_query", "faiss_search", "total"]
+    assert float(entries["faiss_search"]) == 2.0
+    assert all(float(duration) >= 0 for duration in entries.values())
+
+
+def test_requests_are_counted_per_route_template():
+    client = timed_app(server_timing=False)
+    before = metrics.counter("rag_http_requests_total", "", route="/items/{item_id}", method="GET", status="200").value
+
+    response = client.get("/items/2")
+    client.get("/items/3")
+
+    assert "server-timing" not in response.headers
+    after = metrics.counter("rag_http_requests_total", "", route="/items/{item_id}", method="GET", status="200").value
+    assert after == before + 2
+
+
+def test_metrics_endpoint():
+    import main  # imported here, from the session's working directory (see test_api)
+
+    client = TestClient(main.app)
+    client.get("/metrics")
+    response = client.get("/metrics")   # counts the first request
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "rag_http_requests" in {family.name for family in text_string_to_metric_families(response.text)}
@@ -0,0 +1,98 @@
+"""Round trips through a model server process give the same results as the models in this process."""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from app.services import embedding, llm, model_client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVE = "from benchmarks import stubs; stubs.install(); from app.services import model_server; model_server.serve({!r})"
+
+TEXTS = [f"chunk {i} about printers, paper trays and error ERR-{i}." for i in range(12)]
+RESULTS = [{"chunk": "The printer shows ERR-4242 when the tray is empty.", "doc_id": 1}]
+
+
+def accepts_connections(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / "models.sock")
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVE.format(path)], env=dict(os.environ, PYTHONPATH=ROOT), stdout=subprocess.DEVNULL,
+    )
+    # The socket file appears when it is bound, just before it listens: wait until a connect succeeds
+    deadline = time.monotonic() + 30
+    while not accepts_connections(path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            pytest.fail(f"model server did not start (exit code {process.poll()})")
+        time.sleep(0.01)
+    yield path
+    process.terminate()
+    process.wait()
+
+
+def through_server(monkeypatch, path: str, shm_mb: float, fn, *args):
+    """fn(*args) on a fresh connection to the server with a shm_mb result buffer"""
+    monkeypatch.setattr(model_client, "SOCKET_PATH", path)
+    monkeypatch.setattr(model_client, "SHM_MB", shm_mb)
+    model_client._local.conn = None
+    try:
+        return fn(*args)
+    finally:
+        conn = getattr(model_client._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        model_client._local.conn = None
+        monkeypatch.setattr(model_client, "SOCKET_PATH", None)
+
+
+def test_embeddings_match_in_process_results(server, monkeypatch):
+    expected = embedding.get_embeddings(TEXTS)
+
+    # 8 MB holds every row; 4 KB holds two, so the rows come back inline in the reply
+    for shm_mb in (8, 0.001):
+        vectors = through_server(monkeypatch, server, shm_mb, embedding.get_embeddings, TEXTS)
+        assert vectors.shape == expected.shape
+        np.testing.assert_allclose(vectors, expected, rtol=1e-6)
+
+    counts = through_server(monkeypatch, server, 8, embedding.count_tokens, TEXTS)
+    assert counts.tolist() == embedding.count_tokens(TEXTS).tolist()
+
+
+def test_answers_match_in_process_results(server, monkeypatch):
+    expected = llm.generate_answer(RESULTS, "what is ERR-4242?", 0.2, 20)
+    expected_pieces = list(llm._stream_pieces(RESULTS, "what is ERR-4242?", 0.2, 20))
+
+    answer = through_server(monkeypatch, server, 8, llm.generate_answer, RESULTS, "what is ERR-4242?", 0.2, 20)
+    usage = {}
+    pieces = through_server(
+        monkeypatch, server, 8,
+        lambda: list(model_client.stream_generate(RESULTS, "what is ERR-4242?", 0.2, 20, usage)),
+    )
+
+    assert answer == expected
+    assert pieces == expected_pieces
+    assert usage == {"tokens": len(expected_pieces)}   # the backend's token count comes back too
+
+
+def test_server_errors_reach_the_client(server, monkeypatch):
+    def bad_lane():
+        payload = bytes([9]) + model_client.pack_texts(["x"])
+        return model_client._request(lambda conn: conn.call(model_client.EMBED, payload))
+
+    with pytest.raises(model_client.ModelServerError, match="IndexError"):
+        through_server(monkeypatch, server, 8, bad_lane)
@@ -0,0 +1,61 @@
+"""Query embedding and result caches: what they are keyed on and when they stop matching."""
+from app.services import embedding, query_cache, segments, vectorstore
+from app.services.query_cache import embedding_cache, result_cache, get_query_embedding
+from app.services.vectorstore import update_vectorstore, get_faiss_results
+
+EMAIL = "user@example.com"
+
+
+def texts_embedded() -> float:
+    return embedding.texts_embedded["interactive"].value + embedding.texts_embedded["bulk"].value
+
+
+def test_query_embeddings_are_shared_across_spellings_but_not_models(monkeypatch):
+    embedding_cache.drop_where(lambda key: True)
+    before = texts_embedded()
+    first = get_query_embedding("Printer  ERROR codes")
+    assert get_query_embedding("printer error codes ") is first
+    assert texts_embedded() == before + 1
+
+    monkeypatch.setattr(embedding, "EMBEDDING_BACKEND", "onnx")  # another model: its own vectors
+    get_query_embedding("printer error codes")
+    assert texts_embedded() == before + 2
+
+
+def test_results_follow_the_index_version(store):
+    update_vectorstore(EMAIL, 1, "apples grow on trees. " * 10)
+    assert {r["doc_id"] for r in get_faiss_results(EMAIL, "apples pears", 10)} == {1}
+    assert {r["doc_id"] for r in get_faiss_results(EMAIL, "apples pears", 10)} == {1}
+    assert result_cache.stats()["hits"] >= 1
+
+    update_vectorstore(EMAIL, 2, "pears grow on trees too. " * 10)
+
+    assert {r["doc_id"] for r in get_faiss_results(EMAIL, "apples pears", 10)} == {1, 2}
+
+
+def test_results_of_a_deleted_store_do_not_come_back(store):
+    update_vectorstore(EMAIL, 1, "apples grow on trees. " * 10)
+    assert "apples" in get_faiss_results(EMAIL, "grow", 1)[0]["chunk"]
+    version = segments.read_version(EMAIL)
+
+    vectorstore.remove_user_store(EMAIL)
+    update_vectorstore(EMAIL, 1, "plums grow on trees. " * 10)   # same doc_id, same version number
+
+    assert segments.read_version(EMAIL) == version
+    assert "plums" in get_faiss_results(EMAIL, "grow", 1)[0]["chunk"]
+
+
+def test_persisted_embeddings_of_another_model_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_FILE", str(tmp_path / "query_cache.pkl"))
+    embedding_cache.drop_where(lambda key: True)
+    get_query_embedding("printer error codes")
+    query_cache.save_query_cache()
+
+    embedding_cache.drop_where(lambda key: True)
+    query_cache.load_query_cache()
+    assert embedding_cache.stats()["entries"] == 1
+
+    embedding_cache.drop_where(lambda key: True)
+    monkeypatch.setattr(embedding, "EMBEDDING_BACKEND", "onnx-int8")
+    query_cache.load_query_cache()
+    assert embedding_cache.stats()["entries"] == 0
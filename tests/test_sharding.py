@@ -0,0 +1,54 @@
+"""Sharded segments: the per-shard results merge into the same top_k as one index."""
+import numpy as np
+
+from app.services import index_factory, segments, vectorstore
+from app.services.embedding import EMBEDDING_DIM
+from app.services.index_factory import build_index, build_shards, search_index
+from app.services.vectorstore import update_vectorstore, delete_from_vectorstore, get_faiss_results, run_parallel
+
+EMAIL = "user@example.com"
+
+
+def test_merged_shard_results_equal_one_index():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(1000, EMBEDDING_DIM)).astype("float32")
+    ids = np.arange(1000, dtype="int64") * 7   # ids unrelated to row numbers
+    queries = rng.normal(size=(20, EMBEDDING_DIM)).astype("float32")
+    shards = build_shards(vectors, ids, 4)
+
+    per_shard = run_parallel([lambda shard=shard: search_index(shard, queries, 10) for shard in shards])
+    distances, found = vectorstore._merge_top_k(per_shard, len(queries), 10)
+
+    expected_distances, expected = search_index(build_index("flat", vectors, ids), queries, 10)
+    assert [shard.ntotal for shard in shards] == [250] * 4
+    assert (found == expected).all()
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+
+def test_merge_pads_when_shards_have_fewer_than_top_k():
+    per_shard = [
+        (np.array([[0.5, np.inf]], dtype="float32"), np.array([[7, -1]])),
+        (np.array([[0.1, np.inf]], dtype="float32"), np.array([[3, -1]])),
+    ]
+
+    distances, found = vectorstore._merge_top_k(per_shard, 1, 3)
+
+    assert found.tolist() == [[3, 7, -1]]
+    assert distances[0, :2].tolist() == [np.float32(0.1), np.float32(0.5)]
+
+
+def test_sharded_store_returns_the_same_results(store, monkeypatch):
+    for doc_id in range(1, 7):
+        update_vectorstore(EMAIL, doc_id, " ".join(f"topic {doc_id} line {i} text." for i in range(200)))
+    delete_from_vectorstore(EMAIL, 4)
+    queries = ["topic 2 line 3", "topic 4 line 1", "line 7 text"]
+    expected = [get_faiss_results(EMAIL, query, 8) for query in queries]
+
+    monkeypatch.setattr(index_factory, "SHARD_COUNT", 3)
+    monkeypatch.setattr(index_factory, "SHARD_MIN_ROWS", 2)
+    segments.index_cache.clear()
+    vectorstore.result_cache.drop_where(lambda key: True)
+
+    assert all(len(segment.shards) == 3 for segment in vectorstore.get_user_index(EMAIL).segments)
+    for query, results in zip(queries, expected):
+        assert get_faiss_results(EMAIL, query, 8) == results
@@ -0,0 +1,55 @@
+"""The shared layout: one store for every user, searches limited to the caller's documents."""
+import pytest
+
+from app.services import vectorstore
+from app.services.vectorstore import update_vectorstore, delete_from_vectorstore, get_faiss_results, search_batch
+
+ALICE = "alice@example.com"
+BOB = "bob@example.com"
+TEXT = " ".join(f"printer error {i} means the paper tray is empty." for i in range(20))
+
+
+@pytest.fixture
+def shared(store, monkeypatch):
+    monkeypatch.setattr(vectorstore, "VECTORSTORE_LAYOUT", "shared")
+    monkeypatch.setattr(vectorstore, "SHARED_TENANTS", ())
+    # Alice and Bob upload the same text, so every search matches both equally well
+    update_vectorstore(ALICE, 1, TEXT)
+    update_vectorstore(BOB, 2, TEXT)
+    update_vectorstore(ALICE, 3, "warranty terms for the paper tray. " * 10)
+    return store
+
+
+def found_docs(email: str, query: str = "printer error paper tray", fusion: str = "dense") -> set:
+    return {r["doc_id"] for r in get_faiss_results(email, query, 50, fusion=fusion)}
+
+
+@pytest.mark.parametrize("fusion", ["dense", "rrf", "weighted"])
+@pytest.mark.parametrize("scan_rows", [10_000, 0])   # exact scan of the tenant's rows, or the index with a selector
+def test_users_only_find_their_own_documents(shared, monkeypatch, fusion, scan_rows):
+    monkeypatch.setattr(vectorstore, "SHARED_SCAN_ROWS", scan_rows)
+
+    assert found_docs(ALICE, fusion=fusion) == {1, 3}
+    assert found_docs(BOB, fusion=fusion) == {2}
+    assert found_docs("carol@example.com", fusion=fusion) == set()
+
+
+def test_batch_searches_are_limited_to_the_caller(shared):
+    for _, results in search_batch(BOB, ["printer error", "warranty terms"], 50):
+        assert {r["doc_id"] for r in results} <= {2}
+
+
+def test_users_cannot_delete_other_users_documents(shared):
+    delete_from_vectorstore(BOB, 1)
+    assert found_docs(ALICE) == {1, 3}
+
+    delete_from_vectorstore(ALICE, 1)
+    assert found_docs(ALICE) == {3}
+    assert found_docs(BOB) == {2}
+
+
+def test_shared_tenants_are_visible_to_everyone(shared, monkeypatch):
+    monkeypatch.setattr(vectorstore, "SHARED_TENANTS", (ALICE,))
+
+    assert found_docs(BOB) == {1, 2, 3}
+    assert vectorstore.store_emails(vectorstore.SHARED_STORE) == [ALICE, BOB]
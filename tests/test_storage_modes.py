@@ -0,0 +1,70 @@
+"""Compressed vector storage (float16, int8, binary) and the exact float32 re-rank."""
+import numpy as np
+import pytest
+
+from app.services import index_factory, segments, vectorstore
+from app.services.embedding import EMBEDDING_DIM
+from app.services.index_factory import build_index, search_index, index_storage, index_nbytes
+from app.services.vectorstore import update_vectorstore
+
+EMAIL = "user@example.com"
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, expected)]))
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """3000 unit vectors around 20 topics, and 50 queries close to the first 50 of them"""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, EMBEDDING_DIM))
+    vectors = centers[rng.integers(0, 20, 3000)] + 0.6 * rng.normal(size=(3000, EMBEDDING_DIM))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype("float32")
+    queries = (vectors[:50] + 0.05 * rng.normal(size=(50, EMBEDDING_DIM))).astype("float32")
+    distances = ((queries[:, None, :] - vectors[None]) ** 2).sum(axis=2)
+    return vectors, queries, np.argsort(distances, axis=1)[:, :10]
+
+
+def exact_lookup(vectors):
+    return lambda ids: (ids, vectors[ids])
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8"])
+def test_scalar_quantized_storage_keeps_recall_after_rerank(corpus, storage):
+    vectors, queries, expected = corpus
+    index = build_index("flat", vectors, np.arange(len(vectors), dtype="int64"), storage)
+
+    distances, ids = search_index(index, queries, 10, exact_vectors=exact_lookup(vectors))
+
+    assert index_storage(index) == storage
+    assert recall(ids, expected) >= 0.98
+    exact = ((vectors[ids[0]] - queries[0]) ** 2).sum(axis=1)
+    np.testing.assert_allclose(distances[0], exact, rtol=1e-5)   # re-ranked by float32 distance
+
+
+def test_binary_storage_is_smallest_and_rerank_recovers_recall(corpus):
+    vectors, queries, expected = corpus
+    ids = np.arange(len(vectors), dtype="int64")
+    indexes = {storage: build_index("flat", vectors, ids, storage) for storage in index_factory.STORAGE_TYPES}
+    binary = indexes["binary"]
+
+    _, coarse = search_index(binary, queries, 10)
+    _, reranked = search_index(binary, queries, 10, exact_vectors=exact_lookup(vectors))
+
+    sizes = [index_nbytes(indexes[storage]) for storage in ("float32", "float16", "int8", "binary")]
+    assert sizes == sorted(sizes, reverse=True)
+    assert recall(reranked, expected) > recall(coarse, expected)
+    assert (reranked[:, 0] == np.arange(50)).mean() >= 0.9   # the query's own source comes first
+
+
+def test_segments_are_reencoded_when_the_storage_mode_changes(store, monkeypatch):
+    update_vectorstore(EMAIL, 1, "printer error codes and paper trays. " * 20)
+    monkeypatch.setattr(index_factory, "VECTOR_STORAGE", "int8")
+    segments.index_cache.clear()
+
+    results = vectorstore.get_faiss_results(EMAIL, "printer error codes", 3)
+
+    segment = vectorstore.get_user_index(EMAIL).segments[0]
+    assert index_storage(segment.shards[0]) == "int8"
+    assert results and results[0]["doc_id"] == 1
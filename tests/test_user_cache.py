@@ -0,0 +1,75 @@
+"""Cached user lookups: by id and by email, shared by the sync and async paths."""
+import asyncio
+
+import pytest
+
+from app.auth import utils as auth_utils
+from app.auth.utils import get_user, get_user_async, get_user_cache_stats
+from app.database import SessionLocal, init_db
+from app.models import User
+
+EMAIL = "cached@example.com"
+
+
+@pytest.fixture
+def user_id():
+    init_db()
+    auth_utils._users.drop_where(lambda key: True)
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.email == EMAIL).first()
+        if user is None:
+            user = User(email=EMAIL, password="-")
+            db.add(user)
+            db.commit()
+        yield user.user_id
+    auth_utils._users.drop_where(lambda key: True)
+
+
+def rename(user_id: int, email: str):
+    """Change the email behind the cache's back"""
+    with SessionLocal() as db:
+        db.query(User).filter(User.user_id == user_id).update({"email": email})
+        db.commit()
+
+
+def test_a_lookup_caches_the_user_by_id_and_by_email(user_id):
+    user = get_user(str(user_id))   # the cookie value
+    misses = get_user_cache_stats()["misses"]
+
+    rename(user_id, "renamed-" + EMAIL)
+    try:
+        assert get_user(user_id) == user == (user_id, EMAIL)
+        assert get_user(email=EMAIL) == user
+        assert asyncio.run(get_user_async(user_id)) == user
+        assert get_user_cache_stats()["misses"] == misses
+    finally:
+        rename(user_id, EMAIL)
+
+
+def test_entries_expire(user_id, monkeypatch):
+    monkeypatch.setattr(auth_utils._users, "ttl", -1)   # expired as soon as they are stored
+    get_user(user_id)
+
+    rename(user_id, "renamed-" + EMAIL)
+    try:
+        assert get_user(user_id).email == "renamed-" + EMAIL
+        assert asyncio.run(get_user_async(user_id)).email == "renamed-" + EMAIL
+    finally:
+        rename(user_id, EMAIL)
+
+
+def test_unknown_users_are_not_cached(user_id):
+    email = "later-" + EMAIL
+    assert get_user(email=email) is None
+
+    with SessionLocal() as db:
+        db.add(User(email=email, password="-"))
+        db.commit()
+
+    assert get_user(email=email).email == email
+
+
+@pytest.mark.parametrize("cookie", [None, "", "abc", "1.5"])
+def test_malformed_cookies_are_logged_out(user_id, cookie):
+    assert get_user(cookie) is None
+    assert asyncio.run(get_user_async(cookie)) is None
@@ -0,0 +1,209 @@
+"""Segmented vector store: writes, tombstones, merges, the legacy layout and the cached index."""
+import fcntl
+import os
+import pickle
+import subprocess
+import threading
+import time
+
+import faiss
+
+from app.services import segments, vectorstore
+from app.services.chunk_table import ChunkTable
+from app.services.query_cache import result_cache
+from app.services.embedding import get_embeddings, EMBEDDING_DIM
+from app.services.vectorstore import update_vectorstore, delete_from_vectorstore, get_faiss_results
+
+EMAIL = "user@example.com"
+
+
+def document(topic: str, sentences: int = 20) -> str:
+    return " ".join(f"{topic} sentence {i} about {topic} things." for i in range(sentences))
+
+
+def search(query: str, top_k: int = 10, fusion: str = "dense") -> list:
+    return get_faiss_results(EMAIL, query, top_k, fusion=fusion)
+
+
+def found_docs(query: str, top_k: int = 10) -> set:
+    return {result["doc_id"] for result in search(query, top_k)}
+
+
+def test_upload_search_delete_and_reupload(store):
+    update_vectorstore(EMAIL, 1, document("apples"))
+    update_vectorstore(EMAIL, 2, document("pears"))
+    assert search("apples things")[0]["doc_id"] == 1
+
+    delete_from_vectorstore(EMAIL, 1)
+    assert found_docs("apples things") == {2}
+
+    # Same doc_id, new content: the old chunks stay tombstoned
+    update_vectorstore(EMAIL, 1, document("plums"))
+    results = search("apples plums pears", top_k=50)
+    assert {r["doc_id"] for r in results} == {1, 2}
+    assert not any("apples" in r["chunk"] for r in results)
+    assert search("plums things")[0]["doc_id"] == 1
+
+
+def test_reupload_hides_the_previous_version(store):
+    update_vectorstore(EMAIL, 1, document("apples"))
+    update_vectorstore(EMAIL, 1, document("plums"))
+
+    manifest = segments.read_manifest(EMAIL)
+    assert [list(entry["deleted"]) for entry in manifest["segments"]] == [[1], []]
+    assert not any("apples" in r["chunk"] for r in search("apples", top_k=50))
+
+
+def test_merge_keeps_tombstones(store, monkeypatch):
+    monkeypatch.setattr(segments, "MERGE_FACTOR", 4)
+    monkeypatch.setattr(segments, "MERGE_DELETED_RATIO", 2.0)  # no single-segment rewrites
+    for doc_id, topic in enumerate(("apples", "pears", "plums", "figs"), start=1):
+        update_vectorstore(EMAIL, doc_id, document(topic))
+    delete_from_vectorstore(EMAIL, 2)
+
+    # Doc 3 is deleted while the merged segment is being built (without the store lock)
+    write_segment_files = segments.write_segment_files
+
+    def delete_during_merge(folder, chunk_table):
+        delete_from_vectorstore(EMAIL, 3)
+        return write_segment_files(folder, chunk_table)
+
+    monkeypatch.setattr(segments, "write_segment_files", delete_during_merge)
+    assert segments._merge_once(EMAIL)
+
+    manifest = segments.read_manifest(EMAIL)
+    assert len(manifest["segments"]) == 1
+    name = manifest["segments"][0]["name"]
+    merged = ChunkTable(segments.segment_folder(EMAIL, name), EMBEDDING_DIM)
+    assert sorted(merged.doc_rows) == [1, 3, 4]        # doc 2 was dropped
+    assert list(manifest["segments"][0]["deleted"]) == [3]
+    assert found_docs("apples pears plums figs", top_k=100) == {1, 4}
+    assert os.listdir(os.path.join("data/vectordb", EMAIL, "segments")) == [name]
+
+
+def test_failed_merges_are_counted_and_leave_the_store_as_it_was(store, monkeypatch):
+    monkeypatch.setattr(segments, "MERGE_FACTOR", 2)
+    for doc_id, topic in enumerate(("apples", "pears"), start=1):
+        update_vectorstore(EMAIL, doc_id, document(topic))
+    before = segments.read_manifest(EMAIL)
+
+    def fail(folder, chunk_table):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(segments, "write_segment_files", fail)
+    failed = segments.segment_merges["failed"].value
+    segments._run_merges(EMAIL)
+
+    assert segments.segment_merges["failed"].value == failed + 1
+    assert segments.read_manifest(EMAIL) == before
+    assert found_docs("apples pears") == {1, 2}
+    assert len(os.listdir(os.path.join("data/vectordb", EMAIL, "segments"))) == 2
+
+
+def test_legacy_index_and_pickle_are_migrated(store):
+    folder = os.path.join("data/vectordb", EMAIL)
+    os.makedirs(folder)
+    all_chunks = {
+        7: [f"apples sentence {i} about apples." for i in range(3)],
+        9: [f"pears sentence {i} about pears." for i in range(2)],
+    }
+    index = faiss.IndexFlatL2(EMBEDDING_DIM)  # no ids: vectors were added in dict order
+    for chunks in all_chunks.values():
+        index.add(get_embeddings(chunks))
+    faiss.write_index(index, os.path.join(folder, "vectordb.index"))
+    with open(os.path.join(folder, "chunks.pkl"), "wb") as f:
+        pickle.dump(all_chunks, f)
+
+    results = search("pears sentence 1 about pears.", top_k=5)
+
+    assert results[0]["doc_id"] == 9 and results[0]["chunk"] == "pears sentence 1 about pears."
+    assert {r["doc_id"] for r in results} == {7, 9}
+    assert segments.read_manifest(EMAIL)["segments"][0]["rows"] == 5
+    assert not os.path.exists(os.path.join(folder, "vectordb.index"))
+    assert not os.path.exists(os.path.join(folder, "chunks.pkl"))
+
+    delete_from_vectorstore(EMAIL, 7)
+    assert found_docs("apples pears") == {9}
+
+
+def test_hybrid_search_ranks_exact_identifiers_first(store):
+    update_vectorstore(EMAIL, 1, document("printer"))
+    update_vectorstore(EMAIL, 2, "The printer shows ERR-4242 when the tray is empty. " + document("printer", 2))
+
+    for fusion in ("rrf", "weighted"):
+        results = search("ERR-4242", top_k=5, fusion=fusion)
+        assert results[0]["doc_id"] == 2 and "ERR-4242" in results[0]["chunk"]
+        scores = [r["score"] for r in results]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_writes_when_the_cached_index_is_behind_the_manifest(store):
+    update_vectorstore(EMAIL, 1, document("apples"))
+    stale = segments.index_cache.get(EMAIL)
+
+    # Another process commits: a new document and a tombstone this cache doesn't know about
+    update_vectorstore(EMAIL, 2, document("pears"))
+    delete_from_vectorstore(EMAIL, 1)
+    segments.index_cache.put(EMAIL, stale, stale.nbytes())
+
+    update_vectorstore(EMAIL, 3, document("plums"))
+    delete_from_vectorstore(EMAIL, 2)
+
+    user_index = vectorstore.get_user_index(EMAIL)
+    assert user_index.version == segments.read_version(EMAIL)
+    assert [user_index.has_document(doc_id) for doc_id in (1, 2, 3)] == [False, False, True]
+    assert found_docs("apples pears plums") == {3}
+
+
+def test_searches_see_commits_by_another_process(store):
+    update_vectorstore(EMAIL, 1, document("apples"))
+    assert found_docs("apples") == {1}
+    stale = segments.index_cache.get(EMAIL)
+
+    update_vectorstore(EMAIL, 2, document("pears"))
+    delete_from_vectorstore(EMAIL, 1)
+    segments.index_cache.put(EMAIL, stale, stale.nbytes())
+    result_cache.drop_where(lambda key: True)
+
+    assert found_docs("apples pears") == {2}
+    assert segments.index_cache.get(EMAIL).version == segments.read_version(EMAIL)
+
+
+def test_commits_wait_for_another_process_holding_the_store_lock(store):
+    update_vectorstore(EMAIL, 1, document("apples"))
+    deleting = threading.Thread(target=delete_from_vectorstore, args=(EMAIL, 1))
+
+    # flock locks belong to the open file, so a second open of the lock file stands in for another process
+    os.makedirs(segments.LOCKS_DIR, exist_ok=True)
+    with open(os.path.join(segments.LOCKS_DIR, f"{EMAIL}.lock"), "a") as other:
+        fcntl.flock(other, fcntl.LOCK_EX)
+        deleting.start()
+        deleting.join(0.3)
+        assert deleting.is_alive()
+    deleting.join(5)
+
+    assert found_docs("apples") == set()
+
+
+def test_only_abandoned_segment_folders_are_removed(store):
+    update_vectorstore(EMAIL, 1, document("apples"))
+    segments_folder = os.path.join("data/vectordb", EMAIL, "segments")
+    finished = subprocess.Popen(["true"])
+    finished.wait()
+    folders = {
+        "writing": f".tmp-{os.getppid()}-abcd-0001",         # another worker, still running
+        "crashed": f".tmp-{finished.pid}-abcd-0002",
+        "stuck": f".tmp-{os.getppid()}-abcd-0003",           # live pid (reused?), untouched for too long
+        "merged": "seg-00000099",
+    }
+    for name in folders.values():
+        os.makedirs(os.path.join(segments_folder, name))
+    old = time.time() - segments.ORPHAN_TMP_MAX_AGE - 60
+    os.utime(os.path.join(segments_folder, folders["stuck"]), (old, old))
+
+    segments.index_cache.clear()
+    assert found_docs("apples") == {1}
+
+    left = set(os.listdir(segments_folder))
+    assert folders["writing"] in left
+    assert not left & {folders["crashed"], folders["stuck"], folders["merged"]}